@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Đo latency đọc / ghi của cache đĩa (service/disk_cache.py, SQLite) so với predict thật của model.
+
+Ghi sẵn --entries giá (key sinh từ metadata.json, mileage ngẫu nhiên) vào 1 file SQLite tạm, rồi đo:
+- get_many 1 key (hit / miss) và nhiều key (hit) so với FastPredictor (booster native) predict
+  cùng số dòng; cache RAM (service/cache.py) để tham chiếu
+- ghi: put_many + chờ thread ghi xong (flush)
+
+Chạy từ thư mục car-valuation-service:
+    python benchmarks/bench_disk_cache.py
+    python benchmarks/bench_disk_cache.py --entries 1000000 --sizes 1,64,1024 --path /data/cache.sqlite3
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+sys.path.insert(0, str(BASE_DIR / "benchmarks"))
+
+from load_test import METADATA_PATH, RequestMix
+from service.cache import PredictionCache
+from service.disk_cache import DiskCache
+from service.fast_encoder import FastPredictor
+from service.model_loader import ENCODER_SPEC_PATH, FEATURE_COLUMNS
+
+DEFAULT_SIZES = "1,64,1024"
+VERSION = "bench"
+
+
+def make_key(car: dict) -> tuple:
+    """CarInput dict -> key cache giống _cache_key của service"""
+    row = {
+        "make": car["brand"], "model": car["model"], "year": car["year"],
+        "version": car.get("version") or "Unknown", "color": car.get("color") or "Unknown",
+        "mileage": car["mileage_km"],
+    }
+    return tuple(row[column] for column in FEATURE_COLUMNS)
+
+
+def timeit(fn, min_time, min_repeats, max_repeats):
+    timings = []
+    total = 0.0
+    while len(timings) < max_repeats and (len(timings) < min_repeats or total < min_time):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        timings.append(elapsed)
+        total += elapsed
+    timings.sort()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=200_000, help="Số entry ghi sẵn vào cache")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Số key mỗi lần tra, phân cách bằng dấu phẩy")
+    parser.add_argument("--path", type=Path, help="File SQLite (mặc định file tạm, xoá sau khi chạy)")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Thời gian đo tối thiểu mỗi ô (giây)")
+    parser.add_argument("--min-repeats", type=int, default=5)
+    parser.add_argument("--max-repeats", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    print("=" * 60)
+    print("BENCHMARK CACHE ĐĨA (SQLite) vs PREDICT")
+    print("=" * 60)
+    with open(METADATA_PATH, "r", encoding="utf-8") as f:
+        mix = RequestMix(json.load(f), {"predict": 1}, 1, 1, 0.0, args.seed)
+    rng = random.Random(args.seed)
+    keys = list({make_key(mix.car()) for _ in range(args.entries)})
+    missing = [key[:-1] + (-1 - i,) for i, key in enumerate(keys[:max(sizes)])]
+
+    tmpdir = None
+    if args.path is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        args.path = Path(tmpdir.name) / "cache.sqlite3"
+    cache = DiskCache(args.path, max_entries=len(keys))
+    cache.bind_model(VERSION)
+
+    # 1. Ghi
+    print(f"\n1️⃣ Ghi {len(keys):,} entry vào {args.path}:")
+    start = time.perf_counter()
+    for i in range(0, len(keys), 1000):
+        cache.put_many(keys[i:i + 1000], [rng.uniform(100, 2000) for _ in keys[i:i + 1000]], VERSION)
+    cache.flush()
+    write_seconds = time.perf_counter() - start
+    print(f"   {write_seconds:.2f} s ({len(keys) / write_seconds:,.0f} entry/s), "
+          f"file {args.path.stat().st_size / 1e6:.1f} MB")
+
+    memory = PredictionCache(len(keys))
+    memory.bind_model(VERSION)
+    for key in keys:
+        memory.put(key, 1.0, VERSION)
+    predictor = FastPredictor.load(ENCODER_SPEC_PATH)
+
+    # 2. Đọc
+    print(f"\n2️⃣ Thời gian mỗi lần gọi (p50 / p99):")
+    print(f"   {'số key':>7} {'đĩa hit':>20} {'đĩa miss':>20} {'RAM hit':>20} {'predict':>20}")
+    results = []
+    for size in sizes:
+        def sample():
+            start = rng.randrange(len(keys) - size)
+            return keys[start:start + size]
+
+        calls = {
+            "disk_hit": lambda: cache.get_many(sample(), VERSION),
+            "disk_miss": lambda: cache.get_many(missing[:size], VERSION),
+            "memory_hit": lambda: [memory.get(key) for key in sample()],
+            "predict": lambda: predictor.predict_rows([dict(zip(FEATURE_COLUMNS, key)) for key in sample()]),
+        }
+        assert all(price is not None for price in calls["disk_hit"]())
+        entry = {"keys": size}
+        for name, fn in calls.items():
+            fn()
+            timings = timeit(fn, args.min_time, args.min_repeats, args.max_repeats)
+            entry[name] = {
+                "p50_us": round(statistics.median(timings) * 1e6, 1),
+                "p99_us": round(timings[max(0, int(len(timings) * 0.99) - 1)] * 1e6, 1),
+                "repeats": len(timings),
+            }
+        results.append(entry)
+        print(f"   {size:>7} " + " ".join(
+            f"{entry[name]['p50_us']:>9.1f} / {entry[name]['p99_us']:>6.0f}µs" for name in calls
+        ))
+
+    print("\n3️⃣ Tỉ lệ p50 predict / đọc cache đĩa (hit):")
+    for entry in results:
+        print(f"   {entry['keys']:>7} key: {entry['predict']['p50_us'] / entry['disk_hit']['p50_us']:.1f}x")
+
+    cache.close()
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"entries": len(keys), "write_seconds": round(write_seconds, 3), "reads": results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Đã lưu kết quả: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Đo latency cộng thêm của /predict/explain (TreeSHAP) so với /predict thường, qua HTTP.
+
+Tự chạy service trên localhost (như load_test.py), gửi tuần tự trên 1 kết nối keep-alive:
+- batch 1: /predict vs /predict/explain; batch > 1: /predict/batch vs /predict/explain/batch
+- "miss": mỗi request là xe mới (mileage ngẫu nhiên) -> luôn tính TreeSHAP / predict thật
+- "hit": gửi lại đúng 1 body -> kết quả lấy từ cache giải thích
+
+Chạy từ thư mục car-valuation-service (cần httpx):
+    python benchmarks/bench_explain.py
+    python benchmarks/bench_explain.py --sizes 1,16 --env INFERENCE_BACKEND=lean
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+sys.path.insert(0, str(BASE_DIR / "benchmarks"))
+
+import httpx
+
+from load_test import METADATA_PATH, RESULTS_DIR, RequestMix, start_server, stop_server
+
+DEFAULT_SIZES = "1,8,64"
+
+
+def measure(send, min_time, min_repeats, max_repeats):
+    timings = []
+    total = 0.0
+    while len(timings) < max_repeats and (len(timings) < min_repeats or total < min_time):
+        start = time.perf_counter()
+        send()
+        elapsed = time.perf_counter() - start
+        timings.append(elapsed)
+        total += elapsed
+    timings.sort()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Các batch size, phân cách bằng dấu phẩy")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Biến môi trường cho service")
+    parser.add_argument("--min-time", type=float, default=2.0, help="Thời gian đo tối thiểu mỗi ô (giây)")
+    parser.add_argument("--min-repeats", type=int, default=5)
+    parser.add_argument("--max-repeats", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    env = {"EXPLAIN_MAX_BATCH_SIZE": str(max(sizes)), **dict(e.split("=", 1) for e in args.env)}
+    with open(METADATA_PATH, "r", encoding="utf-8") as f:
+        mix = RequestMix(json.load(f), {"predict": 1}, 1, 1, 0.05, args.seed)
+
+    print("=" * 60)
+    print("BENCHMARK /predict vs /predict/explain (TreeSHAP)")
+    print("=" * 60)
+    process, base_url = start_server(env, RESULTS_DIR / "bench_explain.server.log")
+    results = []
+    try:
+        with httpx.Client(base_url=base_url, timeout=120) as client:
+            print(f"\n{'batch':>6} {'đường':<14} {'p50':>10} {'p99':>10} {'ms/xe':>8}")
+            for size in sizes:
+                predict_path, explain_path = ("/predict", "/predict/explain") if size == 1 else (
+                    "/predict/batch", "/predict/explain/batch")
+
+                def body(cars):
+                    return cars[0] if size == 1 else cars
+
+                def post(path, cars):
+                    response = client.post(path, json=body(cars))
+                    response.raise_for_status()
+                    return response
+
+                fixed = [mix.car() for _ in range(size)]
+                post(explain_path, fixed)  # đưa vào cache cho "explain_hit"
+                calls = {
+                    "predict": lambda: post(predict_path, [mix.car() for _ in range(size)]),
+                    "explain_miss": lambda: post(explain_path, [mix.car() for _ in range(size)]),
+                    "explain_hit": lambda: post(explain_path, fixed),
+                }
+                entry = {"batch_size": size}
+                for name, send in calls.items():
+                    timings = measure(send, args.min_time, args.min_repeats, args.max_repeats)
+                    p50 = statistics.median(timings)
+                    p99 = timings[max(0, int(len(timings) * 0.99) - 1)]
+                    entry[name] = {"p50_ms": round(p50 * 1e3, 3), "p99_ms": round(p99 * 1e3, 3),
+                                   "repeats": len(timings)}
+                    print(f"{size:>6} {name:<14} {p50 * 1e3:>8.2f}ms {p99 * 1e3:>8.2f}ms {p50 * 1e3 / size:>8.2f}")
+                added = entry["explain_miss"]["p50_ms"] - entry["predict"]["p50_ms"]
+                print(f"{'':>6} -> TreeSHAP cộng thêm {added:.1f} ms (p50), {added / size:.1f} ms/xe")
+                results.append(entry)
+    finally:
+        stop_server(process)
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"env": env, "batches": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Đã lưu kết quả: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
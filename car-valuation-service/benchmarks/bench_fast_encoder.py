@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark fast-path encoder so với Pipeline gốc cho inference 1 dòng.
+
+Chạy từ thư mục car-valuation-service:
+    python benchmarks/bench_fast_encoder.py [--iterations 2000]
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from service.fast_encoder import FastPredictor, sample_rows
+
+MODEL_PATH = BASE_DIR / "models" / "best_car_price_pipeline.pkl"
+
+
+def measure(fn, rows, iterations):
+    """Trả về danh sách latency (micro giây) cho từng lần gọi"""
+    timings = []
+    for i in range(iterations):
+        row = rows[i % len(rows)]
+        start = time.perf_counter()
+        fn(row)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return timings
+
+
+def summarize(name, timings):
+    timings = sorted(timings)
+    p50 = statistics.median(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(f"   {name:<28} p50={p50:9.1f} µs   p99={p99:9.1f} µs")
+    return p50
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("BENCHMARK FAST-PATH ENCODER (1 DÒNG)")
+    print("=" * 60)
+
+    pipeline = joblib.load(MODEL_PATH)
+    predictor = FastPredictor.from_pipeline(pipeline)
+    rows = sample_rows(predictor.encoder)
+
+    # 1. Parity: feature và giá phải giống hệt Pipeline
+    predictor.verify_against(pipeline, rows)
+    print(f"\n1️⃣ Parity: ✅ bit-identical trên {len(rows)} dòng mẫu")
+
+    def pipeline_predict(row):
+        return float(pipeline.predict(pd.DataFrame([row]))[0])
+
+    # Warmup
+    for row in rows:
+        pipeline_predict(row)
+        predictor.predict_one(row)
+
+    print(f"\n2️⃣ Latency ({args.iterations} lần gọi):")
+    base_p50 = summarize("Pipeline (DataFrame)", measure(pipeline_predict, rows, args.iterations))
+    encode_p50 = summarize("Fast encoder (encode only)", measure(predictor.encoder.encode_one, rows, args.iterations))
+    fast_p50 = summarize("Fast path (encode+predict)", measure(predictor.predict_one, rows, args.iterations))
+
+    print(f"\n3️⃣ Giảm p50: {base_p50 / fast_p50:.1f}x "
+          f"({base_p50:.0f} µs -> {fast_p50:.0f} µs, encode chiếm {encode_p50:.1f} µs)")
+    assert np.isfinite(fast_p50)
+
+
+if __name__ == "__main__":
+    main()
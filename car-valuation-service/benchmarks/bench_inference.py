@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark từng bước inference của Pipeline theo kích thước batch (không qua HTTP).
+
+Đo cho mỗi batch size: dựng pd.DataFrame, ColumnTransformer.transform, XGBRegressor.predict trên
+ma trận đã transform, Pipeline.predict end-to-end và fast path (encode + inplace_predict) để so sánh.
+Kèm thời gian import / load model và RAM (RSS) tăng thêm sau mỗi bước load.
+
+Chạy từ thư mục car-valuation-service:
+    python benchmarks/bench_inference.py
+    python benchmarks/bench_inference.py --sizes 1,64,1024 --nthread 1 --output /tmp/inference.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+import numpy as np
+
+from service.model_loader import ENCODER_SPEC_PATH, FEATURE_COLUMNS, MODEL_PATH
+
+DEFAULT_SIZES = "1,8,64,1024,65536"
+STAGES = ("dataframe", "transform", "predict", "pipeline", "fast_path")
+
+
+def rss_mb() -> float:
+    """RSS hiện tại của process (MB); ngoài Linux dùng RSS đỉnh"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def load_phase(name, fn, report):
+    """Chạy fn, ghi thời gian + RSS tăng thêm vào report[name]"""
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    report[name] = {"seconds": round(seconds, 3), "rss_delta_mb": round(rss_mb() - rss_before, 1)}
+    print(f"   {name:<28} {seconds:8.3f} s   RSS +{report[name]['rss_delta_mb']:.1f} MB")
+    return result
+
+
+def make_rows(pool, size, rng):
+    """size dòng lấy ngẫu nhiên từ pool dòng mẫu, year / mileage ngẫu nhiên"""
+    rows = []
+    for _ in range(size):
+        row = dict(rng.choice(pool))
+        row["year"] = rng.randint(2005, 2025)
+        row["mileage"] = rng.randint(0, 300_000)
+        rows.append(row)
+    return rows
+
+
+def timeit(fn, min_time, min_repeats, max_repeats):
+    """Gọi fn tới khi đủ min_time giây (ít nhất min_repeats lần); trả về list thời gian mỗi lần (giây)"""
+    timings = []
+    total = 0.0
+    while len(timings) < max_repeats and (len(timings) < min_repeats or total < min_time):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        timings.append(elapsed)
+        total += elapsed
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Các batch size, phân cách bằng dấu phẩy")
+    parser.add_argument("--nthread", type=int, default=None,
+                        help="Số thread XGBoost (mặc định giữ nguyên cấu hình của model)")
+    parser.add_argument("--min-time", type=float, default=0.5, help="Thời gian đo tối thiểu mỗi ô (giây)")
+    parser.add_argument("--min-repeats", type=int, default=3)
+    parser.add_argument("--max-repeats", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    print("=" * 60)
+    print("MICRO-BENCHMARK INFERENCE (DataFrame / transform / predict)")
+    print("=" * 60)
+
+    # 1. Load: đo trước mọi import nặng khác để thời gian + RSS phản ánh đúng từng pha
+    print(f"\n1️⃣ Load model (RSS ban đầu {rss_mb():.1f} MB):")
+    load_report = {}
+
+    def import_libs():
+        import joblib  # noqa: F401
+        import pandas  # noqa: F401
+        import sklearn.pipeline  # noqa: F401
+        import xgboost  # noqa: F401
+
+    load_phase("import_libs", import_libs, load_report)
+    import joblib
+    import pandas as pd
+
+    from service.fast_encoder import FastPredictor, sample_rows
+
+    pipeline = load_phase("joblib_load_pipeline", lambda: joblib.load(MODEL_PATH), load_report)
+    lean = None
+    if ENCODER_SPEC_PATH.exists():
+        lean = load_phase("load_lean_booster", lambda: FastPredictor.load(ENCODER_SPEC_PATH), load_report)
+    fast = load_phase("compile_fast_encoder", lambda: FastPredictor.from_pipeline(pipeline), load_report)
+    load_report["artifact_mb"] = {"pipeline_pkl": round(MODEL_PATH.stat().st_size / 1e6, 2)}
+    if lean is not None:
+        load_report["artifact_mb"]["booster"] = round(lean.booster_path.stat().st_size / 1e6, 2)
+    load_report["rss_after_load_mb"] = round(rss_mb(), 1)
+    print(f"   Artifact: {', '.join(f'{k} {v} MB' for k, v in load_report['artifact_mb'].items())}; "
+          f"RSS sau load {load_report['rss_after_load_mb']} MB")
+    del lean
+
+    preprocessor = pipeline.named_steps["preprocessor"]
+    regressor = pipeline.named_steps["regressor"]
+    if args.nthread is not None:
+        regressor.set_params(n_jobs=args.nthread)
+        fast.booster.set_param({"nthread": args.nthread})
+
+    # 2. Theo batch size
+    rng = random.Random(args.seed)
+    pool = sample_rows(fast.encoder)
+    print(f"\n2️⃣ Thời gian mỗi lần gọi (median), {regressor.n_jobs or 'mặc định'} thread XGBoost:")
+    print(f"   {'batch':>6} " + " ".join(f"{stage:>14}" for stage in STAGES) + "   µs/dòng (pipeline)")
+    results = []
+    for size in sizes:
+        rows = make_rows(pool, size, rng)
+        frame = pd.DataFrame(rows, columns=FEATURE_COLUMNS)
+        features = preprocessor.transform(frame)
+        assert np.array_equal(fast.predict_rows(rows), pipeline.predict(frame))
+        calls = {
+            "dataframe": lambda: pd.DataFrame(rows, columns=FEATURE_COLUMNS),
+            "transform": lambda: preprocessor.transform(frame),
+            "predict": lambda: regressor.predict(features),
+            "pipeline": lambda: pipeline.predict(pd.DataFrame(rows, columns=FEATURE_COLUMNS)),
+            "fast_path": lambda: fast.predict_rows(rows),
+        }
+        entry = {"batch_size": size, "stages": {}}
+        for stage, fn in calls.items():
+            fn()  # warmup
+            timings = timeit(fn, args.min_time, args.min_repeats, args.max_repeats)
+            median = statistics.median(timings)
+            entry["stages"][stage] = {
+                "median_ms": round(median * 1e3, 4),
+                "min_ms": round(min(timings) * 1e3, 4),
+                "us_per_row": round(median * 1e6 / size, 3),
+                "rows_per_second": round(size / median),
+                "repeats": len(timings),
+            }
+        results.append(entry)
+        stages = entry["stages"]
+        print(f"   {size:>6} " + " ".join(f"{stages[stage]['median_ms']:>11.3f} ms" for stage in STAGES)
+              + f"   {stages['pipeline']['us_per_row']:>10.2f}")
+
+    # 3. Tỉ trọng từng bước trong Pipeline.predict
+    print("\n3️⃣ Tỉ trọng DataFrame / transform / predict:")
+    for entry in results:
+        stages = entry["stages"]
+        parts = [stages[stage]["median_ms"] for stage in ("dataframe", "transform", "predict")]
+        total = sum(parts)
+        print(f"   batch {entry['batch_size']:>6}: " + " / ".join(f"{part / total:5.1%}" for part in parts)
+              + f"   (fast path nhanh hơn Pipeline {stages['pipeline']['median_ms'] / stages['fast_path']['median_ms']:.1f}x)")
+
+    if args.output:
+        report = {
+            "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+            "nthread": args.nthread,
+            "load": load_report,
+            "batches": results,
+        }
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Đã lưu kết quả: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
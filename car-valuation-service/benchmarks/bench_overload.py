@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Đo hành vi của service khi quá tải: /predict (cache miss) open loop với tốc độ vượt khả năng xử lý,
+trong lúc 1 client riêng gọi /health đều đặn (như health check của Render).
+
+Mỗi kịch bản tự chạy service trên localhost (như load_test.py):
+- "không giới hạn": MAX_IN_FLIGHT=0, mọi request xếp hàng trong thread pool
+- "admission": MAX_IN_FLIGHT mặc định (hoặc --env MAX_IN_FLIGHT=...), vượt ngưỡng trả 503 ngay
+Client timeout sau --timeout giây và gửi X-Request-Timeout-Ms tương ứng để service bỏ việc của
+request client đã bỏ. Báo cáo: phân bố status, latency của request 200, latency /health.
+
+Chạy từ thư mục car-valuation-service (cần httpx):
+    python benchmarks/bench_overload.py
+    python benchmarks/bench_overload.py --rate 150 --env MAX_IN_FLIGHT=16 --env PREDICTION_CACHE_SIZE=0
+"""
+import argparse
+import asyncio
+import json
+import sys
+from collections import Counter
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+sys.path.insert(0, str(BASE_DIR / "benchmarks"))
+
+import httpx
+
+from load_test import METADATA_PATH, RESULTS_DIR, RequestMix, start_server, stop_server
+
+SCENARIOS = {"không giới hạn": {"MAX_IN_FLIGHT": "0"}, "admission": {}}
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+async def run_overload(base_url, mix, rate, duration, timeout, health_interval):
+    loop = asyncio.get_running_loop()
+    predict_samples, health_samples = [], []
+    headers = {"X-Request-Timeout-Ms": str(int(timeout * 1000))}
+    limits = httpx.Limits(max_connections=2000, max_keepalive_connections=2000)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client, \
+            httpx.AsyncClient(base_url=base_url, timeout=30) as health_client:
+        async def send(body):
+            start = loop.time()
+            try:
+                # Timeout tính trên cả request (timeout của httpx chỉ áp cho từng pha connect / read...)
+                response = await asyncio.wait_for(client.post("/predict", json=body, headers=headers), timeout)
+                status = response.status_code
+            except asyncio.TimeoutError:
+                status = "Timeout"
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            predict_samples.append((loop.time() - start, status))
+
+        async def probe_health(stop_at):
+            while loop.time() < stop_at:
+                start = loop.time()
+                try:
+                    status = (await health_client.get("/health")).status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                health_samples.append((loop.time() - start, status))
+                await asyncio.sleep(health_interval)
+
+        stop_at = loop.time() + duration
+        prober = asyncio.create_task(probe_health(stop_at))
+        tasks = set()
+        scheduled = loop.time()
+        while scheduled < stop_at:
+            delay = scheduled - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.create_task(send(mix.car()))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            scheduled += mix.rng.expovariate(rate)
+        await asyncio.gather(*tasks)
+        await prober
+    return predict_samples, health_samples
+
+
+def summarize(predict_samples, health_samples, duration):
+    statuses = Counter(str(status) for _, status in predict_samples)
+    ok = sorted(latency for latency, status in predict_samples if status == 200)
+    rejected = sorted(latency for latency, status in predict_samples if status == 503)
+    health = sorted(latency for latency, _ in health_samples)
+    return {
+        "requests": len(predict_samples),
+        "statuses": dict(statuses),
+        "goodput_rps": round(len(ok) / duration, 1),
+        "ok_p50_ms": round(_percentile(ok, 0.5) * 1e3, 1),
+        "ok_p99_ms": round(_percentile(ok, 0.99) * 1e3, 1),
+        "rejected_p99_ms": round(_percentile(rejected, 0.99) * 1e3, 1),
+        "health_probes": len(health_samples),
+        "health_failed": sum(1 for _, status in health_samples if status != 200),
+        "health_p50_ms": round(_percentile(health, 0.5) * 1e3, 1),
+        "health_max_ms": round(health[-1] * 1e3, 1) if health else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=80, help="req/s /predict (nên vượt khả năng xử lý)")
+    parser.add_argument("--duration", type=float, default=15, help="Số giây gửi tải mỗi kịch bản")
+    parser.add_argument("--timeout", type=float, default=2.0, help="Timeout của client (giây)")
+    parser.add_argument("--health-interval", type=float, default=0.2, help="Chu kỳ gọi /health (giây)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Biến môi trường cho service (mọi kịch bản)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+    env = dict(e.split("=", 1) for e in args.env)
+
+    print("=" * 60)
+    print(f"BENCHMARK QUÁ TẢI: /predict {args.rate:.0f} req/s trong {args.duration:.0f}s, timeout {args.timeout}s")
+    print("=" * 60)
+    results = {}
+    for name, overrides in SCENARIOS.items():
+        with open(METADATA_PATH, "r", encoding="utf-8") as f:
+            mix = RequestMix(json.load(f), {"predict": 1}, 1, 1, 0.0, args.seed)
+        process, base_url = start_server({**env, **overrides}, RESULTS_DIR / "bench_overload.server.log")
+        try:
+            samples = asyncio.run(run_overload(
+                base_url, mix, args.rate, args.duration, args.timeout, args.health_interval
+            ))
+        finally:
+            stop_server(process)
+        result = results[name] = summarize(*samples, args.duration)
+        print(f"\n📊 {name}:")
+        print(f"   /predict: {result['requests']} request, status {result['statuses']}")
+        print(f"   goodput {result['goodput_rps']} req/s, 200 p50 {result['ok_p50_ms']} ms / p99 {result['ok_p99_ms']} ms, "
+              f"503 p99 {result['rejected_p99_ms']} ms")
+        print(f"   /health: {result['health_probes']} lần, lỗi {result['health_failed']}, "
+              f"p50 {result['health_p50_ms']} ms / max {result['health_max_ms']} ms")
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"rate": args.rate, "duration": args.duration, "timeout": args.timeout, "env": env,
+                       "scenarios": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Đã lưu kết quả: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+So sánh /predict/batch (JSON + pydantic) với /rpc/predict (nhị phân dạng cột) ở cùng batch size.
+
+Tự chạy service trên localhost (như load_test.py), gửi tuần tự trên 1 kết nối keep-alive và đo
+latency end-to-end mỗi request (kể cả encode / decode phía client), kích thước body và rows/s.
+
+Chạy từ thư mục car-valuation-service (cần httpx):
+    python benchmarks/bench_rpc.py
+    python benchmarks/bench_rpc.py --sizes 1,64,1024 --env INFERENCE_BACKEND=onnx
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+sys.path.insert(0, str(BASE_DIR / "benchmarks"))
+
+import httpx
+import numpy as np
+
+from load_test import METADATA_PATH, RESULTS_DIR, RequestMix, start_server, stop_server
+from service import columnar_rpc
+
+DEFAULT_SIZES = "1,8,64,1024,10000"
+
+
+def measure(send, min_time, min_repeats, max_repeats):
+    timings = []
+    total = 0.0
+    while len(timings) < max_repeats and (len(timings) < min_repeats or total < min_time):
+        start = time.perf_counter()
+        send()
+        elapsed = time.perf_counter() - start
+        timings.append(elapsed)
+        total += elapsed
+    timings.sort()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Các batch size, phân cách bằng dấu phẩy")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Biến môi trường cho service (mặc định tắt cache để 2 đường cùng predict thật)")
+    parser.add_argument("--min-time", type=float, default=2.0, help="Thời gian đo tối thiểu mỗi ô (giây)")
+    parser.add_argument("--min-repeats", type=int, default=5)
+    parser.add_argument("--max-repeats", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    env = {"PREDICTION_CACHE_SIZE": "0", "MAX_BATCH_SIZE": str(max(sizes)), **dict(e.split("=", 1) for e in args.env)}
+    with open(METADATA_PATH, "r", encoding="utf-8") as f:
+        mix = RequestMix(json.load(f), {"batch": 1}, 1, 1, 0.05, args.seed)
+
+    print("=" * 60)
+    print("BENCHMARK JSON /predict/batch vs BINARY /rpc/predict")
+    print("=" * 60)
+    process, base_url = start_server(env, RESULTS_DIR / "bench_rpc.server.log")
+    results = []
+    try:
+        with httpx.Client(base_url=base_url, timeout=120) as client:
+            print(f"\n{'batch':>6} {'đường':<7} {'body':>10} {'response':>10} {'p50':>10} {'p99':>10} {'rows/s':>10}")
+            for size in sizes:
+                cars = [mix.car() for _ in range(size)]
+
+                rpc_body = columnar_rpc.encode_request(cars)
+                rpc_headers = {"Content-Type": columnar_rpc.REQUEST_MEDIA_TYPE}
+
+                def send_json():
+                    response = client.post("/predict/batch", json=cars)
+                    response.raise_for_status()
+                    return response, [item["price_estimate"] for item in response.json()]
+
+                def send_rpc():
+                    # Encode nằm trong phần đo: client thật cũng phải dựng body từ dữ liệu của nó
+                    response = client.post("/rpc/predict", content=columnar_rpc.encode_request(cars),
+                                           headers=rpc_headers)
+                    response.raise_for_status()
+                    return response, columnar_rpc.decode_response(response.content)[0]
+
+                # Cùng giá (JSON làm tròn tới triệu) trước khi đo
+                (json_response, json_prices), (rpc_response, rpc_prices) = send_json(), send_rpc()
+                assert np.allclose(np.round(rpc_prices), json_prices, atol=1), "Giá 2 đường khác nhau"
+
+                entry = {"batch_size": size}
+                bodies = {
+                    "json": (len(json.dumps(cars, ensure_ascii=False).encode()), len(json_response.content)),
+                    "rpc": (len(rpc_body), len(rpc_response.content)),
+                }
+                for name, send in (("json", send_json), ("rpc", send_rpc)):
+                    timings = measure(send, args.min_time, args.min_repeats, args.max_repeats)
+                    p50 = statistics.median(timings)
+                    p99 = timings[max(0, int(len(timings) * 0.99) - 1)]
+                    entry[name] = {
+                        "request_bytes": bodies[name][0], "response_bytes": bodies[name][1],
+                        "p50_ms": round(p50 * 1e3, 3), "p99_ms": round(p99 * 1e3, 3),
+                        "rows_per_second": round(size / p50), "repeats": len(timings),
+                    }
+                    print(f"{size:>6} {name:<7} {bodies[name][0]:>10,} {bodies[name][1]:>10,} "
+                          f"{p50 * 1e3:>8.2f}ms {p99 * 1e3:>8.2f}ms {size / p50:>10,.0f}")
+                print(f"{'':>6} -> nhị phân nhanh hơn {entry['json']['p50_ms'] / entry['rpc']['p50_ms']:.1f}x (p50)")
+                results.append(entry)
+    finally:
+        stop_server(process)
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"env": env, "batches": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Đã lưu kết quả: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
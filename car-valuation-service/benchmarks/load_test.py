@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Load test HTTP API định giá: tự chạy service (run_service.py) trên localhost, bắn hỗn hợp request
+lấy từ metadata.json, đo throughput + latency p50/p95/p99 theo từng endpoint và lưu kết quả JSON.
+
+Chạy từ thư mục car-valuation-service (cần httpx: pip install httpx):
+    python benchmarks/load_test.py --concurrency 16 --duration 30
+    python benchmarks/load_test.py --rate 200 --mix predict=70,batch=10,health=10,metadata=10
+    python benchmarks/load_test.py --env INFERENCE_BACKEND=lean --env WORKERS=4 --label lean-4w
+    python benchmarks/load_test.py --baseline benchmarks/results/main.json   # exit 1 nếu chậm hơn
+    python benchmarks/load_test.py --url http://127.0.0.1:8001                # server có sẵn
+
+- --rate 0 (mặc định): closed loop, mỗi client gửi request kế tiếp ngay khi nhận response.
+- --rate N: open loop N req/s (khoảng cách Poisson), latency tính từ thời điểm lẽ ra phải gửi
+  nên thời gian xếp hàng khi server quá tải vẫn được tính (không bị coordinated omission).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import unicodedata
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+METADATA_PATH = BASE_DIR / "metadata.json"
+RESULTS_DIR = BASE_DIR / "benchmarks" / "results"
+
+ENDPOINTS = ("predict", "batch", "stream", "curve", "health", "metadata")
+DEFAULT_MIX = "predict=80,batch=5,health=10,metadata=5"
+# Km trung bình mỗi năm tuổi xe (độ lệch chuẩn) để sinh mileage gần với tin đăng thật
+KM_PER_YEAR = (15_000, 6_000)
+PERCENTILES = (50, 95, 99)
+
+
+def _strip_accents(text: str) -> str:
+    text = unicodedata.normalize("NFD", text.replace("đ", "d").replace("Đ", "D"))
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+class RequestMix:
+    """Sinh request ngẫu nhiên (có seed) từ cây make -> model -> year -> version -> color"""
+
+    def __init__(self, metadata: dict, weights: dict, batch_size: int, stream_rows: int,
+                 fuzzy_rate: float, seed: int):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.stream_rows = stream_rows
+        self.fuzzy_rate = fuzzy_rate
+        self.names = [name for name, weight in weights.items() if weight > 0]
+        self.weights = [weights[name] for name in self.names]
+        self.configs = []
+        for make in metadata["makes"]:
+            for model in metadata["make_models"].get(make, []):
+                for year in metadata["model_years"].get(make, {}).get(model, []):
+                    versions = metadata["year_versions"][make][model].get(str(year), [])
+                    for version in versions:
+                        colors = metadata["version_colors"][make][model][str(year)].get(version, [])
+                        self.configs.append((make, model, int(year), version, colors))
+        self.current_year = datetime.now().year
+
+    def car(self) -> dict:
+        rng = self.rng
+        make, model, year, version, colors = rng.choice(self.configs)
+        age = max(self.current_year - year, 0) + rng.random()
+        mileage = max(0, int(age * rng.gauss(*KM_PER_YEAR)))
+        car = {"brand": make, "model": model, "year": year, "mileage_km": mileage}
+        # Form thật hay bỏ trống version / color và gõ không dấu
+        if rng.random() > 0.05:
+            car["version"] = version
+        if colors and rng.random() > 0.10:
+            color = rng.choice(colors)
+            car["color"] = _strip_accents(color).lower() if rng.random() < self.fuzzy_rate else color
+        return car
+
+    def metadata_path(self) -> str:
+        make, model, year, _, _ = self.rng.choice(self.configs)
+        return self.rng.choice((
+            "/metadata/makes",
+            f"/metadata/models/{make}",
+            f"/metadata/years/{make}/{model}",
+            f"/metadata/versions/{make}/{model}/{year}",
+            f"/metadata/colors/{make}/{model}/{year}",
+        ))
+
+    def next(self):
+        """(tên endpoint, method, path, kwargs cho httpx)"""
+        name = self.rng.choices(self.names, self.weights)[0]
+        if name == "predict":
+            return name, "POST", "/predict", {"json": self.car()}
+        if name == "batch":
+            return name, "POST", "/predict/batch", {"json": [self.car() for _ in range(self.batch_size)]}
+        if name == "stream":
+            body = "".join(json.dumps(self.car(), ensure_ascii=False) + "\n" for _ in range(self.stream_rows))
+            return name, "POST", "/predict/stream", {
+                "content": body.encode("utf-8"), "headers": {"Content-Type": "application/x-ndjson"},
+            }
+        if name == "curve":
+            return name, "POST", "/predict/curve", {"json": self.car()}
+        if name == "health":
+            return name, "GET", "/health", {}
+        return name, "GET", self.metadata_path(), {}
+
+
+def parse_mix(text: str) -> dict:
+    weights = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise SystemExit(f"❌ Endpoint không hợp lệ trong --mix: {name} (chọn trong {', '.join(ENDPOINTS)})")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(env_overrides: dict, log_path: Path):
+    """Chạy run_service.py trên cổng trống, chờ /health/ready; trả về (process, base_url)"""
+    port = _free_port()
+    env = dict(os.environ, HOST="127.0.0.1", PORT=str(port), RELOAD="false", **env_overrides)
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    log = open(log_path, "wb")
+    process = subprocess.Popen([sys.executable, "run_service.py"], cwd=BASE_DIR, env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"❌ Service thoát sớm (code {process.returncode}), xem log: {log_path}")
+        try:
+            if httpx.get(f"{base_url}/health/ready", timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f"❌ Service chưa ready sau 120s, xem log: {log_path}")
+
+
+def stop_server(process) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+async def run_load(base_url: str, mix: RequestMix, concurrency: int, rate: float,
+                   duration: float, warmup: float, timeout: float):
+    """Trả về (samples {endpoint: [(latency_s, status)]}, thời gian đo thực tế)"""
+    samples = defaultdict(list)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        async def send(request, scheduled):
+            name, method, path, kwargs = request
+            try:
+                response = await client.request(method, path, **kwargs)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            finished = loop.time()
+            if scheduled >= measure_from:
+                samples[name].append((finished - scheduled, status))
+
+        if rate <= 0:
+            async def client_loop():
+                while loop.time() < stop_at:
+                    await send(mix.next(), loop.time())
+            await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        else:
+            slots = asyncio.Semaphore(concurrency)
+            tasks = set()
+
+            async def bounded(request, scheduled):
+                async with slots:
+                    await send(request, scheduled)
+
+            scheduled = start
+            while scheduled < stop_at:
+                delay = scheduled - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                task = asyncio.create_task(bounded(mix.next(), scheduled))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                scheduled += mix.rng.expovariate(rate)
+            await asyncio.gather(*tasks)
+
+    return samples, max(loop.time(), stop_at) - measure_from
+
+
+def _percentile(sorted_values, p):
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    return statistics.quantiles(sorted_values, n=100, method="inclusive")[p - 1]
+
+
+def summarize(samples: dict, elapsed: float) -> dict:
+    endpoints = {}
+    for name in ENDPOINTS:
+        if not samples.get(name):
+            continue
+        latencies = sorted(latency * 1000 for latency, _ in samples[name])
+        statuses = defaultdict(int)
+        for _, status in samples[name]:
+            statuses[str(status)] += 1
+        errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+        endpoints[name] = {
+            "requests": len(latencies),
+            "errors": errors,
+            "error_rate": round(errors / len(latencies), 4),
+            "throughput_rps": round(len(latencies) / elapsed, 1),
+            "latency_ms": {
+                **{f"p{p}": round(_percentile(latencies, p), 2) for p in PERCENTILES},
+                "mean": round(statistics.fmean(latencies), 2),
+                "max": round(latencies[-1], 2),
+            },
+            "statuses": dict(statuses),
+        }
+    total = sum(stats["requests"] for stats in endpoints.values())
+    return {
+        "total": {
+            "requests": total,
+            "errors": sum(stats["errors"] for stats in endpoints.values()),
+            "throughput_rps": round(total / elapsed, 1),
+            "elapsed_s": round(elapsed, 2),
+        },
+        "endpoints": endpoints,
+    }
+
+
+def compare(result: dict, baseline: dict, max_regression: float, min_delta_ms: float,
+            max_error_rate: float) -> list:
+    """Danh sách vi phạm: latency tăng quá max_regression (và quá min_delta_ms), hoặc tỉ lệ lỗi quá ngưỡng"""
+    failures = []
+    for name, stats in result["endpoints"].items():
+        if stats["error_rate"] > max_error_rate:
+            failures.append(f"{name}: tỉ lệ lỗi {stats['error_rate']:.2%} > {max_error_rate:.2%}")
+        base = baseline.get("endpoints", {}).get(name)
+        if base is None:
+            continue
+        for p in PERCENTILES:
+            key = f"p{p}"
+            current, before = stats["latency_ms"][key], base["latency_ms"][key]
+            if current > before * (1 + max_regression) and current - before > min_delta_ms:
+                failures.append(f"{name} {key}: {before} ms -> {current} ms (+{current / before - 1:.0%})")
+    return failures
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(result: dict) -> None:
+    print(f"\n{'Endpoint':<10} {'req':>8} {'lỗi':>6} {'req/s':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}  (ms)")
+    for name, stats in result["endpoints"].items():
+        latency = stats["latency_ms"]
+        print(f"{name:<10} {stats['requests']:>8,} {stats['errors']:>6,} {stats['throughput_rps']:>9,.1f} "
+              f"{latency['p50']:>9.2f} {latency['p95']:>9.2f} {latency['p99']:>9.2f} {latency['max']:>9.2f}")
+    total = result["total"]
+    print(f"{'Tổng':<10} {total['requests']:>8,} {total['errors']:>6,} {total['throughput_rps']:>9,.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Dùng server đang chạy thay vì tự khởi động run_service.py")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Biến môi trường cho service tự khởi động (lặp lại được)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Số request đồng thời tối đa")
+    parser.add_argument("--rate", type=float, default=0, help="req/s (open loop); 0 = closed loop")
+    parser.add_argument("--duration", type=float, default=30, help="Số giây đo")
+    parser.add_argument("--warmup", type=float, default=3, help="Số giây chạy trước khi bắt đầu đo")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Tỉ trọng endpoint, vd {DEFAULT_MIX}")
+    parser.add_argument("--batch-size", type=int, default=20, help="Số xe mỗi request /predict/batch")
+    parser.add_argument("--stream-rows", type=int, default=500, help="Số dòng mỗi request /predict/stream")
+    parser.add_argument("--fuzzy-rate", type=float, default=0.05, help="Tỉ lệ màu gõ không dấu")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--metadata", type=Path, default=METADATA_PATH)
+    parser.add_argument("--label", default=None, help="Tên lần chạy (mặc định: commit + thời gian)")
+    parser.add_argument("--output", type=Path, help="File JSON kết quả (mặc định benchmarks/results/<label>.json)")
+    parser.add_argument("--baseline", type=Path, help="File JSON lần chạy trước để so sánh")
+    parser.add_argument("--max-regression", type=float, default=0.15,
+                        help="Latency p50/p95/p99 được phép tăng tối đa bao nhiêu so với baseline (0.15 = 15%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                        help="Bỏ qua chênh lệch nhỏ hơn mức này (nhiễu đo)")
+    parser.add_argument("--max-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    env_overrides = dict(item.split("=", 1) for item in args.env)
+    with open(args.metadata, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    mix = RequestMix(metadata, parse_mix(args.mix), args.batch_size, args.stream_rows, args.fuzzy_rate, args.seed)
+    commit = _git_commit()
+    started_at = datetime.now(timezone.utc)
+    label = args.label or f"{commit}-{started_at:%Y%m%d-%H%M%S}"
+    output = args.output or RESULTS_DIR / f"{label}.json"
+
+    print("=" * 60)
+    print("LOAD TEST CAR VALUATION API")
+    print("=" * 60)
+    process = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        print(f"🚀 Khởi động service {' '.join(args.env)}".rstrip())
+        process, base_url = start_server(env_overrides, RESULTS_DIR / f"{label}.server.log")
+    mode = f"open loop {args.rate:g} req/s" if args.rate > 0 else "closed loop"
+    print(f"📊 {base_url}: {mode}, concurrency {args.concurrency}, warmup {args.warmup:g}s, "
+          f"đo {args.duration:g}s, mix {args.mix}")
+
+    try:
+        samples, elapsed = asyncio.run(run_load(base_url, mix, args.concurrency, args.rate,
+                                                args.duration, args.warmup, args.timeout))
+    finally:
+        if process is not None:
+            stop_server(process)
+
+    result = {
+        "label": label,
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "config": {
+            "url": args.url, "env": env_overrides, "concurrency": args.concurrency, "rate": args.rate,
+            "duration": args.duration, "warmup": args.warmup, "mix": args.mix,
+            "batch_size": args.batch_size, "stream_rows": args.stream_rows,
+            "fuzzy_rate": args.fuzzy_rate, "seed": args.seed,
+        },
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        **summarize(samples, elapsed),
+    }
+    print_report(result)
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Đã lưu kết quả: {output}")
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\n🔍 So với baseline {baseline.get('label')} (commit {baseline.get('git_commit')}):")
+        if baseline.get("config") != result["config"]:
+            print("   ⚠️  Cấu hình khác lần chạy baseline (concurrency / rate / mix / env...), so sánh chỉ mang tính tham khảo")
+    failures = compare(result, baseline, args.max_regression, args.min_delta_ms, args.max_error_rate)
+    if failures:
+        for failure in failures:
+            print(f"   ❌ {failure}")
+        sys.exit(1)
+    if args.baseline:
+        print(f"   ✅ Không endpoint nào chậm hơn quá {args.max_regression:.0%}")
+
+if __name__ == "__main__":
+    main()
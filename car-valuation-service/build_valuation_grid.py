@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Build bảng giá tính sẵn (models/valuation_grid.npz) cho mọi cấu hình xe trong metadata.json.
+
+Chạy lại sau mỗi lần train / extract metadata (bảng cũ tự bị bỏ qua khi model đổi):
+    python build_valuation_grid.py                       # mode step: khớp tuyệt đối với model
+    python build_valuation_grid.py --mode linear --knots 0,20000,50000,100000,200000,500000
+
+Service chỉ dùng bảng khi đặt VALUATION_GRID_ENABLED=true.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE_DIR))
+
+from service.model_loader import VALUATION_GRID_PATH, load_bundle
+from service.valuation_grid import DEFAULT_MILEAGE_KNOTS, GRID_MODES, ValuationGrid, mileage_breakpoints
+
+METADATA_PATH = BASE_DIR / "metadata.json"
+
+
+def _equivalent_versions(bundle, grid, backend):
+    """Artifact của backend còn lại (pkl <-> booster native) cho cùng giá trên cả lưới thì dùng chung bảng"""
+    other = "lean" if backend == "pipeline" else "pipeline"
+    try:
+        other_bundle = load_bundle(other)
+    except Exception as e:
+        print(f"⚠️  Không load được backend {other}, bảng chỉ dùng cho version {bundle.version}: {e}")
+        return []
+    rows = [
+        {'make': make, 'model': model, 'year': year, 'version': version, 'color': color, 'mileage': mileage}
+        for make, model, year, version, color in grid.configs
+        for mileage in grid._knots
+    ]
+    prices = np.asarray(other_bundle.predict_rows(rows), dtype=np.float32).reshape(grid.prices.shape)
+    if not np.array_equal(prices, grid.prices):
+        print(f"⚠️  Backend {other} (version {other_bundle.version}) cho giá khác, không dùng chung bảng")
+        return []
+    return [other_bundle.version]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["pipeline", "lean"], default="pipeline")
+    parser.add_argument("--mode", choices=GRID_MODES, default="step")
+    parser.add_argument("--knots", help="Mốc km cho mode linear, phân cách bằng dấu phẩy")
+    parser.add_argument("--metadata", type=Path, default=METADATA_PATH)
+    parser.add_argument("--output", type=Path, default=VALUATION_GRID_PATH)
+    args = parser.parse_args()
+
+    bundle = load_bundle(args.backend)
+    with open(args.metadata, 'r', encoding='utf-8') as f:
+        metadata = json.load(f)
+
+    if args.mode == "step":
+        if bundle.fast_predictor is None:
+            raise SystemExit("❌ Mode step cần booster XGBoost + fast-path encoder")
+        knots = mileage_breakpoints(bundle.fast_predictor)
+    else:
+        knots = [float(k) for k in args.knots.split(",")] if args.knots else DEFAULT_MILEAGE_KNOTS
+
+    start = time.perf_counter()
+    grid = ValuationGrid.build(bundle.predict_rows, metadata, knots, [bundle.version], args.mode)
+    print(f"✅ Đã tính {grid.prices.size:,} giá ({len(grid.configs)} cấu hình x {len(grid.knots)} mốc km) "
+          f"trong {time.perf_counter() - start:.2f}s")
+    grid.model_versions += _equivalent_versions(bundle, grid, args.backend)
+
+    report = grid.evaluate(bundle.predict_rows)
+    print(f"📊 So với model thật trên {report['points']:,} điểm: "
+          f"sai số lớn nhất {report['max_abs_error']} triệu, p99 {report['p99_abs_error']} triệu, "
+          f"trung bình {report['mean_abs_error']} triệu, tương đối lớn nhất {report['max_rel_error']:.2%}")
+    if report['max_abs_error'] > 0:
+        print(f"   Trường hợp tệ nhất: {report['worst_case']}")
+
+    grid.save(args.output)
+    print(f"💾 Đã lưu {args.output.name} ({args.output.stat().st_size / 1e3:.0f} KB) "
+          f"cho model version {', '.join(grid.model_versions)}")
+
+
+if __name__ == "__main__":
+    main()
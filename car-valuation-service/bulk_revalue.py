@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Định giá lại hàng loạt offline (không qua HTTP) từ file CSV / Parquet tin đăng.
+
+    python bulk_revalue.py listings.csv prices.csv [--workers N] [--chunk-size 20000]
+    python bulk_revalue.py listings.parquet prices.parquet      # Parquet cần: pip install pyarrow
+
+- Input cần các cột brand (hoặc make), model, year, mileage_km (hoặc mileage); version, color tuỳ chọn.
+  Thiếu cột bắt buộc thì dừng ngay từ chunk đầu, trước khi ghi output.
+- Đọc input theo chunk rồi gửi sang process pool; mỗi worker có model load đúng 1 lần
+  (Linux: process cha load best_car_price_pipeline.pkl với 1 thread XGBoost rồi fork, worker dùng chung
+  bộ nhớ copy-on-write).
+- Tối đa 2 x workers chunk trong bộ nhớ cùng lúc, output ghi đúng thứ tự input
+  -> RAM đỉnh không phụ thuộc kích thước file.
+- Output = các cột input + price_estimate, price_min, price_max (triệu VND, cùng công thức với API).
+  Dòng API sẽ từ chối (brand / model trống, year thiếu / ngoài 1990-2030, mileage thiếu / âm) để trống
+  giá thay vì để Pipeline tự điền.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE_DIR))
+
+from service.model_loader import FEATURE_COLUMNS, load_bundle
+
+# Bundle của process hiện tại (cha hoặc worker)
+_bundle = None
+# Cùng giới hạn với CarInput của API
+YEAR_MIN, YEAR_MAX = 1990, 2030
+# Cột bắt buộc (các tên thay thế nhau)
+REQUIRED_COLUMNS = (("brand", "make"), ("model",), ("year",), ("mileage_km", "mileage"))
+
+
+def _cpu_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _init_worker(backend: str, fuzzy_min_score: float) -> None:
+    """Load model nếu process chưa có (fork đã thừa hưởng từ process cha), 1 thread XGBoost mỗi worker"""
+    global _bundle
+    if _bundle is None:
+        # 1 thread ngay từ lúc load: bước kiểm tra fast encoder (Pipeline backend) cũng predict
+        _bundle = load_bundle(backend, True, False, fuzzy_min_score, nthread=1)
+
+
+def _column(df: pd.DataFrame, *names: str) -> pd.Series:
+    for name in names:
+        if name in df.columns:
+            return df[name]
+    raise ValueError(f"Input thiếu cột {' / '.join(names)}")
+
+
+def _check_columns(df: pd.DataFrame) -> None:
+    """Chạy ở process cha trên chunk đầu: thiếu cột thì dừng trước khi worker nào predict / ghi output"""
+    missing = [" / ".join(names) for names in REQUIRED_COLUMNS if not any(name in df.columns for name in names)]
+    if missing:
+        raise ValueError(f"Input thiếu cột {', '.join(missing)}")
+
+
+def _to_rows(df: pd.DataFrame) -> list:
+    """Chuẩn hoá giống _car_to_row của API: strip text, version/color trống -> "Unknown" """
+    def text(series: pd.Series, missing: str = "") -> pd.Series:
+        values = series.fillna("").astype(str).str.strip()
+        return values.where(values != "", missing) if missing else values
+
+    unknown = pd.Series("Unknown", index=df.index)
+    columns = [
+        text(_column(df, "brand", "make")),
+        text(_column(df, "model")),
+        pd.to_numeric(_column(df, "year"), errors="coerce"),
+        text(df["version"], "Unknown") if "version" in df.columns else unknown,
+        text(df["color"], "Unknown") if "color" in df.columns else unknown,
+        pd.to_numeric(_column(df, "mileage_km", "mileage"), errors="coerce"),
+    ]
+    rows = [dict(zip(FEATURE_COLUMNS, values)) for values in zip(*(c.tolist() for c in columns))]
+    if _bundle.resolver is not None:
+        rows = [_bundle.resolver.resolve(row, skip=("Unknown", ""))[0] for row in rows]
+    return rows
+
+
+def _predict_chunk(df: pd.DataFrame) -> pd.DataFrame:
+    rows = _to_rows(df)
+    # Cùng luật với API: brand / model chỉ có khoảng trắng coi như để trống
+    # NaN không thoả so sánh nào nên năm / km thiếu cũng bị loại
+    valid = [
+        i for i, row in enumerate(rows)
+        if row["make"] and row["model"] and YEAR_MIN <= row["year"] <= YEAR_MAX and row["mileage"] >= 0
+    ]
+    prices = np.full(len(rows), np.nan)
+    ranges = np.full((len(rows), 2), np.nan)
+    if valid:
+        prices[valid] = _bundle.predict_rows([rows[i] for i in valid])
+        ranges[valid] = [_bundle.price_range(price) for price in prices[valid]]
+    out = df.copy()
+    out["price_estimate"] = prices.round(0)
+    out["price_min"] = ranges[:, 0].round(0)
+    out["price_max"] = ranges[:, 1].round(0)
+    return out
+
+
+def _is_parquet(path: Path) -> bool:
+    return path.suffix.lower() in (".parquet", ".pq")
+
+
+def _read_chunks(path: Path, chunk_size: int):
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size, dtype={"version": str, "color": str})
+
+
+class _ChunkWriter:
+    """Ghi nối từng chunk kết quả vào CSV hoặc Parquet"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._parquet = None
+        self._first = True
+
+    def write(self, df: pd.DataFrame) -> None:
+        if _is_parquet(self.path):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self._parquet is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                self._parquet = pq.ParquetWriter(self.path, table.schema)
+            else:
+                table = pa.Table.from_pandas(df, schema=self._parquet.schema, preserve_index=False)
+            self._parquet.write_table(table)
+        else:
+            df.to_csv(self.path, mode="w" if self._first else "a", header=self._first, index=False)
+        self._first = False
+
+    def close(self) -> None:
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", type=Path)
+    parser.add_argument("output", type=Path)
+    parser.add_argument("--workers", type=int, default=_cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=20_000)
+    parser.add_argument("--backend", choices=["pipeline", "lean", "onnx"], default="pipeline")
+    parser.add_argument("--fuzzy-min-score", type=float, default=0.75,
+                        help="Ngưỡng khớp gần đúng brand/model/version/color (0 = tắt)")
+    args = parser.parse_args()
+
+    if _is_parquet(args.input) or _is_parquet(args.output):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("❌ Đọc/ghi Parquet cần pyarrow: pip install pyarrow")
+
+    workers = max(1, args.workers)
+    start_methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in start_methods else "spawn")
+    if context.get_start_method() == "fork":
+        # Load 1 lần ở process cha, worker fork ra dùng chung. Mọi lần predict ở process cha (kiểm tra
+        # fast encoder với Pipeline lúc load) đều chạy 1 thread nên chưa có thread pool OpenMP khi fork
+        _init_worker(args.backend, args.fuzzy_min_score)
+
+    print(f"🚀 Định giá {args.input.name} -> {args.output.name}: {workers} worker, chunk {args.chunk_size:,} dòng")
+    writer = _ChunkWriter(args.output)
+    pending = deque()
+    rows = skipped = 0
+    start = time.perf_counter()
+
+    def drain_one():
+        nonlocal rows, skipped
+        result = pending.popleft().result()
+        writer.write(result)
+        rows += len(result)
+        skipped += int(result["price_estimate"].isna().sum())
+        elapsed = time.perf_counter() - start
+        print(f"   {rows:,} dòng | {rows / elapsed:,.0f} dòng/s", flush=True)
+
+    try:
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(args.backend, args.fuzzy_min_score)) as pool:
+            for i, chunk in enumerate(_read_chunks(args.input, args.chunk_size)):
+                if i == 0:
+                    try:
+                        _check_columns(chunk)
+                    except ValueError as e:
+                        raise SystemExit(f"❌ {e}")
+                pending.append(pool.submit(_predict_chunk, chunk))
+                while len(pending) >= 2 * workers:
+                    drain_one()
+            while pending:
+                drain_one()
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Xong {rows:,} dòng trong {elapsed:.1f}s = {rows / elapsed:,.0f} dòng/s "
+          f"({rows / elapsed / workers:,.0f} dòng/s mỗi worker)")
+    if skipped:
+        print(f"⚠️ {skipped:,} dòng trống brand / model hoặc thiếu / sai year, mileage: để trống giá")
+
+
+if __name__ == "__main__":
+    main()
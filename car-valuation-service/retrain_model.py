@@ -4,6 +4,9 @@ Script tối ưu hóa quy trình huấn luyện model định giá xe (V3 - Wind
 - Thêm bảo vệ __main__ cho Windows.
 - Tự động phát hiện và cảnh báo XGBoost.
 - FIX: Bỏ early_stopping_rounds trong GridSearch để tránh lỗi thiếu validation set.
+- Export booster native (UBJ) + encoder spec cho chế độ inference "lean" của service.
+- Export thêm model ONNX (preprocessing + cây) cho INFERENCE_BACKEND=onnx, kiểm tra parity trên tập test.
+  Chỉ export lại từ Pipeline đã lưu: python retrain_model.py --export-only
 """
 
 import joblib
@@ -27,6 +30,98 @@ warnings.filterwarnings('ignore')
 # Cấu hình hiển thị số thực đẹp hơn
 pd.options.display.float_format = '{:,.2f}'.format
 
+BOOSTER_FILENAME = "car_price_booster.ubj"
+ENCODER_SPEC_FILENAME = "encoder_spec.json"
+ONNX_FILENAME = "car_price_pipeline.onnx"
+
+CAT_FEATURES = ['make', 'model', 'version', 'color']
+NUM_FEATURES = ['year', 'mileage']
+TARGET_COL = 'price_vnd'
+
+def export_lean_artifacts(pipeline, models_dir: Path, source_name: str = "best_car_price_pipeline.pkl"):
+    """
+    Xuất booster XGBoost ở định dạng native UBJ + encoder spec JSON.
+    Service chạy INFERENCE_BACKEND=lean chỉ cần 2 file này (không cần pandas/sklearn/joblib).
+    """
+    from service.fast_encoder import FastPredictor, sample_rows
+
+    try:
+        predictor = FastPredictor.from_pipeline(pipeline)
+    except ValueError as e:
+        print(f"⚠️  Bỏ qua export lean: {e}")
+        return
+
+    booster_path = models_dir / BOOSTER_FILENAME
+    spec_path = models_dir / ENCODER_SPEC_FILENAME
+    predictor.save(booster_path, spec_path, extra={"source_model": source_name})
+
+    # Load lại đúng như service và kiểm tra parity với Pipeline
+    FastPredictor.load(spec_path).verify_against(pipeline, sample_rows(predictor.encoder))
+    print(f"💾 Đã export booster native: {booster_path.name} ({booster_path.stat().st_size / 1e6:.1f} MB)")
+    print(f"💾 Đã export encoder spec: {spec_path.name} (parity ✅)")
+
+def export_onnx_artifact(pipeline, models_dir: Path, X_check=None,
+                         source_name: str = "best_car_price_pipeline.pkl"):
+    """
+    Xuất preprocessing + XGBoost thành 1 file ONNX cho INFERENCE_BACKEND=onnx và kiểm tra
+    parity với Pipeline trên X_check (tập test); không có thì dùng các dòng mẫu của encoder.
+    """
+    from service.fast_encoder import FastPredictor, sample_rows
+    from service.onnx_backend import OnnxPredictor, export_onnx
+
+    try:
+        model = export_onnx(FastPredictor.from_pipeline(pipeline), source_name)
+    except ImportError as e:
+        print(f"⚠️  Bỏ qua export ONNX (thiếu thư viện: {e.name}). Cài: pip install onnx onnxmltools onnxruntime")
+        return
+    except ValueError as e:
+        print(f"⚠️  Bỏ qua export ONNX: {e}")
+        return
+
+    onnx_path = models_dir / ONNX_FILENAME
+    tmp_path = onnx_path.with_suffix(".onnx.tmp")
+    tmp_path.write_bytes(model.SerializeToString())
+    if X_check is None:
+        X_check = pd.DataFrame(sample_rows(FastPredictor.from_pipeline(pipeline).encoder))
+        checked_on = "dòng mẫu"
+    else:
+        checked_on = "tập test"
+    try:
+        report = OnnxPredictor.load(tmp_path).parity_report(pipeline, X_check)
+    except ValueError as e:
+        tmp_path.unlink()
+        print(f"❌ Không export ONNX: {e}")
+        return
+    # Chỉ thay file cũ khi parity đạt (service có thể đang watch thư mục models)
+    tmp_path.replace(onnx_path)
+    print(f"💾 Đã export ONNX: {onnx_path.name} ({onnx_path.stat().st_size / 1e6:.1f} MB), parity trên "
+          f"{report['rows']} {checked_on}: lệch tối đa {report['max_abs_diff']:.4f} triệu "
+          f"(trung bình {report['mean_abs_diff']:.5f}) ✅")
+
+def load_train_test(data_dir: Path):
+    """Đọc CSV mới nhất trong data/, làm sạch mileage rồi chia train / test (random_state cố định)"""
+    data_path = data_dir / "toyota_cleaned.csv"
+    if not data_path.exists():
+        csv_files = list(data_dir.glob("*.csv"))
+        if not csv_files:
+            raise FileNotFoundError("❌ Không tìm thấy file dữ liệu .csv nào!")
+        data_path = max(csv_files, key=lambda p: p.stat().st_mtime)
+
+    print(f"📁 Đang đọc dữ liệu từ: {data_path.name}")
+    df = pd.read_csv(data_path)
+
+    # Clean mileage
+    if df['mileage'].dtype == 'object':
+        df['mileage'] = df['mileage'].astype(str).str.replace(r'\D', '', regex=True)
+        df['mileage'] = pd.to_numeric(df['mileage'], errors='coerce')
+
+    df = df.dropna(subset=[TARGET_COL, 'mileage'])
+
+    X = df[CAT_FEATURES + NUM_FEATURES]
+    y = df[TARGET_COL]
+
+    return train_test_split(X, y, test_size=0.2, random_state=42)
+
 def main():
     print("🚀 BẮT ĐẦU QUÁ TRÌNH HUẤN LUYỆN (V3 - WINDOWS SAFE - XGB FIX)")
     print("="*70)
@@ -48,33 +143,9 @@ def main():
         print("👉 Hãy chạy lệnh: pip install xgboost")
         print("   (Hiện tại sẽ bỏ qua XGBoost và chỉ train các model khác)\n")
 
-    # Load dữ liệu
-    data_path = DATA_DIR / "toyota_cleaned.csv"
-    if not data_path.exists():
-        csv_files = list(DATA_DIR.glob("*.csv"))
-        if not csv_files:
-            raise FileNotFoundError("❌ Không tìm thấy file dữ liệu .csv nào!")
-        data_path = max(csv_files, key=lambda p: p.stat().st_mtime)
-
-    print(f"📁 Đang đọc dữ liệu từ: {data_path.name}")
-    df = pd.read_csv(data_path)
-
-    # --- 2. SƠ CHẾ DỮ LIỆU ---
-    cat_features = ['make', 'model', 'version', 'color'] 
-    num_features = ['year', 'mileage']                   
-    target_col = 'price_vnd'
-
-    # Clean mileage
-    if df['mileage'].dtype == 'object':
-        df['mileage'] = df['mileage'].astype(str).str.replace(r'\D', '', regex=True)
-        df['mileage'] = pd.to_numeric(df['mileage'], errors='coerce')
-
-    df = df.dropna(subset=[target_col, 'mileage'])
-
-    X = df[cat_features + num_features]
-    y = df[target_col]
-
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    # Load dữ liệu + sơ chế, chia train / test
+    X_train, X_test, y_train, y_test = load_train_test(DATA_DIR)
+    cat_features, num_features = CAT_FEATURES, NUM_FEATURES
     print(f"✅ Dữ liệu sẵn sàng: Train ({len(X_train)}) - Test ({len(X_test)})")
 
     # --- 3. PIPELINE ---
@@ -202,6 +273,10 @@ def main():
         joblib.dump(best_overall_model, save_path)
         print(f"💾 Đã lưu Pipeline tại: {save_path}")
 
+        # Export cho chế độ inference lean
+        export_lean_artifacts(best_overall_model, MODELS_DIR, save_path.name)
+        export_onnx_artifact(best_overall_model, MODELS_DIR, X_test, save_path.name)
+
         # Lưu metrics
         metrics_path = MODELS_DIR / "model_metrics.json"
         results_df.iloc[0][['Model', 'Test MAE', 'R2 Score']].to_json(metrics_path)
@@ -212,4 +287,16 @@ def main():
 
 # Bắt buộc cho Windows khi dùng multiprocessing
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    if '--export-only' in sys.argv:
+        base_dir = Path(__file__).resolve().parent
+        models_dir = base_dir / "models"
+        pipeline = joblib.load(models_dir / "best_car_price_pipeline.pkl")
+        export_lean_artifacts(pipeline, models_dir)
+        try:
+            X_test = load_train_test(base_dir / "data")[1]
+        except FileNotFoundError:
+            print("⚠️  Không có dữ liệu trong data/, kiểm tra parity ONNX trên dòng mẫu")
+            X_test = None
+        export_onnx_artifact(pipeline, models_dir, X_test)
+    else:
+        main()
\ No newline at end of file
@@ -1,21 +1,156 @@
 #!/usr/bin/env python3
 """
 Script để chạy FastAPI service cho car valuation
+
+- WORKERS=1 (mặc định): 1 process uvicorn như trước (RELOAD=true cho development).
+- WORKERS=N hoặc WORKERS=auto (= số CPU): chế độ pre-fork cho production. Master load +
+  warmup model 1 lần rồi fork N worker dùng chung socket; booster/encoder nằm trong bộ nhớ
+  copy-on-write nên không bị nhân N lần. Master tự fork lại worker nếu có worker chết; worker chết
+  ngay sau khi khởi động (< WORKER_MIN_UPTIME giây) thì fork lại sau 1, 2, 4... giây (tối đa
+  WORKER_RESPAWN_MAX_DELAY), WORKER_MAX_CRASHES lần liên tiếp như vậy thì master dừng hẳn (exit 1).
+  XGBOOST_NTHREAD (mặc định = số CPU // WORKERS) giới hạn thread XGBoost mỗi worker,
+  INFERENCE_WORKERS (mặc định max(2, số CPU // WORKERS)) là số thread chạy model mỗi worker.
 """
-import uvicorn
+import gc
 import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import uvicorn
+
+WORKER_MIN_UPTIME = float(os.getenv("WORKER_MIN_UPTIME", 10))
+WORKER_RESPAWN_MAX_DELAY = float(os.getenv("WORKER_RESPAWN_MAX_DELAY", 30))
+WORKER_MAX_CRASHES = int(os.getenv("WORKER_MAX_CRASHES", 5))
+
+
+def _cpu_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _resolve_workers(value: str) -> int:
+    if value.strip().lower() == "auto":
+        return _cpu_count()
+    return max(1, int(value))
+
+
+def _prepare_metrics_dir() -> None:
+    """Worker ghi metric ra thư mục chung để /metrics cộng dồn; xoá snapshot của lần chạy trước"""
+    metrics_dir = os.environ.setdefault(
+        "METRICS_MULTIPROC_DIR", str(Path(tempfile.gettempdir()) / "car-valuation-metrics")
+    )
+    path = Path(metrics_dir)
+    path.mkdir(parents=True, exist_ok=True)
+    for snapshot in path.glob("*.json"):
+        snapshot.unlink(missing_ok=True)
+
+
+def _run_worker(config: uvicorn.Config, sock, keep_metrics: bool) -> None:
+    from service import metrics
+
+    # Worker đầu tiên giữ số liệu load model của master, các worker khác bắt đầu từ 0
+    if not keep_metrics:
+        metrics.reset_after_fork()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def run_prefork(host: str, port: int, workers: int) -> None:
+    nthread = int(os.getenv("XGBOOST_NTHREAD", 0)) or max(1, _cpu_count() // workers)
+    # Phải đặt trước khi import service.main (config đọc từ env lúc import)
+    os.environ["XGBOOST_NTHREAD"] = str(nthread)
+    os.environ.setdefault("OMP_NUM_THREADS", str(nthread))
+    # Executor inference mỗi worker theo phần CPU của worker đó (tối thiểu 2: 1 thread giữ cho interactive)
+    os.environ.setdefault("INFERENCE_WORKERS", str(max(2, _cpu_count() // workers)))
+    _prepare_metrics_dir()
+
+    from service import main as service
+
+    print(f"🚀 Pre-fork: {workers} worker x {nthread} thread XGBoost, load model ở master...")
+    service.load_model_resources()
+    # Đưa object đã load vào generation cố định: GC của worker không duyệt (và ghi) lên các trang nhớ này
+    gc.collect()
+    gc.freeze()
+
+    config = uvicorn.Config(service.app, host=host, port=port, log_level="info")
+    sock = config.bind_socket()
+    # pid -> thời điểm fork (monotonic)
+    children = {}
+    stopping = False
+    stopped = threading.Event()
+
+    def spawn(keep_metrics: bool = False) -> None:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(config, sock, keep_metrics)
+            finally:
+                os._exit(0)
+        children[pid] = time.monotonic()
+        print(f"✅ Worker {pid} đã khởi động")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        stopped.set()
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(workers):
+        spawn(keep_metrics=index == 0)
+
+    crashes = exit_code = 0
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if stopping:
+            continue
+        # Chết ngay sau khi khởi động (lỗi config, hết RAM...): fork lại liên tục chỉ làm máy quá tải
+        crashes = crashes + 1 if started is not None and time.monotonic() - started < WORKER_MIN_UPTIME else 0
+        if WORKER_MAX_CRASHES and crashes >= WORKER_MAX_CRASHES:
+            print(f"❌ Worker chết ngay sau khi khởi động {crashes} lần liên tiếp, dừng service")
+            stop(None, None)
+            exit_code = 1
+            continue
+        delay = min(WORKER_RESPAWN_MAX_DELAY, 2.0 ** (crashes - 1)) if crashes else 0.0
+        print(f"⚠️ Worker {pid} đã thoát (status {status}), fork worker mới"
+              + (f" sau {delay:.0f}s" if delay else ""))
+        if not stopped.wait(delay):
+            spawn()
+    sock.close()
+    if exit_code:
+        sys.exit(exit_code)
+
 
 if __name__ == "__main__":
     # Hỗ trợ cả development và production
     port = int(os.getenv("PORT", 8001))
     host = os.getenv("HOST", "127.0.0.1")
     reload = os.getenv("RELOAD", "false").lower() == "true"
-    
-    uvicorn.run(
-        "service.main:app",
-        host=host,
-        port=port,
-        reload=reload,  # Tắt reload trong production
-        log_level="info"
-    )
+    workers = _resolve_workers(os.getenv("WORKERS", "1"))
 
+    if workers > 1 and not reload:
+        run_prefork(host, port, workers)
+    else:
+        uvicorn.run(
+            "service.main:app",
+            host=host,
+            port=port,
+            reload=reload,  # Tắt reload trong production
+            log_level="info"
+        )
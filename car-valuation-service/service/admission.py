@@ -0,0 +1,152 @@
+"""
+Admission control + deadline cho các endpoint inference (/predict..., /rpc/...).
+
+Khi quá tải, FastAPI xếp hàng mọi request vào thread pool không giới hạn: latency của mọi người
+tăng lên vài giây, còn client thì đã timeout từ lâu nhưng service vẫn predict cho họ.
+
+- Giới hạn số request inference đang xử lý (max_in_flight): vượt ngưỡng trả 503 + Retry-After
+  ngay trên event loop, không đọc body, không chiếm thread pool. /health, /metrics, /metadata
+  không bị tính / không bị chặn.
+- Deadline mỗi request: mặc định của server (default_deadline_ms) hoặc client tự báo thời gian
+  chờ còn lại qua header X-Request-Timeout-Ms (lấy giá trị nhỏ hơn). Các bước tốn kém gọi
+  check_deadline() trước khi chạy: request đã quá hạn (vd xếp hàng quá lâu trong thread pool)
+  bị dừng với 504 thay vì predict cho client đã bỏ đi.
+
+Đếm in-flight chạy hoàn toàn trên event loop (không cần lock); deadline truyền qua ContextVar
+nên thread pool (run_in_threadpool copy context) cũng đọc được.
+"""
+import asyncio
+import json
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Optional, TypeVar
+
+from service.metrics import Counter
+
+T = TypeVar("T")
+
+INFERENCE_PATH_PREFIXES = ("/predict", "/rpc/")
+DEADLINE_HEADER = b"x-request-timeout-ms"
+
+ADMISSION_REJECTED = Counter(
+    "valuation_admission_rejected_total", "Số request inference bị từ chối (503) vì đang quá tải"
+).labels()
+DEADLINE_EXCEEDED = Counter(
+    "valuation_deadline_exceeded_total", "Số request inference bị dừng (504) vì đã quá deadline"
+).labels()
+
+# Mốc time.monotonic() request phải xong (None = không có deadline)
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Request đã quá deadline: dừng xử lý, main.py trả 504"""
+
+
+def remaining() -> Optional[float]:
+    """Số giây còn lại tới deadline của request hiện tại (None = không có deadline)"""
+    deadline = request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_deadline() -> None:
+    """Gọi trước bước tốn kém: raise DeadlineExceeded nếu request đã quá hạn"""
+    left = remaining()
+    if left is not None and left <= 0:
+        DEADLINE_EXCEEDED.inc()
+        raise DeadlineExceeded()
+
+
+async def within_deadline(awaitable: Awaitable[T]) -> T:
+    """Chờ awaitable tối đa tới deadline; quá hạn thì huỷ việc chờ và raise DeadlineExceeded"""
+    left = remaining()
+    if left is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, max(left, 0))
+    except asyncio.TimeoutError:
+        DEADLINE_EXCEEDED.inc()
+        raise DeadlineExceeded() from None
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int = 0, retry_after: int = 1, default_deadline_ms: float = 0):
+        self.max_in_flight = max(0, int(max_in_flight))
+        self.retry_after = max(1, int(retry_after))
+        self.default_deadline_ms = max(0.0, float(default_deadline_ms))
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.admitted = 0
+
+    def try_acquire(self) -> bool:
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            ADMISSION_REJECTED.inc()
+            return False
+        self.in_flight += 1
+        self.admitted += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return True
+
+    def release(self) -> None:
+        self.in_flight -= 1
+
+    def deadline_for(self, headers) -> Optional[float]:
+        """Deadline (monotonic) từ mặc định của server và header của client, lấy cái sớm hơn"""
+        budgets = [self.default_deadline_ms] if self.default_deadline_ms else []
+        for name, value in headers:
+            if name == DEADLINE_HEADER:
+                try:
+                    budgets.append(max(0.0, float(value)))
+                except ValueError:
+                    pass
+        if not budgets:
+            return None
+        return time.monotonic() + min(budgets) / 1000
+
+    def stats(self) -> dict:
+        return {
+            "enabled": True,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "admitted": self.admitted,
+            "rejected": int(ADMISSION_REJECTED.value),
+            "default_deadline_ms": self.default_deadline_ms,
+            "deadline_exceeded": int(DEADLINE_EXCEEDED.value),
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI middleware thuần: chặn request inference khi đầy, gắn deadline cho request được nhận"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(INFERENCE_PATH_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        if not self.controller.try_acquire():
+            await self._reject(send)
+            return
+        token = request_deadline.set(self.controller.deadline_for(scope["headers"]))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_deadline.reset(token)
+            self.controller.release()
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": "Service đang quá tải, thử lại sau."}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(self.controller.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
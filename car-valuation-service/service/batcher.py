@@ -0,0 +1,108 @@
+"""
+Micro-batching bất đồng bộ cho /predict.
+
+Các request đến trong cùng một cửa sổ ngắn (vd 2 ms) hoặc đủ N xe được gom lại
+thành 1 lần predict vector hoá trên executor riêng; mỗi caller nhận lại đúng
+kết quả của mình. Executor ít thread (mặc định 1) để các worker không tranh CPU
+với nhau và với thread của XGBoost; trong lúc 1 batch đang chạy thì batch kế tiếp
+tự gom thêm request.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence
+
+from service.metrics import Histogram
+
+QUEUE_DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+QUEUE_DEPTH = Histogram(
+    "valuation_microbatch_queue_depth", "Số request đang chờ khi 1 request mới vào micro-batcher",
+    buckets=QUEUE_DEPTH_BUCKETS,
+)
+BATCH_SIZE = Histogram(
+    "valuation_microbatch_batch_size", "Số xe trong mỗi batch micro-batcher gửi vào model",
+    buckets=BATCH_SIZE_BUCKETS,
+)
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        predict_fn: Callable[[List[dict]], Sequence[float]],
+        max_wait_ms: float = 2.0,
+        max_batch_size: int = 64,
+        workers: int = 1,
+    ):
+        self.predict_fn = predict_fn
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_batch_size = max(1, int(max_batch_size))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="microbatch")
+        self._pending: List[tuple] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Số request đang chờ kết quả (chưa gửi + đang chạy)
+        self._waiting = 0
+        self.batches = 0
+        self.errors = 0
+
+    async def submit(self, row: dict) -> float:
+        """Đưa 1 dòng vào batch hiện tại và chờ giá dự đoán của nó"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        QUEUE_DEPTH.observe(self._waiting)
+        self._waiting += 1
+        self._pending.append((row, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        try:
+            return await future
+        finally:
+            self._waiting -= 1
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        self.batches += 1
+        BATCH_SIZE.observe(len(batch))
+
+        loop = asyncio.get_running_loop()
+        task = loop.run_in_executor(self._executor, self.predict_fn, [row for row, _ in batch])
+        task.add_done_callback(lambda done: self._distribute(batch, done))
+
+    def _distribute(self, batch: List[tuple], done: asyncio.Future) -> None:
+        error = done.exception()
+        if error is not None:
+            self.errors += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), price in zip(batch, done.result()):
+            # Caller có thể đã huỷ (client ngắt kết nối)
+            if not future.done():
+                future.set_result(float(price))
+
+    def stats(self) -> dict:
+        return {
+            "enabled": True,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_batch_size": self.max_batch_size,
+            "batches": self.batches,
+            "errors": self.errors,
+            "waiting": self._waiting,
+            "queue_depth": QUEUE_DEPTH.snapshot(),
+            "batch_size": BATCH_SIZE.snapshot(),
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
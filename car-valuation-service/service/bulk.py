@@ -0,0 +1,134 @@
+"""
+Đọc / ghi dữ liệu bulk dạng NDJSON hoặc CSV theo từng dòng (chỉ dùng thư viện chuẩn, chạy được ở image lean).
+
+- split_lines: tách body request (luồng bytes) thành từng dòng, không giữ cả body trong bộ nhớ.
+- BulkParser: 1 dòng -> dict trường của CarInput (CSV: dòng đầu là header, không hỗ trợ xuống
+  dòng bên trong ô có ngoặc kép); mọi dòng lỗi (JSON hỏng / lồng quá sâu, CSV hỏng, UTF-8 không
+  hợp lệ) -> ValueError để báo ngay tại dòng đó.
+- BulkWriter: ghi kết quả (hoặc lỗi) từng dòng theo đúng định dạng của input.
+"""
+import csv
+import io
+import json
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+
+from service.metrics import Counter
+
+# Dòng dài hơn mức này bị báo lỗi và bỏ qua (chặn body không có xuống dòng chiếm hết RAM)
+MAX_LINE_BYTES = 64 * 1024
+# Cột kết quả khi output là CSV
+CSV_OUTPUT_COLUMNS = ("line", "id", "price_estimate", "price_min", "price_max", "confidence_level", "error")
+
+BULK_ROWS = Counter("valuation_bulk_rows_total", "Số dòng đã xử lý qua /predict/stream", ("result",))
+BULK_ROWS_OK = BULK_ROWS.labels("ok")
+BULK_ROWS_ERROR = BULK_ROWS.labels("error")
+
+
+def detect_format(content_type: Optional[str]) -> str:
+    """text/csv -> "csv", còn lại (application/x-ndjson, application/jsonl...) -> "ndjson" """
+    return "csv" if content_type and "csv" in content_type.lower() else "ndjson"
+
+
+async def split_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """(số dòng bắt đầu từ 1, nội dung) cho từng dòng; nội dung None = dòng quá dài"""
+    buffer = b""
+    line_no = 0
+    skipping = False
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if skipping:
+                skipping = False
+                yield line_no, None
+            else:
+                yield line_no, line
+        if len(buffer) > MAX_LINE_BYTES:
+            # Bỏ phần đã đọc của dòng quá dài, báo lỗi khi gặp hết dòng
+            buffer, skipping = b"", True
+    if buffer or skipping:
+        yield line_no + 1, None if skipping else buffer
+
+
+class BulkParser:
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self.header: Optional[List[str]] = None
+
+    def parse(self, line: bytes, first: bool = False) -> Optional[dict]:
+        """dict trường input (kể cả "id" nếu có), None với dòng trống / header"""
+        text = line.decode("utf-8")
+        if first:
+            text = text.lstrip("\ufeff")
+        text = text.rstrip("\r")
+        if not text.strip():
+            return None
+
+        if self.fmt == "ndjson":
+            try:
+                record = json.loads(text)
+            except RecursionError:
+                # vd "[[[[..." lồng hàng chục nghìn tầng: chỉ hỏng dòng này, không hỏng cả upload
+                raise ValueError("JSON lồng nhau quá sâu") from None
+            if not isinstance(record, dict):
+                raise ValueError("Mỗi dòng NDJSON phải là 1 object JSON")
+            return record
+
+        try:
+            values = next(csv.reader([text]))
+        except csv.Error as e:
+            raise ValueError(f"Dòng CSV không hợp lệ: {e}") from None
+        if self.header is None:
+            self.header = [name.strip() for name in values]
+            if "brand" not in self.header:
+                raise ValueError("Header CSV phải có các cột của CarInput (brand, model, year, mileage_km...)")
+            return None
+        if len(values) != len(self.header):
+            raise ValueError(f"Dòng có {len(values)} cột, header có {len(self.header)} cột")
+        # Ô trống = không có giá trị (trường tuỳ chọn -> None, trường bắt buộc -> lỗi validate)
+        return {name: value for name, value in zip(self.header, values) if value != ""}
+
+
+class BulkWriter:
+    """Gom kết quả của 1 chunk thành bytes để ghi 1 lần"""
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self.rows = 0
+        self.errors = 0
+
+    def header(self) -> bytes:
+        if self.fmt != "csv":
+            return b""
+        return (",".join(CSV_OUTPUT_COLUMNS) + "\r\n").encode("utf-8")
+
+    def encode(self, results: Iterable[Tuple[int, object, Optional[dict], Optional[str]]]) -> bytes:
+        """results: [(số dòng, id, kết quả dict hoặc None, lỗi hoặc None)]"""
+        out = io.StringIO()
+        writer = csv.writer(out) if self.fmt == "csv" else None
+        for line_no, record_id, prediction, error in results:
+            self.rows += 1
+            if error is not None:
+                self.errors += 1
+                BULK_ROWS_ERROR.inc()
+            else:
+                BULK_ROWS_OK.inc()
+            if writer is not None:
+                prediction = prediction or {}
+                writer.writerow([
+                    line_no, "" if record_id is None else record_id,
+                    prediction.get("price_estimate", ""), prediction.get("price_min", ""),
+                    prediction.get("price_max", ""), prediction.get("confidence_level", ""), error or "",
+                ])
+                continue
+            item = {"line": line_no}
+            if record_id is not None:
+                item["id"] = record_id
+            if error is not None:
+                item["error"] = error
+            else:
+                item.update(prediction)
+            out.write(json.dumps(item, ensure_ascii=False, separators=(",", ":")))
+            out.write("\n")
+        return out.getvalue().encode("utf-8")
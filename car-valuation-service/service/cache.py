@@ -0,0 +1,100 @@
+"""
+Cache kết quả dự đoán trong bộ nhớ (LRU + TTL tùy chọn).
+
+Key là tuple các trường đã chuẩn hoá mà model thực sự dùng
+(make, model, year, version, color, mileage), value là giá dự đoán thô.
+Cache gắn với phiên bản model đang load: khi load artifact khác thì toàn bộ
+cache bị xoá để không trả về giá của model cũ.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class PredictionCache:
+    """Cache LRU có giới hạn kích thước, thread-safe (FastAPI chạy sync endpoint trên thread pool)"""
+
+    def __init__(self, max_size: int = 4096, ttl_seconds: float = 0):
+        self.max_size = max(0, int(max_size))
+        # ttl_seconds <= 0 nghĩa là không hết hạn
+        self.ttl_seconds = float(ttl_seconds)
+        self.model_version: Optional[str] = None
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, key: Hashable, model_version: Optional[str] = None) -> Optional[float]:
+        if not self.enabled:
+            return None
+        # Request còn chạy trên model khác với model cache đang gắn (lúc swap) -> không dùng giá của model kia
+        if model_version is not None and model_version != self.model_version:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: float, model_version: Optional[str] = None) -> None:
+        if not self.enabled:
+            return
+        # Giá tính bằng model cũ hoàn thành sau khi đã swap model -> bỏ qua
+        if model_version is not None and model_version != self.model_version:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.invalidations += 1
+
+    def bind_model(self, model_version: str) -> None:
+        """Gắn cache với phiên bản model; xoá cache nếu phiên bản thay đổi"""
+        if model_version != self.model_version:
+            if self.model_version is not None:
+                self.clear()
+            self.model_version = model_version
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._data)
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": size,
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "model_version": self.model_version,
+        }
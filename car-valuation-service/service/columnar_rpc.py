@@ -0,0 +1,143 @@
+"""
+Định dạng nhị phân dạng cột cho gọi nội bộ server -> service (POST /rpc/predict), chỉ dùng
+thư viện chuẩn + numpy. Mọi số nguyên / số thực là little-endian.
+
+Request (Content-Type: application/x-car-columns):
+    b"CAR1" | uint32 n_rows
+    4 cột text theo thứ tự brand, model, version, color, mỗi cột mã hoá từ điển:
+        uint32 n_values | n_values x (uint16 số byte + UTF-8) | uint32[n_rows] chỉ số trong từ điển
+        (chuỗi rỗng ở version / color = không có)
+    int32[n_rows] year | int32[n_rows] mileage_km
+
+Response (Content-Type: application/x-car-prices):
+    b"CAP1" | uint32 n_rows | float32 mae | uint16 số byte + model version (ASCII)
+    float32[n_rows] price_estimate (triệu VND, NaN = dòng lỗi)
+    uint32 n_errors | n_errors x (uint32 chỉ số dòng | uint16 số byte + thông báo UTF-8)
+
+Khoảng giá phía client: price ± mae x 1.5 (giống price_min / price_max của API JSON).
+Cột số đọc thẳng bằng np.frombuffer, cột text chỉ decode mỗi giá trị khác nhau 1 lần.
+"""
+import struct
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+from service.metrics import Counter
+
+REQUEST_MEDIA_TYPE = "application/x-car-columns"
+RESPONSE_MEDIA_TYPE = "application/x-car-prices"
+REQUEST_MAGIC = b"CAR1"
+RESPONSE_MAGIC = b"CAP1"
+# Trường text của CarInput theo thứ tự trong request
+TEXT_FIELDS = ("brand", "model", "version", "color")
+
+RPC_ROWS = Counter("valuation_rpc_rows_total", "Số dòng đã xử lý qua /rpc/predict", ("result",))
+RPC_ROWS_OK = RPC_ROWS.labels("ok")
+RPC_ROWS_ERROR = RPC_ROWS.labels("error")
+
+
+class ColumnarBatch(NamedTuple):
+    n_rows: int
+    # field -> (từ điển giá trị, chỉ số uint32 cho từng dòng)
+    text: Dict[str, Tuple[List[str], np.ndarray]]
+    year: np.ndarray
+    mileage_km: np.ndarray
+
+
+class _Reader:
+    def __init__(self, body: bytes):
+        self.body = memoryview(body)
+        self.pos = 0
+
+    def take(self, size: int) -> memoryview:
+        end = self.pos + size
+        if end > len(self.body):
+            raise ValueError(f"Body bị cắt cụt: cần {end} byte, chỉ có {len(self.body)}")
+        chunk = self.body[self.pos:end]
+        self.pos = end
+        return chunk
+
+    def unpack(self, fmt: str):
+        return struct.unpack(fmt, self.take(struct.calcsize(fmt)))
+
+    def string(self) -> str:
+        (size,) = self.unpack("<H")
+        return str(self.take(size), "utf-8")
+
+    def array(self, dtype: str, count: int) -> np.ndarray:
+        dtype = np.dtype(dtype)
+        return np.frombuffer(self.take(dtype.itemsize * count), dtype=dtype)
+
+
+def _pack_string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    if len(data) > 0xFFFF:
+        raise ValueError(f"Chuỗi dài quá {0xFFFF} byte")
+    return struct.pack("<H", len(data)) + data
+
+
+def decode_request(body: bytes) -> ColumnarBatch:
+    """Body -> ColumnarBatch; body sai định dạng -> ValueError"""
+    reader = _Reader(body)
+    if bytes(reader.take(4)) != REQUEST_MAGIC:
+        raise ValueError(f"Body không bắt đầu bằng {REQUEST_MAGIC!r}")
+    (n_rows,) = reader.unpack("<I")
+
+    text = {}
+    for field in TEXT_FIELDS:
+        (n_values,) = reader.unpack("<I")
+        values = [reader.string() for _ in range(n_values)]
+        codes = reader.array("<u4", n_rows)
+        if n_rows and int(codes.max()) >= n_values:
+            raise ValueError(f"Cột {field}: chỉ số vượt quá từ điển {n_values} giá trị")
+        text[field] = (values, codes)
+    year = reader.array("<i4", n_rows)
+    mileage_km = reader.array("<i4", n_rows)
+    if reader.pos != len(reader.body):
+        raise ValueError(f"Thừa {len(reader.body) - reader.pos} byte cuối body")
+    return ColumnarBatch(n_rows, text, year, mileage_km)
+
+
+def encode_request(cars: Sequence[dict]) -> bytes:
+    """Danh sách dict trường CarInput -> body request (client tham khảo, dùng trong benchmark)"""
+    parts = [REQUEST_MAGIC, struct.pack("<I", len(cars))]
+    for field in TEXT_FIELDS:
+        index: Dict[str, int] = {}
+        codes = np.fromiter(
+            (index.setdefault(car.get(field) or "", len(index)) for car in cars), dtype="<u4", count=len(cars)
+        )
+        parts.append(struct.pack("<I", len(index)))
+        parts.extend(_pack_string(value) for value in index)
+        parts.append(codes.tobytes())
+    parts.append(np.array([car["year"] for car in cars], dtype="<i4").tobytes())
+    parts.append(np.array([car["mileage_km"] for car in cars], dtype="<i4").tobytes())
+    return b"".join(parts)
+
+
+def encode_response(prices: np.ndarray, errors: Dict[int, str], mae: float, version: str) -> bytes:
+    RPC_ROWS_OK.inc(len(prices) - len(errors))
+    RPC_ROWS_ERROR.inc(len(errors))
+    parts = [
+        RESPONSE_MAGIC, struct.pack("<If", len(prices), mae), _pack_string(version),
+        np.asarray(prices, dtype="<f4").tobytes(), struct.pack("<I", len(errors)),
+    ]
+    for row, message in sorted(errors.items()):
+        parts.append(struct.pack("<I", row))
+        parts.append(_pack_string(message))
+    return b"".join(parts)
+
+
+def decode_response(body: bytes) -> Tuple[np.ndarray, Dict[int, str], float, str]:
+    """Body response -> (giá float32, {dòng: lỗi}, mae, model version)"""
+    reader = _Reader(body)
+    if bytes(reader.take(4)) != RESPONSE_MAGIC:
+        raise ValueError(f"Response không bắt đầu bằng {RESPONSE_MAGIC!r}")
+    n_rows, mae = reader.unpack("<If")
+    version = reader.string()
+    prices = reader.array("<f4", n_rows)
+    (n_errors,) = reader.unpack("<I")
+    errors = {}
+    for _ in range(n_errors):
+        (row,) = reader.unpack("<I")
+        errors[row] = reader.string()
+    return prices, errors, mae, version
@@ -0,0 +1,250 @@
+"""
+Tầng cache thứ 2 trên đĩa (SQLite, file local trong container) cho giá dự đoán.
+
+Cache trong RAM (service/cache.py) mất khi restart và không chia sẻ giữa các worker; tầng này
+dùng chung 1 file SQLite (WAL: nhiều process đọc song song, 1 process ghi tại 1 thời điểm) nên
+worker này dùng được giá worker khác đã tính và container restart vẫn còn cache nóng.
+
+- Key = model version (hash artifact) + input đã chuẩn hoá, nối bằng ký tự \x1f: model khác không
+  bao giờ đọc nhầm giá của model cũ; bind_model xoá entry của version khác. Bảng WITHOUT ROWID
+  khoá chính TEXT: mỗi lần tra chỉ đi 1 B-tree.
+- Ghi bất đồng bộ: put_many chỉ đưa vào hàng đợi, thread ghi riêng của từng process gom lại ghi
+  1 transaction, request không bao giờ chờ ghi đĩa / chờ lock ghi của worker khác.
+- Giới hạn số entry: vượt max_entries thì xoá entry ghi cũ nhất (ghi lại 1 key = làm mới key đó,
+  đọc không làm mới để đường đọc không phải ghi).
+- Mỗi process 1 connection đọc dùng chung giữa các thread (tra 1 lần chỉ vài chục µs), mở + tạo
+  schema lúc khởi động (connect) chứ không ở request đầu tiên, không dùng connection qua fork (pre-fork).
+  Busy timeout đọc ngắn (READ_TIMEOUT): WAL hiếm khi chặn đọc, bị chặn thì coi như cache miss.
+- Lỗi SQLite (đĩa đầy, file hỏng, lock quá lâu) chỉ được đếm + log, request vẫn chạy như cache miss.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Hashable, List, Optional, Sequence
+
+from service.metrics import Counter
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    key TEXT PRIMARY KEY,
+    model_version TEXT NOT NULL,
+    price REAL NOT NULL,
+    written_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS predictions_written_at ON predictions (written_at);
+"""
+KEY_SEPARATOR = "\x1f"
+# Số key tối đa trong 1 câu SELECT ... IN (...) (SQLite cũ giới hạn 999 biến)
+MAX_KEYS_PER_QUERY = 500
+# Kiểm tra số entry để xoá bớt sau mỗi ngần này lần ghi
+EVICT_CHECK_EVERY = 1000
+# Số lần put_many tối đa chờ ghi; đĩa chậm / bị lock lâu hơn thế thì bỏ bớt giá mới (chỉ là cache)
+MAX_PENDING_WRITES = 10_000
+# Busy timeout (giây) của connection đọc / ghi
+READ_TIMEOUT = 0.2
+WRITE_TIMEOUT = 5.0
+
+DISK_CACHE_LOOKUPS = Counter("valuation_disk_cache_lookups_total", "Số key tra cache đĩa", ("result",))
+DISK_CACHE_HITS = DISK_CACHE_LOOKUPS.labels("hit")
+DISK_CACHE_MISSES = DISK_CACHE_LOOKUPS.labels("miss")
+# Counter không nhãn: giữ child để đọc .value cho stats()
+DISK_CACHE_WRITES = Counter("valuation_disk_cache_writes_total", "Số giá đã ghi xuống cache đĩa").labels()
+DISK_CACHE_EVICTIONS = Counter(
+    "valuation_disk_cache_evictions_total", "Số entry cache đĩa bị xoá do vượt giới hạn"
+).labels()
+DISK_CACHE_DROPPED = Counter(
+    "valuation_disk_cache_dropped_total", "Số giá không ghi xuống cache đĩa vì hàng đợi ghi đầy"
+).labels()
+DISK_CACHE_ERRORS = Counter("valuation_disk_cache_errors_total", "Số lỗi SQLite khi đọc / ghi cache đĩa").labels()
+
+
+def encode_key(key: tuple, model_version: str) -> str:
+    """Key cache (tuple các trường đã chuẩn hoá) -> chuỗi ổn định giữa các process"""
+    return KEY_SEPARATOR.join((model_version, *map(str, key)))
+
+
+class DiskCache:
+    def __init__(self, path: Path, max_entries: int = 200_000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max(1, int(max_entries))
+        self.model_version: Optional[str] = None
+        # Connection đọc của process hiện tại (mở lại sau fork)
+        self._reader: Optional[sqlite3.Connection] = None
+        self._reader_pid: Optional[int] = None
+        self._reader_lock = threading.Lock()
+        # Hàng đợi + thread ghi của process hiện tại (tạo lại sau fork)
+        self._queue: Optional[queue.Queue] = None
+        self._writer: Optional[threading.Thread] = None
+        self._writer_pid: Optional[int] = None
+        self._writer_lock = threading.Lock()
+        self._since_evict_check = 0
+
+    def _open(self, timeout: float = WRITE_TIMEOUT) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), timeout=timeout, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def connect(self) -> None:
+        """Mở connection đọc của process hiện tại (gọi lúc khởi động từng worker)"""
+        with self._reader_lock:
+            self._connect_reader()
+
+    def _connect_reader(self) -> sqlite3.Connection:
+        # Gọi khi đang giữ _reader_lock
+        if self._reader_pid != os.getpid():
+            try:
+                self._reader = self._open(READ_TIMEOUT)
+                self._reader_pid = os.getpid()
+            except sqlite3.Error as e:
+                self._reader = None
+                self._error("mở connection đọc", e)
+        return self._reader
+
+    def _error(self, action: str, error: Exception) -> None:
+        DISK_CACHE_ERRORS.inc()
+        print(f"⚠️ Lỗi cache đĩa khi {action}: {error}")
+
+    def bind_model(self, model_version: str) -> None:
+        """Gắn với phiên bản model; xoá entry của các version khác (restart cùng model giữ nguyên cache)"""
+        if model_version == self.model_version:
+            return
+        self.model_version = model_version
+        try:
+            # Connection tạm: process master pre-fork không giữ connection nào qua fork
+            with closing(self._open()) as conn:
+                conn.execute("DELETE FROM predictions WHERE model_version != ?", (model_version,))
+        except sqlite3.Error as e:
+            self._error("xoá entry của model cũ", e)
+
+    def get_many(self, keys: Sequence[Hashable], model_version: str) -> List[Optional[float]]:
+        """Giá theo đúng thứ tự keys (None = không có), tra tối đa MAX_KEYS_PER_QUERY key mỗi câu"""
+        encoded = [encode_key(key, model_version) for key in keys]
+        found = {}
+        with self._reader_lock:
+            conn = self._connect_reader()
+            if conn is not None:
+                try:
+                    for start in range(0, len(encoded), MAX_KEYS_PER_QUERY):
+                        chunk = encoded[start:start + MAX_KEYS_PER_QUERY]
+                        found.update(conn.execute(
+                            f"SELECT key, price FROM predictions WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                        ).fetchall())
+                except sqlite3.Error as e:
+                    self._error("đọc", e)
+        DISK_CACHE_HITS.inc(len(found))
+        DISK_CACHE_MISSES.inc(len(encoded) - len(found))
+        return [found.get(key) for key in encoded]
+
+    def put_many(self, keys: Sequence[Hashable], prices: Sequence[float], model_version: str) -> None:
+        """Đưa giá vào hàng đợi ghi (không chờ); giá của model đã bị swap ra thì bỏ qua"""
+        if model_version != self.model_version or not keys:
+            return
+        now = time.time()
+        rows = [(encode_key(key, model_version), model_version, float(price), now) for key, price in zip(keys, prices)]
+        try:
+            self._ensure_writer().put_nowait(rows)
+        except queue.Full:
+            DISK_CACHE_DROPPED.inc(len(rows))
+
+    def _ensure_writer(self) -> queue.Queue:
+        if self._writer_pid != os.getpid():
+            with self._writer_lock:
+                if self._writer_pid != os.getpid():
+                    self._queue = queue.Queue(MAX_PENDING_WRITES)
+                    self._writer = threading.Thread(
+                        target=self._write_loop, args=(self._queue,), name="disk-cache-writer", daemon=True
+                    )
+                    self._writer.start()
+                    self._writer_pid = os.getpid()
+        return self._queue
+
+    def _write_loop(self, items: queue.Queue) -> None:
+        conn = None
+        stop = False
+        while not stop:
+            batches = [items.get()]
+            # Gom mọi thứ đang chờ vào 1 transaction
+            while True:
+                try:
+                    batches.append(items.get_nowait())
+                except queue.Empty:
+                    break
+            rows = []
+            for batch in batches:
+                if batch is None:
+                    stop = True
+                else:
+                    rows.extend(batch)
+            try:
+                if rows:
+                    if conn is None:
+                        conn = self._open()
+                    with conn:
+                        conn.execute("BEGIN IMMEDIATE")
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO predictions (key, model_version, price, written_at) "
+                            "VALUES (?, ?, ?, ?)", rows
+                        )
+                    DISK_CACHE_WRITES.inc(len(rows))
+                    self._since_evict_check += len(rows)
+                    if self._since_evict_check >= EVICT_CHECK_EVERY:
+                        self._since_evict_check = 0
+                        self._evict(conn)
+            except sqlite3.Error as e:
+                self._error("ghi", e)
+            finally:
+                for _ in batches:
+                    items.task_done()
+        if conn is not None:
+            conn.close()
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        (count,) = conn.execute("SELECT count(*) FROM predictions").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM predictions WHERE key IN "
+                "(SELECT key FROM predictions ORDER BY written_at LIMIT ?)", (excess,)
+            )
+            DISK_CACHE_EVICTIONS.inc(excess)
+
+    def flush(self) -> None:
+        """Chờ mọi giá trong hàng đợi của process này được ghi xong"""
+        if self._writer_pid == os.getpid():
+            self._queue.join()
+
+    def close(self) -> None:
+        """Ghi nốt hàng đợi rồi dừng thread ghi, đóng connection đọc (gọi lúc shutdown)"""
+        if self._writer_pid == os.getpid():
+            self._queue.put(None, timeout=5)
+            self._writer.join(timeout=5)
+            self._writer_pid = None
+        with self._reader_lock:
+            if self._reader_pid == os.getpid():
+                self._reader.close()
+                self._reader, self._reader_pid = None, None
+
+    def stats(self) -> dict:
+        hits, misses = DISK_CACHE_HITS.value, DISK_CACHE_MISSES.value
+        lookups = hits + misses
+        return {
+            "enabled": True,
+            "path": str(self.path),
+            "max_entries": self.max_entries,
+            "hits": int(hits),
+            "misses": int(misses),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "writes": int(DISK_CACHE_WRITES.value),
+            "evictions": int(DISK_CACHE_EVICTIONS.value),
+            "dropped": int(DISK_CACHE_DROPPED.value),
+            "errors": int(DISK_CACHE_ERRORS.value),
+            "pending_writes": self._queue.qsize() if self._writer_pid == os.getpid() else 0,
+            "model_version": self.model_version,
+        }
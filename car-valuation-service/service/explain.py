@@ -0,0 +1,55 @@
+"""
+Giải thích giá dự đoán bằng TreeSHAP có sẵn trong XGBoost (booster.predict(pred_contribs=True)).
+
+Mỗi dòng nhận 1 contribution cho từng cột feature (261 cột sau one-hot) + bias (giá trung bình
+của model). Các cột one-hot được cộng gộp về cột input gốc bằng 1 phép nhân ma trận
+(contribution SHAP cộng tính được), nên với mỗi xe:
+    base_value + tổng contribution 6 cột (make, model, year, version, color, mileage) = giá model
+(sai lệch nhỏ do cộng float32).
+
+Chỉ cần booster + CompiledEncoder: dùng được với backend pipeline / lean, không với onnx.
+TreeSHAP chính xác tốn hơn predict thường nhiều lần (~O(số cây x số lá x độ sâu²) mỗi dòng),
+nên kết quả được cache theo input đã chuẩn hoá ở tầng service.
+"""
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from service.fast_encoder import CompiledEncoder, FastPredictor
+
+
+class ContributionExplainer:
+    """Contribution theo từng cột input gốc từ booster XGBoost"""
+
+    def __init__(self, encoder: CompiledEncoder, booster, iteration_range=(0, 0)):
+        self.encoder = encoder
+        self.booster = booster
+        self.iteration_range = iteration_range
+        # Thứ tự cột như lúc train: numeric trước, category sau (theo offset trong ma trận feature)
+        self.columns: List[str] = [column for column, *_ in encoder._numeric] + [
+            column for column, *_ in encoder._categorical
+        ]
+        # groups[feature, cột gốc] = 1: contribution (n, n_features) @ groups -> (n, số cột gốc)
+        self._groups = np.zeros((encoder.n_features, len(self.columns)), dtype=np.float64)
+        for i, (column, offset, *_) in enumerate(encoder._numeric):
+            self._groups[offset, i] = 1.0
+        for i, (column, _, index) in enumerate(encoder._categorical, start=len(encoder._numeric)):
+            self._groups[list(index.values()), i] = 1.0
+
+    @classmethod
+    def from_predictor(cls, predictor: FastPredictor) -> "ContributionExplainer":
+        return cls(predictor.encoder, predictor.booster, predictor.iteration_range)
+
+    def explain_matrix(self, matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Ma trận feature -> (contribution (n, số cột gốc), base_value (n,)), đơn vị như giá"""
+        import xgboost as xgb
+
+        contribs = self.booster.predict(
+            xgb.DMatrix(matrix, missing=np.nan), pred_contribs=True,
+            iteration_range=self.iteration_range, validate_features=False,
+        ).astype(np.float64)
+        # Cột cuối là bias
+        return contribs[:, :-1] @ self._groups, contribs[:, -1]
+
+    def explain_rows(self, rows: Sequence[dict]) -> Tuple[np.ndarray, np.ndarray]:
+        return self.explain_matrix(self.encoder.encode_rows(rows))
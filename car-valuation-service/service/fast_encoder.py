@@ -0,0 +1,267 @@
+"""
+Fast-path encoder cho inference không cần pandas.
+
+Đọc các thống kê đã học của ColumnTransformer trong Pipeline
+(median của SimpleImputer, mean/scale của StandardScaler, categories của OneHotEncoder)
+rồi map trực tiếp 1 dòng input -> vector feature của model bằng dict lookup
+và buffer numpy cấp phát sẵn. Kết quả phải giống hệt (bit-identical)
+với preprocessor.transform + regressor.predict của Pipeline gốc.
+
+Encoder có thể xuất ra spec JSON nhỏ (kèm booster ở định dạng native UBJ/JSON của
+XGBoost) để service chạy ở chế độ "lean" không cần pandas/sklearn/joblib.
+"""
+import json
+import threading
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+
+# Tăng khi cấu trúc encoder_spec.json thay đổi
+SPEC_FORMAT_VERSION = 1
+
+
+def _is_missing(value) -> bool:
+    return value is None or value != value  # NaN != NaN
+
+
+class CompiledEncoder:
+    """Encoder đã "biên dịch" từ ColumnTransformer đã fit"""
+
+    def __init__(self, numeric: List[tuple], categorical: List[tuple], n_features: int):
+        # numeric: [(column, offset, fill_value, mean, scale)]
+        # categorical: [(column, fill_value, {category: offset})]
+        self._numeric = numeric
+        self._categorical = categorical
+        self.n_features = n_features
+        # Mỗi thread một buffer riêng (endpoint sync chạy song song trên thread pool)
+        self._local = threading.local()
+
+    @classmethod
+    def from_pipeline(cls, pipeline) -> "CompiledEncoder":
+        """Dựng encoder từ Pipeline(preprocessor=ColumnTransformer, regressor=...) đã fit"""
+        preprocessor = pipeline.named_steps['preprocessor']
+        if getattr(preprocessor, 'remainder', 'drop') != 'drop':
+            raise ValueError("Chỉ hỗ trợ ColumnTransformer với remainder='drop'")
+
+        numeric, categorical = [], []
+        offset = 0
+        for name, transformer, columns in preprocessor.transformers_:
+            if name == 'remainder' or transformer == 'drop':
+                continue
+            steps = dict(transformer.named_steps)
+            imputer = steps.get('imputer')
+
+            if 'scaler' in steps:
+                scaler = steps['scaler']
+                means = scaler.mean_ if scaler.with_mean else np.zeros(len(columns))
+                scales = scaler.scale_ if scaler.with_std else np.ones(len(columns))
+                for i, column in enumerate(columns):
+                    numeric.append((column, offset, float(imputer.statistics_[i]),
+                                    float(means[i]), float(scales[i])))
+                    offset += 1
+
+            elif 'onehot' in steps:
+                onehot = steps['onehot']
+                if onehot.drop is not None or getattr(onehot, 'infrequent_categories_', None):
+                    raise ValueError("Chỉ hỗ trợ OneHotEncoder không drop / không gộp infrequent")
+                for i, column in enumerate(columns):
+                    index = {}
+                    for category in onehot.categories_[i]:
+                        index[category] = offset
+                        offset += 1
+                    categorical.append((column, imputer.fill_value, index))
+
+            else:
+                raise ValueError(f"Không hỗ trợ transformer '{name}': {transformer}")
+
+        return cls(numeric, categorical, offset)
+
+    def to_spec(self) -> dict:
+        """Xuất encoder thành dict thuần JSON (float giữ nguyên giá trị khi round-trip)"""
+        return {
+            "n_features": self.n_features,
+            "numeric": [
+                {"column": column, "offset": offset, "fill_value": fill_value, "mean": mean, "scale": scale}
+                for column, offset, fill_value, mean, scale in self._numeric
+            ],
+            "categorical": [
+                {"column": column, "fill_value": fill_value,
+                 "offset": min(index.values()) if index else 0, "categories": list(index)}
+                for column, fill_value, index in self._categorical
+            ],
+        }
+
+    @classmethod
+    def from_spec(cls, spec: dict) -> "CompiledEncoder":
+        numeric = [
+            (item["column"], item["offset"], item["fill_value"], item["mean"], item["scale"])
+            for item in spec["numeric"]
+        ]
+        categorical = [
+            (item["column"], item["fill_value"],
+             {category: item["offset"] + i for i, category in enumerate(item["categories"])})
+            for item in spec["categorical"]
+        ]
+        return cls(numeric, categorical, spec["n_features"])
+
+    @property
+    def categories(self) -> Dict[str, List[str]]:
+        return {column: list(index) for column, _, index in self._categorical}
+
+    def _fill(self, out: np.ndarray, row: dict) -> None:
+        for column, offset, fill_value, mean, scale in self._numeric:
+            value = row.get(column)
+            if _is_missing(value):
+                value = fill_value
+            # Cùng thứ tự phép tính float64 như StandardScaler: (x - mean) / scale
+            out[offset] = (float(value) - mean) / scale
+        for column, fill_value, index in self._categorical:
+            value = row.get(column)
+            if _is_missing(value):
+                value = fill_value
+            # handle_unknown='ignore': category lạ -> toàn 0
+            offset = index.get(value)
+            if offset is not None:
+                out[offset] = 1.0
+
+    def encode_one(self, row: dict) -> np.ndarray:
+        """Encode 1 dòng vào buffer dùng lại của thread hiện tại, shape (1, n_features)"""
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = np.zeros((1, self.n_features), dtype=np.float64)
+        else:
+            buffer.fill(0.0)
+        self._fill(buffer[0], row)
+        return buffer
+
+    def encode_columns(self, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Encode dữ liệu dạng cột (cột số: float, NaN = thiếu; cột category: mảng object) bằng
+        phép toán vector; cùng phép tính float64 với _fill nên kết quả giống hệt encode_rows.
+        """
+        n_rows = len(next(iter(columns.values())))
+        matrix = np.zeros((n_rows, self.n_features), dtype=np.float64)
+        for column, offset, fill_value, mean, scale in self._numeric:
+            values = np.asarray(columns[column], dtype=np.float64)
+            values = np.where(np.isnan(values), fill_value, values)
+            matrix[:, offset] = (values - mean) / scale
+        row_index = np.arange(n_rows)
+        for column, fill_value, index in self._categorical:
+            offsets = np.fromiter(
+                (index.get(fill_value if _is_missing(value) else value, -1) for value in columns[column]),
+                dtype=np.int64, count=n_rows,
+            )
+            known = offsets >= 0
+            matrix[row_index[known], offsets[known]] = 1.0
+        return matrix
+
+    def encode_rows(self, rows: Sequence[dict]) -> np.ndarray:
+        """Encode nhiều dòng thành ma trận (n_rows, n_features)"""
+        matrix = np.zeros((len(rows), self.n_features), dtype=np.float64)
+        for i, row in enumerate(rows):
+            self._fill(matrix[i], row)
+        return matrix
+
+
+class FastPredictor:
+    """Encoder + XGBoost Booster, gọi inplace_predict trực tiếp trên numpy"""
+
+    def __init__(self, encoder: CompiledEncoder, booster, iteration_range=(0, 0), booster_path: Path = None):
+        self.encoder = encoder
+        self.booster = booster
+        self.iteration_range = iteration_range
+        # File booster native nếu load từ spec (dùng để tính version của model)
+        self.booster_path = booster_path
+
+    @classmethod
+    def from_pipeline(cls, pipeline) -> "FastPredictor":
+        regressor = pipeline.named_steps['regressor']
+        if not hasattr(regressor, 'get_booster'):
+            raise ValueError(f"Regressor không phải XGBoost: {type(regressor).__name__}")
+        # Giống XGBRegressor.predict: nếu có early stopping thì chỉ dùng tới best_iteration
+        try:
+            iteration_range = (0, regressor.best_iteration + 1)
+        except AttributeError:
+            iteration_range = (0, 0)
+        return cls(CompiledEncoder.from_pipeline(pipeline), regressor.get_booster(), iteration_range)
+
+    def save(self, booster_path: Path, spec_path: Path, extra: dict = None) -> None:
+        """Ghi booster (định dạng native theo đuôi file .ubj/.json) và encoder spec"""
+        self.booster.save_model(str(booster_path))
+        spec = {
+            "format_version": SPEC_FORMAT_VERSION,
+            "booster_file": Path(booster_path).name,
+            "iteration_range": list(self.iteration_range),
+            "encoder": self.encoder.to_spec(),
+            **(extra or {}),
+        }
+        with open(spec_path, 'w', encoding='utf-8') as f:
+            json.dump(spec, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, spec_path: Path, nthread: int = 1) -> "FastPredictor":
+        """Load chỉ từ encoder spec + booster native, không cần pandas/sklearn/joblib"""
+        import xgboost as xgb
+
+        with open(spec_path, 'r', encoding='utf-8') as f:
+            spec = json.load(f)
+        if spec.get("format_version") != SPEC_FORMAT_VERSION:
+            raise ValueError(f"encoder spec format {spec.get('format_version')} không được hỗ trợ")
+
+        booster_path = Path(spec_path).parent / spec["booster_file"]
+        booster = xgb.Booster(params={"nthread": nthread}, model_file=str(booster_path))
+        return cls(CompiledEncoder.from_spec(spec["encoder"]), booster,
+                   tuple(spec["iteration_range"]), booster_path)
+
+    def encode(self, rows: Sequence[dict]) -> np.ndarray:
+        """1 dòng -> buffer dùng lại của thread, nhiều dòng -> ma trận mới"""
+        if len(rows) == 1:
+            return self.encoder.encode_one(rows[0])
+        return self.encoder.encode_rows(rows)
+
+    def predict_matrix(self, matrix: np.ndarray) -> np.ndarray:
+        return self.booster.inplace_predict(
+            matrix, iteration_range=self.iteration_range, missing=np.nan, validate_features=False
+        )
+
+    def predict_one(self, row: dict) -> float:
+        return float(self.predict_matrix(self.encoder.encode_one(row))[0])
+
+    def predict_rows(self, rows: Sequence[dict]) -> np.ndarray:
+        return self.predict_matrix(self.encode(rows))
+
+    def verify_against(self, pipeline, rows: Sequence[dict]) -> None:
+        """Đảm bảo feature và giá dự đoán giống hệt Pipeline gốc, sai lệch -> ValueError"""
+        import pandas as pd
+
+        frame = pd.DataFrame(list(rows))
+        expected_features = pipeline.named_steps['preprocessor'].transform(frame)
+        if not np.array_equal(self.encoder.encode_rows(rows), expected_features):
+            raise ValueError("Feature của fast encoder khác với ColumnTransformer")
+
+        expected = pipeline.predict(frame)
+        if not np.array_equal(self.predict_rows(rows), expected):
+            raise ValueError("Giá dự đoán của fast path khác với Pipeline")
+        for row, price in zip(rows, expected):
+            if self.predict_one(row) != float(price):
+                raise ValueError("Giá dự đoán single-row của fast path khác với Pipeline")
+
+
+def sample_rows(encoder: CompiledEncoder, limit: int = 64) -> List[dict]:
+    """Sinh các dòng mẫu phủ category đã biết + giá trị lạ/thiếu để kiểm tra parity"""
+    categories = encoder.categories
+    rows = []
+    for i in range(limit):
+        row = {
+            column: values[i % len(values)] if values else None
+            for column, values in categories.items()
+        }
+        row['year'] = 1995 + (i * 7) % 31
+        row['mileage'] = (i * 37_919) % 400_000
+        rows.append(row)
+    # Category không có lúc train và giá trị thiếu
+    rows.append({**rows[0], 'version': 'Phiên bản lạ', 'color': None})
+    rows.append({**rows[-1], 'make': 'Unknown', 'model': 'Unknown', 'mileage': 0})
+    return rows
@@ -0,0 +1,152 @@
+"""
+Khớp gần đúng giá trị text tự do (hãng, dòng xe, phiên bản, màu) về category model đã biết.
+
+OneHotEncoder(handle_unknown='ignore') biến mọi biến thể chính tả ("1.5 G CVT", "trang" thay
+vì "Trắng") thành vector toàn 0 -> giá sai và không dùng lại được cache. Index dựng sẵn từ
+categories của encoder đã fit:
+- khớp nguyên văn, rồi khớp sau khi "gấp" (bỏ dấu tiếng Việt, đ -> d, chữ thường, bỏ khoảng trắng
+  và dấu câu) -> score 1.0;
+- còn lại lấy vài ứng viên chung nhiều trigram nhất (inverted index) rồi chấm điểm bằng
+  SequenceMatcher.ratio trên dạng đã gấp; không vượt ngưỡng (score > min_score) thì giữ nguyên input.
+  Ứng viên phải có đúng các "mã" như input: số (dung tích, đời...) và chữ ngắn <= 2 ký tự (bản G / E,
+  hộp số AT / MT). "2.5 AT" -> "1.5 AT" hay "1.5G MT" -> "1.5MT" là cấu hình khác, không phải lỗi
+  chính tả, dù điểm giống cao.
+"""
+import heapq
+import re
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Cột model -> index khớp gần đúng
+FUZZY_COLUMNS = ('make', 'model', 'version', 'color')
+# Số ứng viên (theo số trigram chung) được chấm điểm chi tiết
+CANDIDATES = 8
+TOKEN = re.compile(r"\d+(?:[.,]\d+)*|[^\W\d_]+")
+# Chữ ngắn hơn mức này coi là mã cấu hình (G, E, AT, MT...), phải khớp nguyên văn như số
+CODE_MAX_LETTERS = 2
+
+
+class Match(NamedTuple):
+    value: Optional[str]  # None: không có category nào đủ giống
+    score: float
+
+
+def fold(text: str) -> str:
+    """Dạng chuẩn để so khớp: bỏ dấu, đ -> d, chữ thường, chỉ giữ chữ và số"""
+    text = unicodedata.normalize("NFD", text.replace("đ", "d").replace("Đ", "D"))
+    return "".join(ch for ch in text.lower() if ch.isalnum() and not unicodedata.combining(ch))
+
+
+def codes(text: str) -> Tuple[str, ...]:
+    """Mã cấu hình trong chuỗi: số ("1,5" = "1.5") + chữ ngắn đã gấp, sắp xếp (không phụ thuộc thứ tự)"""
+    found = []
+    for token in TOKEN.findall(text):
+        if token[0].isdigit():
+            found.append(token.replace(",", "."))
+        elif len(token) <= CODE_MAX_LETTERS:
+            found.append(fold(token))
+    return tuple(sorted(found))
+
+
+def trigrams(folded: str) -> frozenset:
+    padded = f"^{folded}$"
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class FuzzyIndex:
+    def __init__(self, values: Iterable[str], cache_size: int = 4096):
+        self.values: List[str] = sorted({str(v) for v in values})
+        self._exact = set(self.values)
+        self._by_folded: Dict[str, str] = {}
+        self._folded: List[str] = []
+        self._codes: List[Tuple[str, ...]] = []
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        for i, value in enumerate(self.values):
+            folded = fold(value)
+            self._folded.append(folded)
+            self._codes.append(codes(value))
+            if folded:
+                self._by_folded.setdefault(folded, value)
+            for gram in trigrams(folded):
+                self._postings[gram].append(i)
+        # Input lặp lại rất nhiều (dropdown, retry) -> nhớ kết quả theo chuỗi input
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+
+    def _match(self, text: str) -> Match:
+        if text in self._exact:
+            return Match(text, 1.0)
+        folded = fold(text)
+        if not folded:
+            return Match(None, 0.0)
+        value = self._by_folded.get(folded)
+        if value is not None:
+            return Match(value, 1.0)
+
+        shared: Dict[int, int] = defaultdict(int)
+        text_codes = codes(text)
+        for gram in trigrams(folded):
+            for i in self._postings.get(gram, ()):
+                if self._codes[i] == text_codes:
+                    shared[i] += 1
+        best, best_score = None, 0.0
+        # SequenceMatcher cache thông tin của b -> đặt input cố định ở b, ứng viên ở a
+        matcher = SequenceMatcher(autojunk=False)
+        matcher.set_seq2(folded)
+        for i in heapq.nlargest(CANDIDATES, shared, key=shared.__getitem__):
+            matcher.set_seq1(self._folded[i])
+            score = matcher.ratio()
+            if score > best_score:
+                best, best_score = i, score
+        if best is None:
+            return Match(None, 0.0)
+        return Match(self.values[best], round(best_score, 4))
+
+
+class CategoryResolver:
+    """Mỗi cột category một FuzzyIndex; resolve dòng input trước khi tra cache / predict"""
+
+    def __init__(self, categories: Dict[str, List[str]], min_score: float = 0.75):
+        self.min_score = min_score
+        self.indexes = {
+            column: FuzzyIndex(values) for column, values in categories.items() if column in FUZZY_COLUMNS
+        }
+
+    def resolve(self, row: dict, skip: Tuple[str, ...] = ()) -> Tuple[dict, Dict[str, Match]]:
+        """
+        Thay giá trị text bằng category gần nhất (score > min_score).
+        Trả về (dòng mới, {cột: Match}) chỉ gồm các cột không khớp nguyên văn.
+        """
+        resolved, matches = row, {}
+        for column, index in self.indexes.items():
+            value = row.get(column)
+            if not isinstance(value, str) or value in skip:
+                continue
+            match = index.match(value)
+            if match.value == value:
+                continue
+            if match.score <= self.min_score:
+                match = Match(None, match.score)
+            elif resolved is row:
+                resolved = dict(row)
+            if match.value is not None:
+                resolved[column] = match.value
+            matches[column] = match
+        return resolved, matches
+
+    def resolve_value(self, column: str, value: str) -> str:
+        """Giá trị thay thế cho 1 ô (dùng khi input dạng cột: mỗi giá trị khác nhau chỉ khớp 1 lần)"""
+        index = self.indexes.get(column)
+        if index is None:
+            return value
+        match = index.match(value)
+        return match.value if match.value is not None and match.score > self.min_score else value
+
+    def stats(self) -> dict:
+        return {
+            "enabled": True,
+            "min_score": self.min_score,
+            "categories": {column: len(index.values) for column, index in self.indexes.items()},
+        }
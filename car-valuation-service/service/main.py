@@ -1,19 +1,104 @@
-import json
+import time
+# Mốc bắt đầu import app (đo thời gian cold start)
+_IMPORT_START = time.perf_counter()
+
+import hmac
 import os
-import joblib
-import pandas as pd
-from pathlib import Path
-from typing import Optional
-from fastapi import FastAPI, HTTPException
+import tempfile
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+from service import bulk, columnar_rpc
+from service.admission import AdmissionController, AdmissionMiddleware, DeadlineExceeded, check_deadline, within_deadline
+from service.batcher import MicroBatcher
+from service.cache import PredictionCache
+from service.disk_cache import DiskCache
+from service import metrics
+from service.metadata_index import MetadataIndex, etag_matches
+from service.query_log import QueryLog
+from service.scheduler import BULK, INTERACTIVE, PriorityExecutor, RequestClassMiddleware, request_class
+from service.singleflight import SingleFlight
+from service.model_loader import BASE_DIR, FEATURE_COLUMNS, ModelBundle, ModelWatcher, load_bundle, warmup
+
+APP_IMPORT_SECONDS = time.perf_counter() - _IMPORT_START
 
-# --- CẤU HÌNH PATH ---
-BASE_DIR = Path(__file__).resolve().parents[1]
-# Trỏ vào file Pipeline mới (chứa cả xử lý dữ liệu + model XGBoost)
-MODEL_PATH = BASE_DIR / "models" / "best_car_price_pipeline.pkl"
-# Metrics bây giờ lưu dưới dạng JSON
-METRICS_PATH = BASE_DIR / "models" / "model_metrics.json"
+# --- CẤU HÌNH ---
+# "pipeline": joblib + sklearn Pipeline (mặc định)
+# "lean": chỉ load booster native + encoder spec, không import pandas/sklearn/joblib
+# "onnx": preprocessing + cây trong 1 file .onnx chạy bằng ONNX Runtime (không cần xgboost)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "pipeline").lower()
+# Giới hạn số xe trong một request /predict/batch
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 10000))
+# Giới hạn số xe trong một request /rpc/predict (định dạng nhị phân dạng cột, gọi nội bộ)
+RPC_MAX_ROWS = int(os.getenv("RPC_MAX_ROWS", 100000))
+# /predict/stream: số dòng mỗi lần predict vector hoá; kết quả vượt ngưỡng byte này thì ghi tạm ra đĩa
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", 2000))
+STREAM_SPOOL_MAX_MEMORY = int(os.getenv("STREAM_SPOOL_MAX_MEMORY", 8 * 1024 * 1024))
+# Cache kết quả dự đoán (0 = tắt cache, TTL 0 = không hết hạn)
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", 4096))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", 0))
+# Tầng cache thứ 2 trên đĩa (SQLite) dùng chung giữa các worker, còn nguyên sau restart ("" = tắt)
+DISK_CACHE_PATH = os.getenv("DISK_CACHE_PATH", "")
+DISK_CACHE_MAX_ENTRIES = int(os.getenv("DISK_CACHE_MAX_ENTRIES", 200_000))
+# Log key truy vấn /predict ("" = tắt); lúc khởi động predict trước các cấu hình hay gặp nhất trong log
+# (tối đa CACHE_WARMUP_MAX_KEYS cấu hình / CACHE_WARMUP_MAX_SECONDS giây) rồi mới báo ready
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", "")
+QUERY_LOG_MAX_BYTES = int(os.getenv("QUERY_LOG_MAX_BYTES", 10 * 1024 * 1024))
+CACHE_WARMUP_MAX_KEYS = int(os.getenv("CACHE_WARMUP_MAX_KEYS", 1000))
+CACHE_WARMUP_MAX_SECONDS = float(os.getenv("CACHE_WARMUP_MAX_SECONDS", 10))
+# /predict/explain: TreeSHAP tốn hơn predict nhiều lần -> batch nhỏ hơn + cache riêng (cùng TTL, 0 = tắt)
+EXPLAIN_MAX_BATCH_SIZE = int(os.getenv("EXPLAIN_MAX_BATCH_SIZE", 100))
+EXPLAIN_CACHE_SIZE = int(os.getenv("EXPLAIN_CACHE_SIZE", 1024))
+# /predict/curve: số mốc km (0 -> CURVE_MAX_MILEAGE_KM) x các năm của dòng xe trong metadata
+CURVE_MILEAGE_POINTS = int(os.getenv("CURVE_MILEAGE_POINTS", 20))
+CURVE_MAX_MILEAGE_KM = int(os.getenv("CURVE_MAX_MILEAGE_KM", 300_000))
+# Admission control cho /predict... và /rpc/...: tối đa MAX_IN_FLIGHT request đang xử lý mỗi process
+# (0 = không giới hạn), vượt thì trả 503 + Retry-After ngay. Deadline mỗi request (0 = không có, client
+# có thể đặt ngắn hơn bằng header X-Request-Timeout-Ms): quá hạn thì dừng, trả 504 thay vì predict tiếp
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", 64))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", 1))
+REQUEST_DEADLINE_MS = float(os.getenv("REQUEST_DEADLINE_MS", 0))
+# Xếp lịch chạy model theo lớp request (service/scheduler.py): interactive (/predict, /predict/explain,
+# /predict/curve) trước bulk (batch, stream, rpc), header X-Request-Class ghi đè. INFERENCE_WORKERS thread
+# chạy model (0 = max(2, số CPU của process); mọi lần chạy model của request bị giới hạn ở số thread này
+# thay vì thread pool 40 thread), bulk chiếm tối đa SCHEDULER_BULK_MAX_WORKERS (0 = INFERENCE_WORKERS - 1),
+# chia lượt theo trọng số khi cả 2 lớp cùng chờ (trọng số bulk 0 = interactive ưu tiên tuyệt đối)
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 0)) or max(
+    2, len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+)
+SCHEDULER_INTERACTIVE_WEIGHT = float(os.getenv("SCHEDULER_INTERACTIVE_WEIGHT", 8))
+SCHEDULER_BULK_WEIGHT = float(os.getenv("SCHEDULER_BULK_WEIGHT", 1))
+SCHEDULER_BULK_MAX_WORKERS = int(os.getenv("SCHEDULER_BULK_MAX_WORKERS", 0))
+# Fast-path encoder không dùng pandas (tự tắt nếu không khớp Pipeline)
+FAST_ENCODER_ENABLED = os.getenv("FAST_ENCODER_ENABLED", "true").lower() == "true"
+# Micro-batching cho /predict: gom request trong cửa sổ MAX_WAIT_MS hoặc đủ MAX_SIZE xe
+MICROBATCH_ENABLED = os.getenv("MICROBATCH_ENABLED", "false").lower() == "true"
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("MICROBATCH_MAX_WAIT_MS", 2))
+MICROBATCH_MAX_SIZE = int(os.getenv("MICROBATCH_MAX_SIZE", 64))
+MICROBATCH_WORKERS = int(os.getenv("MICROBATCH_WORKERS", 1))
+# Single-flight cho /predict: các request cùng input tới trong lúc đang predict chờ chung 1 kết quả
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+# Bảng giá tính sẵn (models/valuation_grid.npz) cho cấu hình xe đã biết, model thật cho phần còn lại
+VALUATION_GRID_ENABLED = os.getenv("VALUATION_GRID_ENABLED", "false").lower() == "true"
+# Khớp gần đúng brand/model/version/color về category model đã biết (bỏ dấu, sai chính tả nhẹ)
+FUZZY_MATCH_ENABLED = os.getenv("FUZZY_MATCH_ENABLED", "true").lower() == "true"
+FUZZY_MATCH_MIN_SCORE = float(os.getenv("FUZZY_MATCH_MIN_SCORE", 0.75))
+# Metadata cho dropdown định giá (make -> model -> year -> version -> color), phục vụ từ bộ nhớ
+METADATA_PATH = os.getenv("METADATA_PATH", str(BASE_DIR / "metadata.json"))
+METADATA_CACHE_MAX_AGE = int(os.getenv("METADATA_CACHE_MAX_AGE", 3600))
+# Hot reload: poll thư mục models mỗi N giây (0 = tắt), /admin/reload cần ADMIN_TOKEN
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", 0))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# Số thread XGBoost mỗi process (0 = giữ mặc định của artifact); run_service.py đặt khi chạy pre-fork
+XGBOOST_NTHREAD = int(os.getenv("XGBOOST_NTHREAD", 0))
 
 # --- INPUT SCHEMA ---
 class CarInput(BaseModel):
@@ -26,12 +111,48 @@ class CarInput(BaseModel):
     transmission: Optional[str] = Field(None, description="Hộp số (AT/MT) - (Hiện tại chưa dùng trong model)")
     location: Optional[str] = Field(None, description="Địa điểm - (Hiện tại chưa dùng trong model)")
 
+    @field_validator("brand", "model")
+    @classmethod
+    def _not_blank(cls, value: str) -> str:
+        # Cùng luật với /rpc/predict: chỉ có khoảng trắng coi như để trống
+        if not value.strip():
+            raise ValueError("không được để trống")
+        return value
+
+class FieldMatch(BaseModel):
+    input: str = Field(..., description="Giá trị gửi lên")
+    matched: Optional[str] = Field(None, description="Giá trị model đã biết được dùng thay (None: không đủ giống, giữ nguyên input)")
+    score: float = Field(..., description="Độ giống 0-1 (1.0 = trùng sau khi bỏ dấu, hoa/thường, khoảng trắng)")
+
 class PricePrediction(BaseModel):
     price_estimate: float = Field(..., description="Giá dự đoán (triệu VND)")
     price_min: float = Field(..., description="Giá tối thiểu (triệu VND)")
     price_max: float = Field(..., description="Giá tối đa (triệu VND)")
     confidence_level: str = Field(..., description="Độ tin cậy")
     mae_estimate: float = Field(..., description="Sai số ước tính (triệu VND)")
+    matched_fields: Optional[Dict[str, FieldMatch]] = Field(
+        None, description="Các trường input không trùng nguyên văn với giá trị model biết và kết quả khớp gần đúng"
+    )
+
+class FeatureContribution(BaseModel):
+    feature: str = Field(..., description="Trường input (brand, model, year, version, color, mileage_km)")
+    value: Optional[Union[int, str]] = Field(None, description="Giá trị model đã dùng (sau khi chuẩn hoá / khớp gần đúng)")
+    contribution: float = Field(..., description="Mức làm tăng (+) / giảm (-) giá so với base_value (triệu VND)")
+
+class PriceExplanation(PricePrediction):
+    base_value: float = Field(..., description="Giá trung bình của model khi chưa biết gì về xe (triệu VND)")
+    contributions: List[FeatureContribution] = Field(
+        ..., description="Các yếu tố ảnh hưởng nhiều nhất, sắp theo độ lớn; base_value + tổng mọi yếu tố = giá model"
+    )
+
+class YearCurve(BaseModel):
+    year: int = Field(..., description="Năm sản xuất")
+    prices: List[float] = Field(..., description="Giá dự đoán (triệu VND) tại từng mốc mileage_km")
+
+class DepreciationCurves(BaseModel):
+    base: PricePrediction = Field(..., description="Kết quả định giá của đúng xe gửi lên")
+    mileage_km: List[int] = Field(..., description="Các mốc km (trục x, dùng chung cho mọi đường)")
+    curves: List[YearCurve] = Field(..., description="Mỗi năm sản xuất 1 đường giá theo km (năm tăng dần)")
 
 # --- APP SETUP ---
 app = FastAPI(title="Car Valuation Service", version="2.0.0")
@@ -40,6 +161,11 @@ app = FastAPI(title="Car Valuation Service", version="2.0.0")
 allowed_origins_env = os.getenv("ALLOWED_ORIGINS", "*")
 allowed_origins = ["*"] if allowed_origins_env == "*" else [o.strip() for o in allowed_origins_env.split(",")]
 
+# Admission control nằm trong CORS (503 vẫn có header CORS) và trong metrics (503 / 504 vẫn được đếm)
+admission = AdmissionController(MAX_IN_FLIGHT, ADMISSION_RETRY_AFTER, REQUEST_DEADLINE_MS)
+app.add_middleware(AdmissionMiddleware, controller=admission)
+# Gắn lớp interactive / bulk cho request inference (dùng bởi inference_executor)
+app.add_middleware(RequestClassMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
@@ -47,111 +173,888 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Đếm request / lỗi / latency cho /metrics
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Global variables
-model_pipeline = None
-test_mae = 35.0  # Default fallback từ log train gần nhất
-test_r2 = 0.98   # Default fallback
+# Bundle model đang phục vụ; reload chỉ gán lại tham chiếu này (swap nguyên tử)
+active_model: Optional[ModelBundle] = None
+prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL)
+disk_cache = DiskCache(DISK_CACHE_PATH, DISK_CACHE_MAX_ENTRIES) if DISK_CACHE_PATH else None
+query_log = QueryLog(QUERY_LOG_PATH, QUERY_LOG_MAX_BYTES) if QUERY_LOG_PATH else None
+# Cache kết quả TreeSHAP: key như prediction_cache, value = (base_value, contribution từng cột)
+explanation_cache = PredictionCache(EXPLAIN_CACHE_SIZE, PREDICTION_CACHE_TTL)
+micro_batcher = None
+single_flight = SingleFlight() if SINGLEFLIGHT_ENABLED else None
+inference_executor = PriorityExecutor(
+    INFERENCE_WORKERS,
+    {INTERACTIVE: SCHEDULER_INTERACTIVE_WEIGHT, BULK: SCHEDULER_BULK_WEIGHT},
+    SCHEDULER_BULK_MAX_WORKERS,
+) if SCHEDULER_ENABLED else None
+model_watcher = None
+metadata_index: Optional[MetadataIndex] = None
+_reload_lock = threading.Lock()
+reload_status = {"in_progress": False, "reloads": 0, "last_error": None, "last_attempt_at": None}
+# Trạng thái load model lần đầu: starting -> loading -> ready | failed
+startup_status = {"status": "starting", "error": None, "timings": {"import_app": round(APP_IMPORT_SECONDS, 3)}}
+
+def _activate_model(bundle: ModelBundle, warmed: Optional[Tuple[List[tuple], List[float]]] = None):
+    """
+    Swap bundle mới vào; cache gắn với version nên model khác -> cache cũ bị xoá. Giá warm sẵn
+    (warm_cache) chỉ được đưa vào cache tại đây, ngay trước khi swap: trước đó request của model cũ
+    không đọc được giá của model mới, load hỏng giữa chừng thì cache vẫn gắn với model cũ.
+    """
+    global active_model
+    prediction_cache.bind_model(bundle.version)
+    if disk_cache is not None:
+        disk_cache.bind_model(bundle.version)
+    explanation_cache.bind_model(bundle.version)
+    if warmed:
+        _store_prices(*warmed, bundle)
+    active_model = bundle
 
 def load_model_resources():
-    """Load Pipeline hoàn chỉnh và Metrics"""
-    global model_pipeline, test_mae, test_r2
-    
-    # 1. Load Model Pipeline
-    if not MODEL_PATH.exists():
-        raise RuntimeError(f"❌ Không tìm thấy file model tại: {MODEL_PATH}")
-    
+    """Load model (Pipeline, lean hoặc onnx) và Metrics, smoke test + warmup rồi đưa vào phục vụ"""
+    bundle = load_bundle(
+        INFERENCE_BACKEND, FAST_ENCODER_ENABLED, VALUATION_GRID_ENABLED,
+        FUZZY_MATCH_MIN_SCORE if FUZZY_MATCH_ENABLED else 0,
+    )
+    metrics.MODEL_LOAD_SECONDS.observe(bundle.load_seconds)
+    warmup(bundle)
+    warmed = warm_cache(bundle)
+    # Đặt sau warmup: warmup chạy 1 thread nên master pre-fork chưa tạo thread pool OpenMP nào trước khi fork
+    if XGBOOST_NTHREAD > 0:
+        bundle.set_nthread(XGBOOST_NTHREAD)
+    _activate_model(bundle, warmed)
+    return bundle
+
+# Số cấu hình mỗi lần predict khi warm cache (giới hạn thời gian được kiểm tra giữa các lần)
+CACHE_WARMUP_CHUNK = 1024
+
+def warm_cache(bundle: ModelBundle) -> Optional[Tuple[List[tuple], List[float]]]:
+    """
+    Predict trước các cấu hình hay gặp nhất trong query log cho model sắp được swap vào, trong giới
+    hạn số cấu hình + thời gian. Chạy trước khi báo ready; trả về (keys, giá) để _activate_model đưa
+    vào cache (RAM + đĩa) lúc swap, không ghi gì vào cache đang phục vụ model cũ.
+    """
+    if query_log is None or CACHE_WARMUP_MAX_KEYS <= 0 or not (prediction_cache.enabled or disk_cache):
+        return None
+    start = time.perf_counter()
+    query_log.flush()
+    top = query_log.top_keys(CACHE_WARMUP_MAX_KEYS)
+    read = time.perf_counter()
+    keys, prices = [], []
+    warmed = 0
     try:
-        # Load pipeline (bao gồm preprocessor + regressor)
-        model_pipeline = joblib.load(MODEL_PATH)
-        print(f"✅ Đã load Model Pipeline thành công từ: {MODEL_PATH.name}")
-        print(f"   - Type: {type(model_pipeline)}")
+        for i in range(0, len(top), CACHE_WARMUP_CHUNK):
+            if time.perf_counter() - start >= CACHE_WARMUP_MAX_SECONDS:
+                break
+            chunk = [tuple(key) for key, _ in top[i:i + CACHE_WARMUP_CHUNK]]
+            # Cache đang gắn với model cũ: _predict_rows không đọc / ghi được giá RAM của version này,
+            # chỉ dùng bảng giá + cache đĩa của đúng version mới (restart cùng model)
+            chunk_prices = _predict_rows([dict(zip(FEATURE_COLUMNS, key)) for key in chunk], bundle)
+            keys.extend(chunk)
+            prices.extend(chunk_prices)
+            warmed += len(chunk)
     except Exception as e:
-        raise RuntimeError(f"❌ Lỗi khi load model bằng joblib: {e}")
+        # Log hỏng / key lạ không được làm hỏng việc load model
+        print(f"⚠️ Warm cache dừng giữa chừng: {e}")
+    seconds = time.perf_counter() - start
+    bundle.timings["warm_cache"] = seconds
+    frequency = f", mỗi cấu hình {top[warmed - 1][1]}-{top[0][1]} lần trong log" if warmed else ""
+    print(
+        f"🔥 Warm cache: {warmed}/{len(top)} cấu hình hay gặp nhất trong {seconds:.2f}s "
+        f"(đọc log {read - start:.2f}s, giới hạn {CACHE_WARMUP_MAX_KEYS} cấu hình / "
+        f"{CACHE_WARMUP_MAX_SECONDS:g}s){frequency}"
+    )
+    return keys, prices
 
-    # 2. Load Metrics (JSON)
-    if METRICS_PATH.exists():
+def _initial_load():
+    """Load + warmup model lần đầu ở background; server đã nhận kết nối từ trước"""
+    with _reload_lock:
+        startup_status["status"] = "loading"
         try:
-            with open(METRICS_PATH, 'r') as f:
-                metrics = json.load(f)
-                # JSON lưu key là tên cột, ví dụ: {"Test MAE": 34.9, "R2 Score": 0.99}
-                # Cần map đúng key từ file json mà script train đã lưu
-                test_mae = metrics.get('Test MAE', test_mae)
-                test_r2 = metrics.get('R2 Score', test_r2)
-            print(f"✅ Đã load Metrics: MAE={test_mae:.0f} triệu, R2={test_r2:.4f}")
+            bundle = load_model_resources()
         except Exception as e:
-            print(f"⚠️ Không thể đọc file metrics json: {e}. Sử dụng giá trị mặc định.")
-    else:
-        print("⚠️ Không tìm thấy file metrics json. Sử dụng giá trị mặc định.")
+            startup_status.update(status="failed", error=str(e))
+            print(f"❌ Load model thất bại: {e}")
+            return
+    _mark_ready(bundle)
+
+def _mark_ready(bundle: ModelBundle):
+    global model_watcher
+    timings = {key: round(value, 3) for key, value in bundle.timings.items()}
+    startup_status["timings"].update(timings)
+    startup_status["timings"]["total"] = round(time.perf_counter() - _IMPORT_START, 3)
+    startup_status["status"] = "ready"
+    t = startup_status["timings"]
+    print(
+        f"⏱️ Cold start: import app {t['import_app']:.2f}s | import thư viện {t['import_libs']:.2f}s | "
+        f"load model {t['load_model']:.2f}s | warmup {t['warmup']:.2f}s | "
+        + (f"warm cache {t['warm_cache']:.2f}s | " if "warm_cache" in t else "")
+        + f"sẵn sàng sau {t['total']:.2f}s"
+    )
+
+    if MODEL_WATCH_INTERVAL > 0:
+        model_watcher = ModelWatcher(MODEL_WATCH_INTERVAL, reload_model_async)
+        model_watcher.start()
+        print(f"👀 Theo dõi thư mục models mỗi {MODEL_WATCH_INTERVAL:g}s để hot reload")
+
+def _reload_worker():
+    try:
+        bundle = load_model_resources()
+        reload_status["reloads"] += 1
+        reload_status["last_error"] = None
+        print(f"✅ Hot reload xong: version {bundle.version} ({bundle.load_seconds:.2f}s)")
+    except Exception as e:
+        # Giữ nguyên model cũ nếu model mới lỗi
+        reload_status["last_error"] = str(e)
+        print(f"❌ Hot reload thất bại, tiếp tục dùng model cũ: {e}")
+    finally:
+        reload_status["in_progress"] = False
+        _reload_lock.release()
+
+def reload_model_async() -> bool:
+    """Load model mới ở background thread; False nếu đang có reload khác chạy"""
+    if not _reload_lock.acquire(blocking=False):
+        return False
+    reload_status["in_progress"] = True
+    reload_status["last_attempt_at"] = _isoformat(time.time())
+    threading.Thread(target=_reload_worker, name="model-reload", daemon=True).start()
+    return True
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+def _collect_cache_metrics():
+    """Số liệu cache/batcher đọc lúc scrape (không thêm chi phí trên hot path)"""
+    stats = prediction_cache.stats()
+    yield ("valuation_cache_hits_total", "counter", "Số lần cache hit", [({}, stats["hits"])])
+    yield ("valuation_cache_misses_total", "counter", "Số lần cache miss", [({}, stats["misses"])])
+    yield ("valuation_cache_evictions_total", "counter", "Số entry bị đẩy ra khỏi cache (LRU)", [({}, stats["evictions"])])
+    yield ("valuation_cache_entries", "gauge", "Số entry đang có trong cache", [({}, stats["size"])])
+    stats = explanation_cache.stats()
+    yield ("valuation_explain_cache_hits_total", "counter", "Số lần cache giải thích giá hit", [({}, stats["hits"])])
+    yield ("valuation_explain_cache_misses_total", "counter", "Số lần cache giải thích giá miss",
+           [({}, stats["misses"])])
+    if micro_batcher is not None:
+        yield ("valuation_microbatch_waiting", "gauge", "Số request đang chờ micro-batcher",
+               [({}, micro_batcher.stats()["waiting"])])
+    if single_flight is not None:
+        yield ("valuation_singleflight_in_flight", "gauge", "Số key đang được predict qua single-flight",
+               [({}, single_flight.stats()["in_flight"])])
+    if inference_executor is not None:
+        classes = inference_executor.stats()["classes"]
+        yield ("valuation_scheduler_queued", "gauge", "Số việc đang chờ executor inference theo lớp request",
+               [({"class": cls}, stats["queued"]) for cls, stats in classes.items()])
+        yield ("valuation_scheduler_running", "gauge", "Số việc đang chạy trên executor inference theo lớp request",
+               [({"class": cls}, stats["running"]) for cls, stats in classes.items()])
+    yield ("valuation_admission_in_flight", "gauge", "Số request inference đang xử lý (admission control)",
+           [({}, admission.in_flight)])
+    yield ("valuation_startup_phase_seconds", "gauge", "Thời gian từng pha cold start của process",
+           [({"phase": phase}, seconds) for phase, seconds in startup_status["timings"].items()])
+
+metrics.REGISTRY.add_collector(_collect_cache_metrics)
 
 @app.on_event("startup")
 def startup_event():
-    load_model_resources()
+    global micro_batcher, metadata_index
+    try:
+        metadata_index = MetadataIndex.load(METADATA_PATH)
+        print(f"✅ Đã dựng metadata index: {metadata_index.stats()['responses']} response từ {METADATA_PATH}")
+    except Exception as e:
+        print(f"⚠️ Không load được metadata ({METADATA_PATH}): {e}. /metadata/... trả 503.")
+    if disk_cache is not None:
+        # Mở connection đọc SQLite của process này lúc khởi động, không phải ở request đầu tiên
+        disk_cache.connect()
+    if active_model is not None:
+        # Pre-fork (run_service.py): master đã load + warmup, worker dùng chung bộ nhớ copy-on-write
+        _mark_ready(active_model)
+    else:
+        # Không chặn startup: uvicorn nhận kết nối ngay, /health/ready báo khi model sẵn sàng
+        threading.Thread(target=_initial_load, name="model-initial-load", daemon=True).start()
+    metrics.start_flusher()
+    if MICROBATCH_ENABLED:
+        micro_batcher = MicroBatcher(
+            _predict_active, MICROBATCH_MAX_WAIT_MS, MICROBATCH_MAX_SIZE, MICROBATCH_WORKERS
+        )
+        print(f"✅ Micro-batching bật: cửa sổ {MICROBATCH_MAX_WAIT_MS} ms, tối đa {MICROBATCH_MAX_SIZE} xe/batch")
 
+@app.on_event("shutdown")
+def shutdown_event():
+    metrics.flush_snapshot()
+    if model_watcher is not None:
+        model_watcher.stop()
+    if micro_batcher is not None:
+        micro_batcher.shutdown()
+    if inference_executor is not None:
+        inference_executor.shutdown()
+    if disk_cache is not None:
+        disk_cache.close()
+    if query_log is not None:
+        query_log.close()
+
+# Các endpoint health là async: chạy thẳng trên event loop, không xếp hàng chung thread pool với
+# predict nên vẫn trả lời ngay cả khi service đang quá tải
 @app.get("/health")
-def health_check():
+async def health_check():
+    model = active_model
     return {
         "status": "ok",
-        "model_loaded": model_pipeline is not None,
-        "current_mae": test_mae,
-        "model_type": str(type(model_pipeline)) if model_pipeline else "None"
+        "model_loaded": model is not None,
+        "inference_backend": INFERENCE_BACKEND,
+        "current_mae": model.mae if model else None,
+        "model_type": model.model_type if model else "None",
+        "model_version": model.version if model else None,
+        "model_loaded_at": _isoformat(model.loaded_at) if model else None,
+        "fast_encoder": model is not None and model.fast_predictor is not None,
+        "valuation_grid": model.grid.stats() if model and model.grid else {"enabled": False},
+        "fuzzy_match": model.resolver.stats() if model and model.resolver else {"enabled": False},
+        "startup": startup_status,
+        "reload": reload_status,
+        "metadata": metadata_index.stats() if metadata_index else None,
+        "prediction_cache": prediction_cache.stats(),
+        "disk_cache": disk_cache.stats() if disk_cache else {"enabled": False},
+        "query_log": query_log.stats() if query_log else {"enabled": False},
+        "explanation_cache": explanation_cache.stats(),
+        "micro_batcher": micro_batcher.stats() if micro_batcher else {"enabled": False},
+        "single_flight": single_flight.stats() if single_flight else {"enabled": False},
+        "admission": admission.stats(),
+        "scheduler": inference_executor.stats() if inference_executor else {"enabled": False}
     }
 
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness: process còn sống và event loop còn phản hồi"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: model đã load + warmup xong, sẵn sàng nhận traffic"""
+    if active_model is None:
+        return JSONResponse(
+            status_code=503,
+            content={"status": startup_status["status"], "error": startup_status["error"]},
+            headers={"Retry-After": "5"},
+        )
+    return {"status": "ready", "model_version": active_model.version, "startup": startup_status["timings"]}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Metric theo Prometheus text format (cộng dồn mọi worker nếu đặt METRICS_MULTIPROC_DIR)"""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.post("/admin/reload", status_code=202)
+def admin_reload(x_admin_token: Optional[str] = Header(None)):
+    """Reload model + metrics ở background, swap khi smoke test thành công"""
+    if not ADMIN_TOKEN or not hmac.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Không có quyền reload model.")
+    if not reload_model_async():
+        raise HTTPException(status_code=409, detail="Đang có một lần reload khác chạy.")
+    return {"status": "reloading", "current_version": active_model.version if active_model else None}
+
+def _metadata_response(if_none_match: Optional[str], *path) -> Response:
+    """Trả response dựng sẵn của metadata index; 304 nếu client đã có đúng bản này"""
+    if metadata_index is None:
+        raise HTTPException(status_code=503, detail="Metadata chưa sẵn sàng.")
+    cached = metadata_index.get(*path)
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy metadata.")
+    headers = {"ETag": cached.etag, "Cache-Control": f"public, max-age={METADATA_CACHE_MAX_AGE}"}
+    if etag_matches(if_none_match, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+# Endpoint metadata chỉ tra dict trong bộ nhớ nên chạy thẳng trên event loop (async)
+@app.get("/metadata/makes")
+async def metadata_makes(if_none_match: Optional[str] = Header(None)):
+    return _metadata_response(if_none_match, "makes")
+
+@app.get("/metadata/models/{make}")
+async def metadata_models(make: str, if_none_match: Optional[str] = Header(None)):
+    return _metadata_response(if_none_match, "models", make)
+
+@app.get("/metadata/years/{make}/{model}")
+async def metadata_years(make: str, model: str, if_none_match: Optional[str] = Header(None)):
+    return _metadata_response(if_none_match, "years", make, model)
+
+@app.get("/metadata/versions/{make}/{model}/{year}")
+async def metadata_versions(make: str, model: str, year: int, if_none_match: Optional[str] = Header(None)):
+    return _metadata_response(if_none_match, "versions", make, model, year)
+
+@app.get("/metadata/colors/{make}/{model}/{year}")
+async def metadata_colors(make: str, model: str, year: int, version: Optional[str] = None,
+                          if_none_match: Optional[str] = Header(None)):
+    """Màu theo version; không truyền version -> mọi màu của năm đó"""
+    return _metadata_response(if_none_match, "colors", make, model, year, version or None)
+
+@app.get("/metadata/tree")
+async def metadata_tree(if_none_match: Optional[str] = Header(None)):
+    """Toàn bộ cây metadata trong 1 response"""
+    return _metadata_response(if_none_match, "tree")
+
+@app.get("/metadata/tree/{make}")
+async def metadata_make_tree(make: str, if_none_match: Optional[str] = Header(None)):
+    return _metadata_response(if_none_match, "tree", make)
+
+@app.get("/metadata/tree/{make}/{model}")
+async def metadata_model_tree(make: str, model: str, if_none_match: Optional[str] = Header(None)):
+    """Mọi năm -> version -> màu của 1 dòng xe: UI gọi 1 lần thay vì 4"""
+    return _metadata_response(if_none_match, "tree", make, model)
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": "Request đã quá deadline, dừng xử lý."})
+
+def _get_model() -> ModelBundle:
+    """Lấy bundle đang active 1 lần cho cả request (request chạy trọn trên 1 model)"""
+    model = active_model
+    if model is None:
+        if startup_status["status"] == "failed":
+            raise HTTPException(status_code=500, detail="Model chưa được load.")
+        raise HTTPException(status_code=503, detail="Model đang được load, thử lại sau.",
+                            headers={"Retry-After": "5"})
+    return model
+
+def _car_to_row(car: CarInput) -> dict:
+    """Chuyển CarInput thành 1 dòng dữ liệu với tên cột KHỚP lúc train"""
+    version = car.version.strip() if car.version else ""
+    color = car.color.strip() if car.color else ""
+    return {
+        'make': car.brand.strip(),       # Mapping: brand -> make
+        'model': car.model.strip(),
+        'year': car.year,
+        'version': version or "Unknown",
+        'color': color or "Unknown",
+        'mileage': car.mileage_km # Mapping: mileage_km -> mileage
+    }
+
+# Tên cột model -> tên trường của CarInput
+_INPUT_FIELDS = {'make': 'brand', 'mileage': 'mileage_km'}
+
+def _resolve_row(row: dict, model: ModelBundle) -> Tuple[dict, Optional[Dict[str, FieldMatch]]]:
+    """Khớp text tự do về category model đã biết, trước khi tra bảng giá / cache / predict"""
+    if model.resolver is None:
+        return row, None
+    start = time.perf_counter()
+    resolved, matches = model.resolver.resolve(row, skip=("Unknown",))
+    metrics.STAGE_RESOLVE_FIELDS.observe(time.perf_counter() - start)
+    if not matches:
+        return resolved, None
+    return resolved, {
+        _INPUT_FIELDS.get(column, column): FieldMatch(input=row[column], matched=match.value, score=match.score)
+        for column, match in matches.items()
+    }
+
+def _cache_key(row: dict) -> tuple:
+    """Key cache = các trường đã chuẩn hoá mà model thực sự dùng"""
+    return tuple(row[col] for col in FEATURE_COLUMNS)
+
+def _lookup_precomputed(row: dict, key: tuple, model: ModelBundle) -> Optional[float]:
+    """Giá có sẵn không cần chạy model: bảng giá tính sẵn (nếu bật) rồi tới cache"""
+    if model.grid is not None:
+        price = model.grid.lookup(row)
+        if price is not None:
+            return price
+    return prediction_cache.get(key, model.version)
+
+def _lookup_disk(keys: List[tuple], model: ModelBundle) -> List[Optional[float]]:
+    """Tra cache đĩa (1 câu SQL cho cả danh sách); giá tìm thấy được đưa lên cache RAM"""
+    if disk_cache is None:
+        return [None] * len(keys)
+    prices = disk_cache.get_many(keys, model.version)
+    for key, price in zip(keys, prices):
+        if price is not None:
+            prediction_cache.put(key, price, model.version)
+    return prices
+
+def _store_prices(keys: List[tuple], prices: List[float], model: ModelBundle):
+    """Ghi giá vừa predict vào cache RAM và (không chờ) cache đĩa"""
+    for key, price in zip(keys, prices):
+        prediction_cache.put(key, price, model.version)
+    if disk_cache is not None:
+        disk_cache.put_many(keys, prices, model.version)
+
+def _predict_active(rows: List[dict]):
+    """Predict bằng model đang active tại thời điểm batch chạy (dùng cho micro-batcher)"""
+    return _get_model().predict_rows(rows)
+
+def _run_model(fn, *args):
+    """
+    Chạy 1 bước tốn kém của model (predict / TreeSHAP) qua executor ưu tiên theo lớp của request;
+    ngoài request (warm cache) hoặc khi tắt scheduler thì chạy thẳng trên thread hiện tại.
+    Request đã quá deadline lúc tới lượt thì bỏ qua.
+    """
+    def call():
+        check_deadline()
+        return fn(*args)
+
+    cls = request_class.get()
+    if inference_executor is None or cls is None:
+        return call()
+    return inference_executor.run(cls, call)
+
+def _predict_rows(rows: List[dict], model: ModelBundle) -> List[float]:
+    """
+    Dự đoán giá thô cho danh sách dòng, đi qua bảng giá tính sẵn + cache RAM + cache đĩa.
+    Các dòng chưa có giá được predict chung 1 lần.
+    """
+    keys = [_cache_key(row) for row in rows]
+    prices: List[Optional[float]] = [_lookup_precomputed(row, key, model) for row, key in zip(rows, keys)]
+
+    miss_idx = [i for i, price in enumerate(prices) if price is None]
+    if miss_idx and disk_cache is not None:
+        for i, price in zip(miss_idx, _lookup_disk([keys[i] for i in miss_idx], model)):
+            prices[i] = price
+        miss_idx = [i for i in miss_idx if prices[i] is None]
+    if miss_idx:
+        predicted = [float(price) for price in _run_model(model.predict_rows, [rows[i] for i in miss_idx])]
+        for i, price in zip(miss_idx, predicted):
+            prices[i] = price
+        _store_prices([keys[i] for i in miss_idx], predicted, model)
+
+    return prices
+
+def _build_prediction(price_estimate: float, model: ModelBundle,
+                      matched_fields: Optional[Dict[str, FieldMatch]] = None) -> PricePrediction:
+    """Tính khoảng giá và độ tin cậy từ giá dự đoán"""
+    price_min, price_max = model.price_range(price_estimate)
+    confidence = model.confidence_level
+
+    return PricePrediction(
+        price_estimate=round(price_estimate, 0),
+        price_min=round(price_min, 0),
+        price_max=round(price_max, 0),
+        confidence_level=confidence,
+        mae_estimate=round(model.mae, 0),
+        matched_fields=matched_fields
+    )
+
+def _predict_one(row: dict, key: tuple, model: ModelBundle) -> float:
+    """
+    Chạy trên executor / thread pool: predict rồi ghi cache (cache đĩa không chạm tới event loop).
+    Không kiểm tra deadline ở đây: có thể là phép tính dùng chung của nhiều request (single-flight),
+    mỗi request tự chờ tới deadline của mình bằng within_deadline (request bỏ đi lúc việc còn xếp hàng
+    thì việc bị huỷ, không predict).
+    """
+    price_estimate = float(model.predict_rows([row])[0])
+    _store_prices([key], [price_estimate], model)
+    return price_estimate
+
+async def _predict_uncached(row: dict, key: tuple, model: ModelBundle, cls: str) -> float:
+    """
+    Predict 1 xe chưa có giá sẵn (qua micro-batcher nếu bật) rồi ghi vào cache.
+    Lớp request truyền vào tường minh: qua single-flight hàm này chạy ngoài context của request.
+    """
+    if micro_batcher is not None:
+        price_estimate = await micro_batcher.submit(row)
+        if disk_cache is not None:
+            await run_in_threadpool(_store_prices, [key], [price_estimate], model)
+        else:
+            _store_prices([key], [price_estimate], model)
+        return price_estimate
+    if inference_executor is not None:
+        return await inference_executor.submit(cls, _predict_one, row, key, model)
+    return await run_in_threadpool(_predict_one, row, key, model)
+
 @app.post("/predict", response_model=PricePrediction)
-def predict_price(car: CarInput):
+async def predict_price(car: CarInput):
     """
     Dự đoán giá xe sử dụng Pipeline.
     Không cần manual encoding vì Pipeline đã có sẵn OneHotEncoder.
+    Xe có trong bảng giá tính sẵn hoặc cache RAM trả về ngay trên event loop; cache đĩa và predict chạy trên thread pool
+    hoặc qua micro-batcher nếu được bật. Request trùng input đang được predict chờ chung kết quả (single-flight).
     """
-    if model_pipeline is None:
-        raise HTTPException(status_code=500, detail="Model chưa được load.")
+    metrics.mark_handler_start()
+    model = _get_model()
     
     try:
-        # 1. Chuẩn bị dữ liệu đầu vào dưới dạng DataFrame
-        # Tên cột PHẢI KHỚP chính xác với lúc train trong file csv
-        input_data = pd.DataFrame([{
-            'make': car.brand,       # Mapping: brand -> make
-            'model': car.model,
-            'year': car.year,
-            'version': car.version if car.version else "Unknown",
-            'color': car.color if car.color else "Unknown",
-            'mileage': car.mileage_km # Mapping: mileage_km -> mileage
-        }])
-
-        # Debug input
-        # print(f"[DEBUG] Input DataFrame:\n{input_data}")
-
-        # 2. Dự đoán (Pipeline tự động xử lý NaN, Encode, Scale -> Predict)
-        price_estimate = float(model_pipeline.predict(input_data)[0])
+        # 1. Chuẩn bị dữ liệu đầu vào (tên cột khớp lúc train, text tự do khớp về category đã biết)
+        row, matched_fields = _resolve_row(_car_to_row(car), model)
+
+        # 2. Dự đoán qua cache (Pipeline tự động xử lý NaN, Encode, Scale -> Predict)
+        start = time.perf_counter()
+        key = _cache_key(row)
+        if query_log is not None:
+            query_log.record(key)
+        price_estimate = _lookup_precomputed(row, key, model)
+        if price_estimate is None and disk_cache is not None:
+            # SQLite (đĩa chậm / chờ lock) chạy trên thread pool, không chặn event loop
+            price_estimate = (await run_in_threadpool(_lookup_disk, [key], model))[0]
+        metrics.STAGE_CACHE_LOOKUP.observe(time.perf_counter() - start)
+        if price_estimate is None:
+            cls = request_class.get() or INTERACTIVE
+            # Mỗi request chỉ chờ tới deadline của chính nó; phép tính dùng chung qua single-flight chạy
+            # ngoài context của request (không deadline) nên vẫn xong cho các request khác đang chờ
+            if single_flight is not None:
+                # Key gồm model version: request tới sau khi swap model không dùng kết quả của model cũ;
+                # gồm lớp request: request interactive không phải chờ việc đã xếp hàng theo lớp bulk
+                price_estimate = await within_deadline(single_flight.do(
+                    (model.version, cls, key), lambda: _predict_uncached(row, key, model, cls)
+                ))
+            else:
+                price_estimate = await within_deadline(_predict_uncached(row, key, model, cls))
 
         # 3. Tính toán khoảng giá và độ tin cậy
-        # Dùng hệ số an toàn 2.0 * MAE để bao phủ 95% trường hợp (theo quy tắc thống kê cơ bản)
-        # Tuy nhiên để user thấy khoảng hẹp hơn cho hấp dẫn, ta dùng 1.5 hoặc 1.0 tùy chiến lược
-        margin = test_mae * 1.5 
-        
-        price_min = max(0.0, price_estimate - margin)
-        price_max = price_estimate + margin
-        
-        # Xác định text độ tin cậy
-        if test_r2 > 0.90:
-            confidence = "Rất cao (>90%)"
-        elif test_r2 > 0.80:
-            confidence = "Cao (>80%)"
+        start = time.perf_counter()
+        prediction = _build_prediction(price_estimate, model, matched_fields)
+        metrics.STAGE_INTERVAL.observe(time.perf_counter() - start)
+        metrics.mark_handler_end()
+        return prediction
+
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Lỗi khi dự đoán: {str(e)}"
+        )
+
+@app.post("/predict/batch", response_model=List[PricePrediction])
+def predict_price_batch(cars: List[CarInput]):
+    """
+    Dự đoán giá cho nhiều xe trong 1 request.
+    Các xe chưa có trong cache được gom vào 1 DataFrame và gọi predict đúng 1 lần
+    để chia đều chi phí pandas + ColumnTransformer + XGBoost cho cả batch.
+    """
+    metrics.mark_handler_start()
+    model = _get_model()
+
+    if len(cars) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch quá lớn: {len(cars)} xe (tối đa {MAX_BATCH_SIZE})."
+        )
+
+    if not cars:
+        return []
+
+    try:
+        resolved = [_resolve_row(_car_to_row(car), model) for car in cars]
+        price_estimates = _predict_rows([row for row, _ in resolved], model)
+
+        # Kết quả giữ nguyên thứ tự của input
+        start = time.perf_counter()
+        predictions = [
+            _build_prediction(float(price), model, matched_fields)
+            for price, (_, matched_fields) in zip(price_estimates, resolved)
+        ]
+        metrics.STAGE_INTERVAL.observe(time.perf_counter() - start)
+        metrics.mark_handler_end()
+        return predictions
+
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Lỗi khi dự đoán batch: {str(e)}"
+        )
+
+def _explain_rows(rows: List[dict], model: ModelBundle) -> List[tuple]:
+    """
+    (base_value, contribution theo cột gốc) cho từng dòng qua cache giải thích;
+    các dòng chưa có được tính TreeSHAP chung 1 lần.
+    """
+    keys = [_cache_key(row) for row in rows]
+    results: List[Optional[tuple]] = [explanation_cache.get(key, model.version) for key in keys]
+    miss_idx = [i for i, result in enumerate(results) if result is None]
+    if miss_idx:
+        start = time.perf_counter()
+        contributions, base_values = _run_model(model.explainer.explain_rows, [rows[i] for i in miss_idx])
+        metrics.STAGE_EXPLAIN.observe(time.perf_counter() - start)
+        for i, values, base_value in zip(miss_idx, contributions, base_values):
+            results[i] = (float(base_value), tuple(values.tolist()))
+            explanation_cache.put(keys[i], results[i], model.version)
+    return results
+
+def _build_explanation(row: dict, price_estimate: float, explanation: tuple, model: ModelBundle,
+                       top_k: int, matched_fields: Optional[Dict[str, FieldMatch]] = None) -> PriceExplanation:
+    """Gắn top_k yếu tố ảnh hưởng lớn nhất vào kết quả dự đoán"""
+    base_value, values = explanation
+    ranked = sorted(zip(model.explainer.columns, values), key=lambda item: abs(item[1]), reverse=True)
+    contributions = [
+        FeatureContribution(
+            feature=_INPUT_FIELDS.get(column, column),
+            value=row[column],
+            contribution=round(value, 1),
+        )
+        for column, value in ranked[:top_k]
+    ]
+    prediction = _build_prediction(price_estimate, model, matched_fields)
+    return PriceExplanation(**prediction.model_dump(), base_value=round(base_value, 1), contributions=contributions)
+
+def _explain_cars(cars: List[CarInput], model: ModelBundle, top_k: int) -> List[PriceExplanation]:
+    if model.explainer is None:
+        raise HTTPException(status_code=501, detail=f"Backend {model.backend} không hỗ trợ giải thích giá.")
+    try:
+        resolved = [_resolve_row(_car_to_row(car), model) for car in cars]
+        rows = [row for row, _ in resolved]
+        price_estimates = _predict_rows(rows, model)
+        explanations = _explain_rows(rows, model)
+        return [
+            _build_explanation(row, float(price), explanation, model, top_k, matched_fields)
+            for (row, matched_fields), price, explanation in zip(resolved, price_estimates, explanations)
+        ]
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Lỗi khi giải thích giá: {str(e)}"
+        )
+
+@app.post("/predict/explain", response_model=PriceExplanation)
+def explain_price(car: CarInput, top_k: int = Query(len(FEATURE_COLUMNS), ge=1, le=len(FEATURE_COLUMNS))):
+    """
+    Dự đoán giá kèm các yếu tố ảnh hưởng nhiều nhất (TreeSHAP có sẵn trong XGBoost, cộng gộp
+    các cột one-hot về brand / model / version / color, cộng year và mileage_km).
+    """
+    metrics.mark_handler_start()
+    model = _get_model()
+    explanation = _explain_cars([car], model, top_k)[0]
+    metrics.mark_handler_end()
+    return explanation
+
+@app.post("/predict/explain/batch", response_model=List[PriceExplanation])
+def explain_price_batch(cars: List[CarInput],
+                        top_k: int = Query(len(FEATURE_COLUMNS), ge=1, le=len(FEATURE_COLUMNS))):
+    """Như /predict/explain cho nhiều xe: các xe chưa có trong cache được tính chung 1 lần"""
+    metrics.mark_handler_start()
+    model = _get_model()
+
+    if len(cars) > EXPLAIN_MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch quá lớn: {len(cars)} xe (tối đa {EXPLAIN_MAX_BATCH_SIZE})."
+        )
+
+    if not cars:
+        return []
+
+    explanations = _explain_cars(cars, model, top_k)
+    metrics.mark_handler_end()
+    return explanations
+
+@app.post("/predict/curve", response_model=DepreciationCurves)
+def predict_price_curve(car: CarInput,
+                        points: int = Query(CURVE_MILEAGE_POINTS, ge=2, le=100),
+                        max_mileage_km: int = Query(CURVE_MAX_MILEAGE_KM, ge=1000, le=1_000_000)):
+    """
+    Đường giá theo km cho từng năm sản xuất của dòng xe (năm lấy từ metadata, luôn có năm của xe
+    gửi lên), giữ nguyên hãng / dòng / phiên bản / màu. Cả lưới (kèm xe gốc) được predict chung
+    1 lần qua bảng giá tính sẵn + cache như /predict thay vì points x số năm request riêng.
+    """
+    metrics.mark_handler_start()
+    model = _get_model()
+
+    try:
+        row, matched_fields = _resolve_row(_car_to_row(car), model)
+        years = metadata_index.years(row['make'], row['model']) if metadata_index is not None else []
+        years = sorted(set(years) | {row['year']})
+        # Làm tròn mốc km tới nghìn cho dễ đọc trên biểu đồ
+        mileages = sorted({int(km) for km in np.linspace(0, max_mileage_km, points).round(-3)})
+        rows = [row] + [dict(row, year=year, mileage=km) for year in years for km in mileages]
+        prices = _predict_rows(rows, model)
+
+        start = time.perf_counter()
+        n = len(mileages)
+        curves = [
+            YearCurve(year=year, prices=[round(price, 0) for price in prices[1 + i * n:1 + (i + 1) * n]])
+            for i, year in enumerate(years)
+        ]
+        result = DepreciationCurves(
+            base=_build_prediction(float(prices[0]), model, matched_fields), mileage_km=mileages, curves=curves
+        )
+        metrics.STAGE_INTERVAL.observe(time.perf_counter() - start)
+        metrics.mark_handler_end()
+        return result
+
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Lỗi khi dự đoán đường giá: {str(e)}"
+        )
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, item['loc']))}: {item['msg']}" for item in error.errors())
+
+def _process_bulk_chunk(lines: List[tuple], parser: bulk.BulkParser, writer: bulk.BulkWriter,
+                        model: ModelBundle) -> bytes:
+    """
+    Parse + validate + predict 1 chunk dòng (chạy trên thread pool), predict các dòng hợp lệ
+    trong 1 lần gọi; trả về bytes kết quả đúng thứ tự dòng, dòng lỗi ghi lỗi tại chỗ.
+    """
+    entries = []  # (số dòng, id, row, matched_fields, lỗi)
+    for line_no, line in lines:
+        if line is None:
+            entries.append((line_no, None, None, None, f"Dòng dài quá {bulk.MAX_LINE_BYTES} byte"))
+            continue
+        record_id = None
+        try:
+            record = parser.parse(line, first=line_no == 1)
+            if record is None:
+                continue
+            record_id = record.pop("id", None)
+            car = CarInput.model_validate(record)
+        except ValidationError as e:
+            entries.append((line_no, record_id, None, None, _validation_message(e)))
+            continue
+        except ValueError as e:
+            # Gồm cả JSON hỏng và UTF-8 không hợp lệ
+            entries.append((line_no, record_id, None, None, str(e)))
+            continue
+        except Exception as e:
+            # Lỗi parse khác không lường trước: chỉ dòng này báo lỗi, upload vẫn chạy tiếp
+            entries.append((line_no, record_id, None, None, f"Dòng không hợp lệ: {type(e).__name__}: {e}"))
+            continue
+        row, matched_fields = _resolve_row(_car_to_row(car), model)
+        entries.append((line_no, record_id, row, matched_fields, None))
+
+    rows = [entry[2] for entry in entries if entry[4] is None]
+    chunk_error = None
+    try:
+        prices = iter(_predict_rows(rows, model) if rows else [])
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        chunk_error = f"Lỗi khi dự đoán: {e}"
+
+    results = []
+    for line_no, record_id, row, matched_fields, error in entries:
+        prediction = None
+        if error is None:
+            error = chunk_error
+        if error is None:
+            prediction = _build_prediction(float(next(prices)), model, matched_fields).model_dump(exclude_none=True)
+        results.append((line_no, record_id, prediction, error))
+    return writer.encode(results)
+
+@app.post("/predict/stream")
+async def predict_price_stream(request: Request):
+    """
+    Định giá hàng loạt: body NDJSON (application/x-ndjson, mỗi dòng 1 CarInput, thêm "id" tuỳ chọn)
+    hoặc CSV (text/csv, header là tên trường CarInput + cột id tuỳ chọn).
+    Body được đọc và predict theo từng chunk STREAM_CHUNK_ROWS dòng ngay trong lúc upload; kết quả
+    (cùng định dạng input, mỗi dòng có số dòng input + id) gom vào file tạm rồi stream về khi đọc
+    hết body, để client gửi hết body rồi mới đọc response (fetch/requests...) không bị nghẽn.
+    Dòng lỗi trả về "error" tại chỗ, không làm hỏng cả request.
+    """
+    model = _get_model()
+    fmt = bulk.detect_format(request.headers.get("content-type"))
+    parser, writer = bulk.BulkParser(fmt), bulk.BulkWriter(fmt)
+
+    spool = tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_MAX_MEMORY)
+    try:
+        spool.write(writer.header())
+        lines = []
+        async for item in bulk.split_lines(request.stream()):
+            lines.append(item)
+            if len(lines) >= STREAM_CHUNK_ROWS:
+                spool.write(await run_in_threadpool(_process_bulk_chunk, lines, parser, writer, model))
+                lines = []
+        if lines:
+            spool.write(await run_in_threadpool(_process_bulk_chunk, lines, parser, writer, model))
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+
+    def read_spool():
+        try:
+            while True:
+                chunk = spool.read(64 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            spool.close()
+
+    return StreamingResponse(
+        read_spool(),
+        media_type="text/csv; charset=utf-8" if fmt == "csv" else "application/x-ndjson",
+        headers={"X-Bulk-Rows": str(writer.rows), "X-Bulk-Errors": str(writer.errors),
+                 "X-Model-Version": model.version},
+    )
+
+def _predict_columnar(batch: columnar_rpc.ColumnarBatch, model: ModelBundle) -> bytes:
+    """
+    Validate + predict 1 batch dạng cột bằng phép toán vector (chạy trên thread pool).
+    Text được chuẩn hoá / khớp gần đúng theo từng giá trị trong từ điển thay vì từng dòng.
+    Không qua bảng giá tính sẵn / cache: tra từng dòng tốn ngang predict vector hoá cả batch.
+    """
+    columns, invalid = {}, []
+    for field in columnar_rpc.TEXT_FIELDS:
+        values, codes = batch.text[field]
+        column = 'make' if field == 'brand' else field
+        cleaned = [value.strip() for value in values]
+        if field in ('version', 'color'):
+            cleaned = [value or "Unknown" for value in cleaned]
         else:
-            confidence = "Trung bình"
-
-        return PricePrediction(
-            price_estimate=round(price_estimate, 0),
-            price_min=round(price_min, 0),
-            price_max=round(price_max, 0),
-            confidence_level=confidence,
-            mae_estimate=round(test_mae, 0)
+            empty = np.array([not value for value in cleaned], dtype=bool)
+            invalid.append((empty[codes], f"{field}: không được để trống"))
+        if model.resolver is not None:
+            cleaned = [value if value in ("", "Unknown") else model.resolver.resolve_value(column, value)
+                       for value in cleaned]
+        columns[column] = np.array(cleaned, dtype=object)[codes]
+    columns['year'] = batch.year.astype(np.float64)
+    columns['mileage'] = batch.mileage_km.astype(np.float64)
+    invalid.append(((batch.year < 1990) | (batch.year > 2030), "year: phải trong khoảng 1990-2030"))
+    invalid.append((batch.mileage_km < 0, "mileage_km: phải >= 0"))
+
+    errors: Dict[int, str] = {}
+    for mask, message in invalid:
+        for row in np.flatnonzero(mask):
+            errors[int(row)] = f"{errors[int(row)]}; {message}" if int(row) in errors else message
+
+    prices = np.full(batch.n_rows, np.nan, dtype=np.float32)
+    valid = np.ones(batch.n_rows, dtype=bool)
+    valid[list(errors)] = False
+    if valid.any():
+        prices[valid] = _run_model(model.predict_columns, {column: values[valid] for column, values in columns.items()})
+    return columnar_rpc.encode_response(prices, errors, model.mae, model.version)
+
+@app.post("/rpc/predict")
+async def predict_price_rpc(request: Request):
+    """
+    Định giá hàng loạt cho backend nội bộ: body nhị phân dạng cột (application/x-car-columns),
+    trả về float32 giá dự đoán (application/x-car-prices), xem service/columnar_rpc.py.
+    Bỏ qua JSON + pydantic từng xe; dòng không hợp lệ có giá NaN kèm lỗi theo chỉ số dòng.
+    """
+    model = _get_model()
+    content_type = request.headers.get("content-type")
+    if content_type and not content_type.startswith(columnar_rpc.REQUEST_MEDIA_TYPE):
+        raise HTTPException(status_code=415, detail=f"Content-Type phải là {columnar_rpc.REQUEST_MEDIA_TYPE}")
+    try:
+        batch = columnar_rpc.decode_request(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Body không hợp lệ: {e}")
+    if batch.n_rows > RPC_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch quá lớn: {batch.n_rows} xe (tối đa {RPC_MAX_ROWS})."
         )
 
+    try:
+        content = await run_in_threadpool(_predict_columnar, batch, model)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(
-            status_code=500, 
+            status_code=500,
             detail=f"Lỗi khi dự đoán: {str(e)}"
-        )
\ No newline at end of file
+        )
+    return Response(content=content, media_type=columnar_rpc.RESPONSE_MEDIA_TYPE,
+                    headers={"X-Model-Version": model.version})
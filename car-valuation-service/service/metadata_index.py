@@ -0,0 +1,123 @@
+"""
+Index metadata định giá (make -> model -> year -> version -> color) dựng sẵn từ metadata.json.
+
+Mọi response của /metadata/... được serialize + tính ETag 1 lần lúc load, request chỉ còn
+tra dict theo path rồi trả bytes có sẵn (hoặc 304 nếu client gửi If-None-Match khớp).
+Thứ tự giống API cũ của Node server: make/model/version/color tăng dần, year giảm dần.
+"""
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+
+
+def _encode(payload) -> CachedResponse:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    # ETag mạnh: cùng nội dung byte -> cùng ETag ở mọi worker / mọi lần khởi động
+    return CachedResponse(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+
+class MetadataIndex:
+    def __init__(self, tree: Dict[str, Dict[str, Dict[int, Dict[str, List[str]]]]]):
+        # tree[make][model][year][version] = [colors]
+        self.tree = tree
+        self._responses: Dict[Tuple, CachedResponse] = {}
+        self._build()
+
+    @classmethod
+    def from_metadata(cls, metadata: dict) -> "MetadataIndex":
+        tree = {}
+        make_models = metadata.get("make_models", {})
+        model_years = metadata.get("model_years", {})
+        year_versions = metadata.get("year_versions", {})
+        version_colors = metadata.get("version_colors", {})
+        for make in metadata.get("makes", make_models.keys()):
+            models = tree.setdefault(make, {})
+            for model in make_models.get(make, []):
+                years = models.setdefault(model, {})
+                for year in model_years.get(make, {}).get(model, []):
+                    versions = years.setdefault(int(year), {})
+                    for version in year_versions.get(make, {}).get(model, {}).get(str(year), []):
+                        colors = version_colors.get(make, {}).get(model, {}).get(str(year), {}).get(version, [])
+                        versions[version] = sorted(set(colors))
+        return cls(tree)
+
+    @classmethod
+    def load(cls, path: Path) -> "MetadataIndex":
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_metadata(json.load(f))
+
+    def _model_subtree(self, make: str, model: str) -> dict:
+        years = self.tree[make][model]
+        return {
+            "make": make,
+            "model": model,
+            "years": [
+                {
+                    "year": year,
+                    "versions": [
+                        {"version": version, "colors": years[year][version]}
+                        for version in sorted(years[year])
+                    ],
+                }
+                for year in sorted(years, reverse=True)
+            ],
+        }
+
+    def _build(self) -> None:
+        responses = self._responses
+        makes = sorted(self.tree)
+        responses[("makes",)] = _encode(makes)
+        full_tree = []
+        for make in makes:
+            models = self.tree[make]
+            responses[("models", make)] = _encode(sorted(models))
+            make_tree = []
+            for model in sorted(models):
+                years = models[model]
+                responses[("years", make, model)] = _encode(sorted(years, reverse=True))
+                for year, versions in years.items():
+                    responses[("versions", make, model, year)] = _encode(sorted(versions))
+                    # Không chỉ định version -> mọi màu của năm đó
+                    all_colors = {color for colors in versions.values() for color in colors}
+                    responses[("colors", make, model, year, None)] = _encode(sorted(all_colors))
+                    for version, colors in versions.items():
+                        responses[("colors", make, model, year, version)] = _encode(colors)
+                subtree = self._model_subtree(make, model)
+                responses[("tree", make, model)] = _encode(subtree)
+                make_tree.append({"model": model, "years": subtree["years"]})
+            responses[("tree", make)] = _encode({"make": make, "models": make_tree})
+            full_tree.append({"make": make, "models": make_tree})
+        responses[("tree",)] = _encode(full_tree)
+
+    def get(self, *path) -> Optional[CachedResponse]:
+        """Response dựng sẵn theo path, vd get("years", "Toyota", "Vios"); None nếu không có"""
+        return self._responses.get(path)
+
+    def years(self, make: str, model: str) -> List[int]:
+        """Các năm sản xuất có trong metadata của 1 dòng xe (tăng dần), rỗng nếu không có"""
+        return sorted(self.tree.get(make, {}).get(model, {}))
+
+    def stats(self) -> dict:
+        return {
+            "makes": len(self.tree),
+            "models": sum(len(models) for models in self.tree.values()),
+            "responses": len(self._responses),
+            "bytes": sum(len(response.body) for response in self._responses.values()),
+        }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match dùng so sánh yếu (RFC 9110): bỏ tiền tố W/, hỗ trợ danh sách và '*'"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
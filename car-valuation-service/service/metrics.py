@@ -0,0 +1,424 @@
+"""
+Metric nội bộ của service + xuất ra định dạng Prometheus text cho /metrics.
+
+- Hot path không dùng lock: mỗi thread ghi vào shard riêng (threading.local),
+  chỉ lúc scrape mới cộng dồn các shard lại.
+- Chạy nhiều worker uvicorn: đặt METRICS_MULTIPROC_DIR, mỗi process định kỳ ghi
+  snapshot ra <dir>/<pid>-<start>.json và /metrics cộng dồn snapshot của mọi process.
+  Gauge không cộng được (vd thời gian khởi động): mỗi process 1 series có nhãn pid, process
+  đã chết thì bỏ gauge của nó (counter / histogram vẫn giữ để không bị giảm).
+  Nên xoá sạch thư mục này mỗi lần khởi động lại toàn bộ service (giống prometheus_client).
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (sample_name, labels, value)
+Sample = Tuple[str, Tuple[Tuple[str, str], ...], float]
+
+
+class _Sharded:
+    """Mảng số đếm chia shard theo thread: ghi không lock, đọc thì cộng các shard"""
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._shards: List[list] = []
+        self._shards_lock = threading.Lock()
+
+    def shard(self) -> list:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            # Chỉ lock 1 lần khi thread mới ghi lần đầu
+            shard = self._local.shard = [0] * self._size
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def totals(self) -> list:
+        with self._shards_lock:
+            shards = list(self._shards)
+        totals = [0] * self._size
+        for shard in shards:
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+    def reset(self) -> None:
+        with self._shards_lock:
+            for shard in self._shards:
+                shard[:] = [0] * self._size
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, object] = {}
+        self._children_lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values, **labels):
+        """Lấy child theo nhãn; nên giữ lại child để dùng trên hot path"""
+        key = tuple(str(v) for v in values) if values else tuple(str(labels[n]) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._children_lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _unlabelled(self):
+        return self.labels(*[""] * len(self.labelnames)) if self.labelnames else self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self) -> List[Sample]:
+        samples = []
+        for key, child in list(self._children.items()):
+            labels = tuple(zip(self.labelnames, key))
+            samples.extend(child.samples(self.name, labels))
+        return samples
+
+
+class _CounterChild:
+    def __init__(self):
+        self._values = _Sharded(1)
+
+    def inc(self, amount: float = 1) -> None:
+        self._values.shard()[0] += amount
+
+    @property
+    def value(self) -> float:
+        return self._values.totals()[0]
+
+    def samples(self, name, labels) -> List[Sample]:
+        return [(name, labels, self.value)]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self._unlabelled().inc(amount)
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # [count bucket 0..n (n = +Inf), sum, count]
+        self._values = _Sharded(len(buckets) + 3)
+
+    def observe(self, value: float) -> None:
+        shard = self._values.shard()
+        shard[bisect_left(self.buckets, value)] += 1
+        shard[-2] += value
+        shard[-1] += 1
+
+    def snapshot(self) -> dict:
+        """Dạng dict cho /health"""
+        totals = self._values.totals()
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.buckets + (float("inf"),), totals):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+        total_sum, count = totals[-2], totals[-1]
+        return {
+            "count": count,
+            "sum": round(total_sum, 6),
+            "mean": round(total_sum / count, 6) if count else 0.0,
+            "buckets": buckets,
+        }
+
+    def samples(self, name, labels) -> List[Sample]:
+        totals = self._values.totals()
+        samples, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), totals):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            samples.append((f"{name}_bucket", labels + (("le", le),), cumulative))
+        samples.append((f"{name}_sum", labels, totals[-2]))
+        samples.append((f"{name}_count", labels, totals[-1]))
+        return samples
+
+
+class Histogram(_Metric):
+    """Histogram bucket cố định (giống Prometheus: bucket 'le' tích luỹ + sum + count)"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                 labelnames: Sequence[str] = (), registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._unlabelled().observe(value)
+
+    def snapshot(self) -> dict:
+        return self._unlabelled().snapshot()
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[tuple]]] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics[metric.name] = metric
+
+    def add_collector(self, collector: Callable[[], Iterable[tuple]]) -> None:
+        """collector() trả về [(name, kind, help, [(labels_dict, value)])], gọi lúc scrape"""
+        self._collectors.append(collector)
+
+    def snapshot(self) -> dict:
+        """{name: {kind, help, samples: [[sample_name, [[label, value]], value]]}} (JSON được)"""
+        families = {}
+        for metric in list(self._metrics.values()):
+            families[metric.name] = {
+                "kind": metric.kind,
+                "help": metric.documentation,
+                "samples": [[n, [list(kv) for kv in labels], v] for n, labels, v in metric.collect()],
+            }
+        for collector in self._collectors:
+            for name, kind, documentation, values in collector():
+                families[name] = {
+                    "kind": kind,
+                    "help": documentation,
+                    "samples": [[name, [[k, str(v)] for k, v in labels.items()], value] for labels, value in values],
+                }
+        return families
+
+    def reset(self) -> None:
+        """Đưa mọi counter/histogram về 0 (collector không bị ảnh hưởng)"""
+        for metric in list(self._metrics.values()):
+            for child in list(metric._children.values()):
+                child._values.reset()
+
+
+REGISTRY = Registry()
+
+
+# --- MULTI-PROCESS ---
+_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 5))
+_process_file: Optional[Path] = None
+_flusher_started = False
+
+
+def _snapshot_path() -> Path:
+    global _process_file
+    # Tên file theo pid + thời điểm tạo: pid bị tái sử dụng không ghi đè process cũ
+    if _process_file is None or not _process_file.name.startswith(f"{os.getpid()}-"):
+        _process_file = Path(_MULTIPROC_DIR) / f"{os.getpid()}-{time.time_ns()}.json"
+    return _process_file
+
+
+def flush_snapshot() -> None:
+    """Ghi snapshot của process hiện tại ra thư mục dùng chung (ghi file tạm rồi rename)"""
+    if not _MULTIPROC_DIR:
+        return
+    path = _snapshot_path()
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(REGISTRY.snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+def start_flusher() -> None:
+    """Bật thread định kỳ ghi snapshot (chỉ khi chạy multi-process)"""
+    global _flusher_started
+    if not _MULTIPROC_DIR or _flusher_started:
+        return
+    Path(_MULTIPROC_DIR).mkdir(parents=True, exist_ok=True)
+    _flusher_started = True
+
+    def loop():
+        while True:
+            time.sleep(_FLUSH_INTERVAL)
+            try:
+                flush_snapshot()
+            except OSError as e:
+                print(f"⚠️ Không ghi được metrics snapshot: {e}")
+
+    threading.Thread(target=loop, name="metrics-flusher", daemon=True).start()
+
+
+def reset_after_fork() -> None:
+    """
+    Gọi trong worker vừa fork: shard được copy nguyên từ master nên nếu mọi worker
+    giữ lại thì số liệu của master (load model, warmup) bị cộng N lần khi merge.
+    """
+    global _process_file, _flusher_started
+    REGISTRY.reset()
+    _process_file = None
+    _flusher_started = False
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge_into(merged: dict, families: dict, pid: str) -> None:
+    """Cộng counter / histogram vào merged; gauge giữ riêng từng process bằng nhãn pid"""
+    for name, family in families.items():
+        target = merged.setdefault(name, {"kind": family["kind"], "help": family["help"], "samples": {}})
+        gauge = family["kind"] == "gauge"
+        for sample_name, labels, value in family["samples"]:
+            labels = tuple(map(tuple, labels))
+            if gauge:
+                target["samples"][(sample_name, labels + (("pid", pid),))] = value
+            else:
+                key = (sample_name, labels)
+                target["samples"][key] = target["samples"].get(key, 0) + value
+
+
+def _merged_families() -> dict:
+    families = REGISTRY.snapshot()
+    if not _MULTIPROC_DIR:
+        return families
+    own = _snapshot_path().name
+    merged = {}
+    _merge_into(merged, families, str(os.getpid()))
+    for path in Path(_MULTIPROC_DIR).glob("*.json"):
+        if path.name == own:
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                other = json.load(f)
+        except (OSError, ValueError):
+            continue
+        pid = path.name.split("-", 1)[0]
+        if not _pid_alive(int(pid)):
+            other = {name: family for name, family in other.items() if family["kind"] != "gauge"}
+        _merge_into(merged, other, pid)
+    return {
+        name: {**family, "samples": [[k[0], k[1], v] for k, v in family["samples"].items()]}
+        for name, family in merged.items()
+    }
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_prometheus() -> str:
+    """Xuất toàn bộ metric (đã cộng dồn các process) theo Prometheus text format 0.0.4"""
+    lines = []
+    for name, family in sorted(_merged_families().items()):
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['kind']}")
+        for sample_name, labels, value in family["samples"]:
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+            lines.append(f"{sample_name}{{{label_text}}} {float(value)!r}" if label_text
+                         else f"{sample_name} {float(value)!r}")
+    return "\n".join(lines) + "\n"
+
+
+# --- METRIC CỦA SERVICE ---
+REQUESTS = Counter("valuation_requests_total", "Số request HTTP theo endpoint và status", ("endpoint", "status"))
+ERRORS = Counter("valuation_request_errors_total", "Số request lỗi (5xx hoặc exception) theo endpoint", ("endpoint",))
+REQUEST_SECONDS = Histogram("valuation_request_duration_seconds", "Thời gian xử lý request", labelnames=("endpoint",))
+STAGE_SECONDS = Histogram(
+    "valuation_stage_duration_seconds",
+    "Thời gian từng giai đoạn: parse_validate, resolve_fields, cache_lookup, build_features, model_predict, "
+    "interval, explain, serialize",
+    labelnames=("stage",),
+)
+MODEL_LOAD_SECONDS = Histogram(
+    "valuation_model_load_seconds", "Thời gian load model (startup + reload)",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+# Child dùng trên hot path (tránh lookup nhãn mỗi request)
+STAGE_PARSE_VALIDATE = STAGE_SECONDS.labels("parse_validate")
+STAGE_RESOLVE_FIELDS = STAGE_SECONDS.labels("resolve_fields")
+STAGE_CACHE_LOOKUP = STAGE_SECONDS.labels("cache_lookup")
+STAGE_BUILD_FEATURES = STAGE_SECONDS.labels("build_features")
+STAGE_MODEL_PREDICT = STAGE_SECONDS.labels("model_predict")
+STAGE_INTERVAL = STAGE_SECONDS.labels("interval")
+STAGE_EXPLAIN = STAGE_SECONDS.labels("explain")
+STAGE_SERIALIZE = STAGE_SECONDS.labels("serialize")
+
+# Mốc thời gian của request hiện tại (middleware tạo, endpoint ghi thêm)
+request_timing: ContextVar[Optional[dict]] = ContextVar("request_timing", default=None)
+
+
+def mark_handler_start() -> None:
+    """Gọi đầu endpoint: thời gian từ lúc nhận request tới đây = đọc body + parse JSON + validate pydantic"""
+    timing = request_timing.get()
+    if timing is not None:
+        now = time.perf_counter()
+        STAGE_PARSE_VALIDATE.observe(now - timing["start"])
+
+
+def mark_handler_end() -> None:
+    """Gọi trước khi endpoint return: phần còn lại tới lúc gửi header = serialize response"""
+    timing = request_timing.get()
+    if timing is not None:
+        timing["handler_end"] = time.perf_counter()
+
+
+class MetricsMiddleware:
+    """ASGI middleware thuần (nhẹ hơn BaseHTTPMiddleware): đếm request, lỗi, latency, serialize"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = {"start": time.perf_counter()}
+        token = request_timing.set(timing)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                handler_end = timing.get("handler_end")
+                if handler_end is not None:
+                    STAGE_SERIALIZE.observe(time.perf_counter() - handler_end)
+            await send(message)
+
+        failed = False
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            request_timing.reset(token)
+            endpoint = _endpoint(scope)
+            REQUESTS.labels(endpoint, status["code"]).inc()
+            REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - timing["start"])
+            if failed or status["code"] >= 500:
+                ERRORS.labels(endpoint).inc()
+
+
+def _endpoint(scope) -> str:
+    # Dùng path template của route để tránh bùng nổ số nhãn
+    route = scope.get("route")
+    return getattr(route, "path", None) or "other"
@@ -0,0 +1,412 @@
+"""
+Load model + metrics thành một ModelBundle bất biến.
+
+Service giữ 1 tham chiếu tới bundle đang active; reload chỉ cần dựng bundle mới
+(ở background thread), smoke test rồi gán lại tham chiếu -> swap nguyên tử,
+request đang chạy vẫn dùng bundle cũ tới khi xong.
+"""
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from service.explain import ContributionExplainer
+from service.fast_encoder import CompiledEncoder, FastPredictor, sample_rows
+from service.fuzzy_index import CategoryResolver
+from service.metrics import STAGE_BUILD_FEATURES, STAGE_MODEL_PREDICT
+from service.valuation_grid import ValuationGrid
+
+# --- CẤU HÌNH PATH ---
+BASE_DIR = Path(__file__).resolve().parents[1]
+MODELS_DIR = BASE_DIR / "models"
+# Trỏ vào file Pipeline mới (chứa cả xử lý dữ liệu + model XGBoost)
+MODEL_PATH = MODELS_DIR / "best_car_price_pipeline.pkl"
+# Metrics bây giờ lưu dưới dạng JSON
+METRICS_PATH = MODELS_DIR / "model_metrics.json"
+# Artifact cho chế độ lean (export bằng: python retrain_model.py --export-only)
+ENCODER_SPEC_PATH = MODELS_DIR / "encoder_spec.json"
+# Artifact cho chế độ onnx (preprocessing + cây trong 1 file, export cùng lúc với lean)
+ONNX_MODEL_PATH = MODELS_DIR / "car_price_pipeline.onnx"
+# Bảng giá tính sẵn (build bằng: python build_valuation_grid.py)
+VALUATION_GRID_PATH = MODELS_DIR / "valuation_grid.npz"
+
+# Thứ tự cột model dùng lúc train
+FEATURE_COLUMNS = ['make', 'model', 'year', 'version', 'color', 'mileage']
+
+DEFAULT_MAE = 35.0  # Default fallback từ log train gần nhất
+DEFAULT_R2 = 0.98   # Default fallback
+# Nửa độ rộng khoảng giá = MAE x hệ số này
+PRICE_RANGE_MAE_FACTOR = 1.5
+
+# Dòng dùng để smoke test model mới trước khi swap
+SMOKE_ROW = {
+    'make': 'Toyota', 'model': 'Vios', 'year': 2020,
+    'version': '1.5G CVT', 'color': 'Trắng', 'mileage': 50000,
+}
+
+
+@dataclass(frozen=True)
+class ModelBundle:
+    """Model + metrics của 1 lần load; không sửa sau khi tạo"""
+    backend: str
+    version: str
+    pipeline: object = None
+    fast_predictor: Optional[FastPredictor] = None
+    # Backend onnx: OnnxPredictor (kiểu object để không phải import onnxruntime ở backend khác)
+    onnx_predictor: object = None
+    # Bảng giá tính sẵn cho cấu hình đã biết (None nếu tắt / không khớp version)
+    grid: Optional[ValuationGrid] = None
+    # Khớp gần đúng text input về category của encoder (None nếu tắt)
+    resolver: Optional[CategoryResolver] = None
+    # Giải thích giá bằng TreeSHAP của XGBoost (None với backend onnx)
+    explainer: Optional[ContributionExplainer] = None
+    mae: float = DEFAULT_MAE
+    r2: float = DEFAULT_R2
+    loaded_at: float = 0.0
+    load_seconds: float = 0.0
+    # Thời gian từng pha: import_libs, load_model, warmup (giây)
+    timings: dict = field(default_factory=dict)
+
+    @property
+    def model_type(self) -> str:
+        if self.pipeline is not None:
+            return str(type(self.pipeline))
+        if self.onnx_predictor is not None:
+            return str(type(self.onnx_predictor))
+        return str(type(self.fast_predictor.booster))
+
+    def predict_rows(self, rows: List[dict]):
+        """Predict 1 lần cho cả danh sách: ONNX / fast-path encoder nếu có, ngược lại DataFrame + Pipeline"""
+        start = time.perf_counter()
+        if self.onnx_predictor is not None:
+            features = self.onnx_predictor.build_inputs(rows)
+        elif self.fast_predictor is not None:
+            features = self.fast_predictor.encode(rows)
+        else:
+            import pandas as pd
+            features = pd.DataFrame(rows, columns=FEATURE_COLUMNS)
+        return self._predict_features(features, start)
+
+    def predict_columns(self, columns: dict):
+        """
+        Predict dữ liệu dạng cột {cột model: mảng} (cột số float, NaN = thiếu) bằng phép toán
+        vector, không dựng dict từng dòng
+        """
+        start = time.perf_counter()
+        if self.onnx_predictor is not None:
+            features = self.onnx_predictor.build_column_inputs(columns)
+        elif self.fast_predictor is not None:
+            features = self.fast_predictor.encoder.encode_columns(columns)
+        else:
+            import pandas as pd
+            features = pd.DataFrame(columns, columns=FEATURE_COLUMNS)
+        return self._predict_features(features, start)
+
+    def _predict_features(self, features, start: float):
+        built = time.perf_counter()
+        STAGE_BUILD_FEATURES.observe(built - start)
+        if self.onnx_predictor is not None:
+            prices = self.onnx_predictor.predict_inputs(features)
+        elif self.fast_predictor is not None:
+            prices = self.fast_predictor.predict_matrix(features)
+        else:
+            prices = self.pipeline.predict(features)
+        STAGE_MODEL_PREDICT.observe(time.perf_counter() - built)
+        return prices
+
+    def price_range(self, price: float) -> tuple:
+        """Khoảng giá (min, max) quanh giá dự đoán"""
+        # Dùng hệ số an toàn 2.0 * MAE để bao phủ 95% trường hợp (theo quy tắc thống kê cơ bản)
+        # Tuy nhiên để user thấy khoảng hẹp hơn cho hấp dẫn, ta dùng 1.5 hoặc 1.0 tùy chiến lược
+        margin = self.mae * PRICE_RANGE_MAE_FACTOR
+        return max(0.0, price - margin), price + margin
+
+    @property
+    def confidence_level(self) -> str:
+        # Xác định text độ tin cậy
+        if self.r2 > 0.90:
+            return "Rất cao (>90%)"
+        if self.r2 > 0.80:
+            return "Cao (>80%)"
+        return "Trung bình"
+
+    def set_nthread(self, nthread: int) -> None:
+        """Số thread XGBoost / ONNX Runtime dùng cho mỗi lần predict (booster dùng chung giữa fast path và Pipeline)"""
+        if self.fast_predictor is not None:
+            self.fast_predictor.booster.set_param({"nthread": nthread})
+        if self.pipeline is not None:
+            self.pipeline.steps[-1][1].set_params(n_jobs=nthread)
+        if self.onnx_predictor is not None:
+            self.onnx_predictor.set_nthread(nthread)
+
+
+def file_fingerprint(path: Path) -> str:
+    """Hash nội dung file model để nhận biết artifact thay đổi"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def _load_lean() -> dict:
+    """Chế độ lean: chỉ load booster native + encoder spec"""
+    if not ENCODER_SPEC_PATH.exists():
+        raise RuntimeError(
+            f"❌ Không tìm thấy encoder spec tại: {ENCODER_SPEC_PATH}. "
+            "Chạy: python retrain_model.py --export-only"
+        )
+
+    try:
+        fast_predictor = FastPredictor.load(ENCODER_SPEC_PATH)
+        print(f"✅ Đã load Booster native (lean) từ: {ENCODER_SPEC_PATH.name}")
+    except Exception as e:
+        raise RuntimeError(f"❌ Lỗi khi load booster native: {e}")
+
+    version = file_fingerprint(fast_predictor.booster_path)
+    print(f"   - Version: {version}")
+    return {"fast_predictor": fast_predictor, "version": version}
+
+
+def _load_onnx() -> dict:
+    """Chế độ onnx: chỉ cần onnxruntime + numpy"""
+    from service.onnx_backend import OnnxPredictor
+
+    if not ONNX_MODEL_PATH.exists():
+        raise RuntimeError(
+            f"❌ Không tìm thấy model ONNX tại: {ONNX_MODEL_PATH}. "
+            "Chạy: python retrain_model.py --export-only"
+        )
+
+    try:
+        onnx_predictor = OnnxPredictor.load(ONNX_MODEL_PATH)
+        print(f"✅ Đã load model ONNX từ: {ONNX_MODEL_PATH.name}")
+    except Exception as e:
+        raise RuntimeError(f"❌ Lỗi khi load model ONNX: {e}")
+
+    version = file_fingerprint(ONNX_MODEL_PATH)
+    print(f"   - Version: {version}")
+    return {"onnx_predictor": onnx_predictor, "version": version}
+
+
+def _load_pipeline(fast_encoder_enabled: bool, nthread: int = 0) -> dict:
+    """Chế độ mặc định: load Pipeline sklearn bằng joblib (nthread > 0: đặt trước lần predict kiểm tra đầu tiên)"""
+    import joblib
+
+    if not MODEL_PATH.exists():
+        raise RuntimeError(f"❌ Không tìm thấy file model tại: {MODEL_PATH}")
+
+    try:
+        # Load pipeline (bao gồm preprocessor + regressor)
+        model_pipeline = joblib.load(MODEL_PATH)
+        print(f"✅ Đã load Model Pipeline thành công từ: {MODEL_PATH.name}")
+        print(f"   - Type: {type(model_pipeline)}")
+    except Exception as e:
+        raise RuntimeError(f"❌ Lỗi khi load model bằng joblib: {e}")
+
+    if nthread > 0:
+        # Booster dùng chung giữa Pipeline và fast path
+        regressor = model_pipeline.steps[-1][1]
+        regressor.set_params(n_jobs=nthread)
+        if hasattr(regressor, 'get_booster'):
+            regressor.get_booster().set_param({"nthread": nthread})
+
+    # Version = hash artifact (cache gắn với version này)
+    version = file_fingerprint(MODEL_PATH)
+    print(f"   - Version: {version}")
+
+    # Dựng fast-path encoder từ thống kê đã học của Pipeline
+    fast_predictor = None
+    if fast_encoder_enabled:
+        try:
+            predictor = FastPredictor.from_pipeline(model_pipeline)
+            predictor.verify_against(model_pipeline, sample_rows(predictor.encoder))
+            fast_predictor = predictor
+            print(f"✅ Fast-path encoder sẵn sàng ({predictor.encoder.n_features} features)")
+        except Exception as e:
+            print(f"⚠️ Không dùng được fast-path encoder: {e}. Dùng Pipeline mặc định.")
+
+    return {"pipeline": model_pipeline, "fast_predictor": fast_predictor, "version": version}
+
+
+def _load_metrics() -> dict:
+    """Đọc MAE / R2 từ file metrics json, lỗi thì dùng giá trị mặc định"""
+    test_mae, test_r2 = DEFAULT_MAE, DEFAULT_R2
+    if METRICS_PATH.exists():
+        try:
+            with open(METRICS_PATH, 'r') as f:
+                metrics = json.load(f)
+                # JSON lưu key là tên cột, ví dụ: {"Test MAE": 34.9, "R2 Score": 0.99}
+                # Cần map đúng key từ file json mà script train đã lưu
+                test_mae = metrics.get('Test MAE', test_mae)
+                test_r2 = metrics.get('R2 Score', test_r2)
+            print(f"✅ Đã load Metrics: MAE={test_mae:.0f} triệu, R2={test_r2:.4f}")
+        except Exception as e:
+            print(f"⚠️ Không thể đọc file metrics json: {e}. Sử dụng giá trị mặc định.")
+    else:
+        print("⚠️ Không tìm thấy file metrics json. Sử dụng giá trị mặc định.")
+    return {"mae": test_mae, "r2": test_r2}
+
+
+def _load_grid(version: str) -> Optional[ValuationGrid]:
+    """Load bảng giá tính sẵn nếu có và được build cho đúng model version này"""
+    if not VALUATION_GRID_PATH.exists():
+        print(f"⚠️ Không tìm thấy {VALUATION_GRID_PATH.name}. Chạy: python build_valuation_grid.py")
+        return None
+    try:
+        grid = ValuationGrid.load(VALUATION_GRID_PATH)
+    except Exception as e:
+        print(f"⚠️ Không đọc được valuation grid: {e}. Dùng model trực tiếp.")
+        return None
+    if not grid.supports(version):
+        print(f"⚠️ Valuation grid build cho model {', '.join(grid.model_versions)}, "
+              f"không khớp version {version}. Bỏ qua bảng.")
+        return None
+    print(f"✅ Đã load valuation grid ({grid.mode}): {len(grid.configs)} cấu hình x {len(grid.knots)} mốc km")
+    return grid
+
+
+def _build_resolver(model: dict, min_score: float) -> Optional[CategoryResolver]:
+    """Index khớp gần đúng trên đúng categories mà OneHotEncoder của model này đã học"""
+    try:
+        if model.get("onnx_predictor") is not None:
+            categories = model["onnx_predictor"].categories
+        elif model.get("fast_predictor") is not None:
+            categories = model["fast_predictor"].encoder.categories
+        else:
+            categories = CompiledEncoder.from_pipeline(model["pipeline"]).categories
+    except Exception as e:
+        print(f"⚠️ Không dựng được index khớp gần đúng: {e}. Dùng input nguyên văn.")
+        return None
+    return CategoryResolver(categories, min_score)
+
+
+def _build_explainer(model: dict) -> Optional[ContributionExplainer]:
+    """Explainer dùng chung booster với fast path; Pipeline không có fast path thì tự dựng encoder"""
+    try:
+        if model.get("fast_predictor") is not None:
+            return ContributionExplainer.from_predictor(model["fast_predictor"])
+        if model.get("pipeline") is not None:
+            return ContributionExplainer.from_predictor(FastPredictor.from_pipeline(model["pipeline"]))
+    except Exception as e:
+        print(f"⚠️ Không dựng được explainer: {e}. /predict/explain trả 501.")
+    return None
+
+
+def _import_libs(backend: str) -> None:
+    """Import trước các thư viện nặng (lazy, chỉ khi load model) để đo riêng thời gian import"""
+    if backend == "onnx":
+        import onnxruntime  # noqa: F401
+        return
+    import xgboost  # noqa: F401
+    if backend != "lean":
+        import joblib  # noqa: F401
+        import pandas  # noqa: F401
+        import sklearn.compose  # noqa: F401
+        import sklearn.pipeline  # noqa: F401
+
+
+def load_bundle(backend: str, fast_encoder_enabled: bool = True, grid_enabled: bool = False,
+                fuzzy_min_score: float = 0, nthread: int = 0) -> ModelBundle:
+    """
+    Load model (Pipeline, lean hoặc onnx), Metrics và (tuỳ chọn) bảng giá tính sẵn thành bundle mới.
+    fuzzy_min_score > 0: dựng index khớp gần đúng category với ngưỡng điểm này.
+    nthread > 0: số thread predict, đặt trước cả lần predict kiểm tra parity fast encoder với Pipeline
+    (process sẽ fork sau đó không được có thread pool OpenMP nhiều luồng).
+    """
+    start = time.perf_counter()
+    _import_libs(backend)
+    imported = time.perf_counter()
+    if backend == "lean":
+        model = _load_lean()
+    elif backend == "onnx":
+        model = _load_onnx()
+    else:
+        model = _load_pipeline(fast_encoder_enabled, nthread)
+    model["explainer"] = _build_explainer(model)
+    if grid_enabled:
+        model["grid"] = _load_grid(model["version"])
+    if fuzzy_min_score > 0:
+        model["resolver"] = _build_resolver(model, fuzzy_min_score)
+    metrics = _load_metrics()
+    loaded = time.perf_counter()
+    bundle = ModelBundle(
+        backend=backend,
+        loaded_at=time.time(),
+        load_seconds=loaded - start,
+        timings={"import_libs": imported - start, "load_model": loaded - imported},
+        **model,
+        **metrics,
+    )
+    if nthread > 0:
+        bundle.set_nthread(nthread)
+    return bundle
+
+
+def smoke_test(bundle: ModelBundle) -> float:
+    """Dự đoán thử 1 xe; giá không hợp lệ -> RuntimeError (không swap model lỗi vào)"""
+    price = float(bundle.predict_rows([dict(SMOKE_ROW)])[0])
+    if not (price == price and 0 < price < float("inf")):
+        raise RuntimeError(f"❌ Smoke test thất bại: giá dự đoán = {price}")
+    return price
+
+
+def warmup(bundle: ModelBundle) -> float:
+    """
+    Chạy thử cả đường 1 dòng lẫn nhiều dòng (kể cả smoke test) để trả trước chi phí
+    khởi tạo lần đầu (thread pool của XGBoost, buffer, lazy import...) trước khi nhận traffic.
+    """
+    start = time.perf_counter()
+    smoke_test(bundle)
+    rows = [dict(SMOKE_ROW, mileage=SMOKE_ROW['mileage'] + i * 10_000) for i in range(8)]
+    bundle.predict_rows(rows)
+    seconds = time.perf_counter() - start
+    bundle.timings["warmup"] = seconds
+    return seconds
+
+
+def models_dir_signature() -> tuple:
+    """Dấu hiệu thay đổi của thư mục models (tên, mtime, size của từng file)"""
+    signature = []
+    for path in sorted(MODELS_DIR.iterdir()):
+        if path.is_file():
+            stat = path.stat()
+            signature.append((path.name, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+class ModelWatcher(threading.Thread):
+    """
+    Poll thư mục models; khi file thay đổi và đã ghi xong (ổn định qua 2 lần poll) thì gọi on_change.
+    on_change trả về False (vd đang có reload khác) -> thử lại ở lần poll sau.
+    """
+
+    def __init__(self, interval_seconds: float, on_change: Callable[[], bool]):
+        super().__init__(name="model-watcher", daemon=True)
+        self.interval_seconds = interval_seconds
+        self.on_change = on_change
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        current = models_dir_signature()
+        candidate = None
+        while not self._stop_event.wait(self.interval_seconds):
+            try:
+                signature = models_dir_signature()
+            except OSError as e:
+                print(f"⚠️ Không đọc được thư mục models: {e}")
+                continue
+            if signature == current:
+                candidate = None
+            elif signature != candidate:
+                # File có thể đang được ghi dở, chờ lần poll sau
+                candidate = signature
+            elif self.on_change():
+                current, candidate = signature, None
+                print("🔄 Phát hiện model artifact thay đổi, bắt đầu reload...")
+
+    def stop(self) -> None:
+        self._stop_event.set()
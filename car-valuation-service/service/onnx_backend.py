@@ -0,0 +1,193 @@
+"""
+Backend ONNX Runtime: cả preprocessing (impute + scale + one-hot) lẫn cây XGBoost trong 1 file .onnx.
+
+Export từ Pipeline đã fit (python retrain_model.py --export-only, cần: pip install onnx onnxmltools):
+- Cột số: thay giá trị thiếu bằng median rồi (x - mean) / scale tính bằng double, cast float32
+  đúng như sklearn + XGBoost. Làm bằng float32 (như skl2onnx) lệch vài ulp là đủ đổi nhánh split
+  của cây -> giá sai hàng trăm triệu, nên đồ thị này dựng tay từ thống kê của CompiledEncoder.
+- Cột category: OneHotEncoder của ai.onnx.ml (category lạ -> toàn 0, giống handle_unknown='ignore').
+- Cây: chuyển từ booster bằng onnxmltools.
+
+Service chỉ cần onnxruntime + numpy (không pandas / scikit-learn / xgboost / pickle):
+    INFERENCE_BACKEND=onnx
+Giá không bit-identical với XGBoost (TreeEnsemble cộng lá theo thứ tự khác), lệch tối đa
+PARITY_TOLERANCE triệu và được kiểm tra lúc export.
+"""
+import json
+import threading
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from service.fast_encoder import _is_missing
+
+# Tăng khi cấu trúc input / metadata của file .onnx thay đổi
+ONNX_FORMAT_VERSION = 1
+# Sai lệch tối đa cho phép so với Pipeline (triệu VND)
+PARITY_TOLERANCE = 0.05
+FEATURES_NAME = "features"
+# Opset domain mặc định (IsNaN / Where / Cast...) cho đồ thị preprocessing
+DEFAULT_OPSET = 15
+
+
+def export_onnx(predictor, source_model: str = ""):
+    """FastPredictor (encoder + booster) -> onnx.ModelProto nhận từng cột input riêng"""
+    import onnx
+    from onnx import TensorProto, compose, helper
+    from onnxmltools import convert_xgboost
+    from onnxmltools.convert.common.data_types import FloatTensorType
+
+    encoder = predictor.encoder
+    booster = predictor.booster
+    start, end = predictor.iteration_range
+    if end:
+        booster = booster[start:end]
+    trees = convert_xgboost(booster, initial_types=[(FEATURES_NAME, FloatTensorType([None, encoder.n_features]))])
+
+    inputs, nodes, initializers, blocks = [], [], [], []
+    for column, offset, fill_value, mean, scale in encoder._numeric:
+        inputs.append(helper.make_tensor_value_info(column, TensorProto.DOUBLE, [None, 1]))
+        for name, value in (("fill", fill_value), ("mean", mean), ("scale", scale)):
+            initializers.append(helper.make_tensor(f"{column}_{name}", TensorProto.DOUBLE, [], [value]))
+        nodes += [
+            helper.make_node("IsNaN", [column], [f"{column}_missing"]),
+            helper.make_node("Where", [f"{column}_missing", f"{column}_fill", column], [f"{column}_imputed"]),
+            helper.make_node("Sub", [f"{column}_imputed", f"{column}_mean"], [f"{column}_centered"]),
+            helper.make_node("Div", [f"{column}_centered", f"{column}_scale"], [f"{column}_scaled"]),
+            helper.make_node("Cast", [f"{column}_scaled"], [f"{column}_feature"], to=TensorProto.FLOAT),
+        ]
+        blocks.append((offset, f"{column}_feature"))
+    for column, fill_value, index in encoder._categorical:
+        if not index:
+            raise ValueError(f"Cột {column} không có category nào")
+        # Input đã được điền fill_value cho giá trị thiếu (tensor string không có None / NaN)
+        inputs.append(helper.make_tensor_value_info(column, TensorProto.STRING, [None, 1]))
+        initializers.append(helper.make_tensor(f"{column}_shape", TensorProto.INT64, [2], [-1, len(index)]))
+        nodes += [
+            helper.make_node("OneHotEncoder", [column], [f"{column}_onehot"], domain="ai.onnx.ml",
+                             cats_strings=list(index), zeros=1),
+            helper.make_node("Reshape", [f"{column}_onehot", f"{column}_shape"], [f"{column}_feature"]),
+        ]
+        blocks.append((min(index.values()), f"{column}_feature"))
+    nodes.append(helper.make_node("Concat", [name for _, name in sorted(blocks)], [FEATURES_NAME], axis=1))
+
+    graph = helper.make_graph(
+        nodes, "preprocessor", inputs,
+        [helper.make_tensor_value_info(FEATURES_NAME, TensorProto.FLOAT, [None, encoder.n_features])],
+        initializers,
+    )
+    # Đồ thị cây chỉ import domain ai.onnx.ml; merge_models cần cùng version cho domain chung
+    opsets = [helper.make_opsetid("", DEFAULT_OPSET)] + [
+        opset for opset in trees.opset_import if opset.domain != ""
+    ]
+    preprocessor = helper.make_model(graph, opset_imports=opsets, ir_version=trees.ir_version)
+    model = compose.merge_models(preprocessor, trees, io_map=[(FEATURES_NAME, FEATURES_NAME)])
+    helper.set_model_props(model, {
+        "format_version": str(ONNX_FORMAT_VERSION),
+        "source_model": source_model,
+        "numeric": json.dumps([column for column, *_ in encoder._numeric]),
+        "categorical": json.dumps({column: fill_value for column, fill_value, _ in encoder._categorical}),
+        "categories": json.dumps(encoder.categories, ensure_ascii=False),
+    })
+    onnx.checker.check_model(model)
+    return model
+
+
+class OnnxPredictor:
+    """InferenceSession của file .onnx export bằng export_onnx"""
+
+    def __init__(self, model_bytes: bytes, model_path: Path = None, nthread: int = 1):
+        self._model_bytes = model_bytes
+        self.model_path = model_path
+        self.nthread = nthread
+        self._session = None
+        self._lock = threading.Lock()
+        meta = self._create_session().get_modelmeta().custom_metadata_map
+        if meta.get("format_version") != str(ONNX_FORMAT_VERSION):
+            raise ValueError(f"File ONNX format {meta.get('format_version')} không được hỗ trợ")
+        self._numeric: List[str] = json.loads(meta["numeric"])
+        self._categorical: Dict[str, str] = json.loads(meta["categorical"])
+        self.categories: Dict[str, List[str]] = json.loads(meta["categories"])
+        self.source_model = meta.get("source_model", "")
+
+    @classmethod
+    def load(cls, model_path: Path, nthread: int = 1) -> "OnnxPredictor":
+        return cls(Path(model_path).read_bytes(), Path(model_path), nthread)
+
+    def _create_session(self):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = self.nthread
+        options.inter_op_num_threads = 1
+        session = ort.InferenceSession(self._model_bytes, options, providers=["CPUExecutionProvider"])
+        self._output = session.get_outputs()[0].name
+        self._session = session
+        return session
+
+    def set_nthread(self, nthread: int) -> None:
+        """
+        Session mới được tạo ở lần predict kế tiếp: ở chế độ pre-fork master gọi hàm này trước khi
+        fork nên thread pool của ONNX Runtime được tạo trong từng worker (thread không sống qua fork).
+        """
+        if nthread != self.nthread:
+            self.nthread = nthread
+            self._session = None
+
+    def build_inputs(self, rows: Sequence[dict]) -> dict:
+        feed = {}
+        for column in self._numeric:
+            values = [row.get(column) for row in rows]
+            feed[column] = np.array(
+                [np.nan if _is_missing(value) else float(value) for value in values], dtype=np.float64
+            ).reshape(-1, 1)
+        for column, fill_value in self._categorical.items():
+            values = [row.get(column) for row in rows]
+            feed[column] = np.array(
+                [fill_value if _is_missing(value) else str(value) for value in values], dtype=object
+            ).reshape(-1, 1)
+        return feed
+
+    def build_column_inputs(self, columns: Dict[str, np.ndarray]) -> dict:
+        """Dữ liệu dạng cột (như CompiledEncoder.encode_columns) -> input của session"""
+        feed = {
+            column: np.asarray(columns[column], dtype=np.float64).reshape(-1, 1) for column in self._numeric
+        }
+        for column, fill_value in self._categorical.items():
+            values = np.asarray(columns[column], dtype=object)
+            missing = np.fromiter((_is_missing(value) for value in values), dtype=bool, count=len(values))
+            if missing.any():
+                values = np.where(missing, fill_value, values)
+            feed[column] = values.reshape(-1, 1)
+        return feed
+
+    def predict_inputs(self, feed: dict) -> np.ndarray:
+        session = self._session
+        if session is None:
+            with self._lock:
+                session = self._session or self._create_session()
+        return session.run([self._output], feed)[0].ravel()
+
+    def predict_rows(self, rows: Sequence[dict]) -> np.ndarray:
+        return self.predict_inputs(self.build_inputs(rows))
+
+    def parity_report(self, pipeline, frame) -> dict:
+        """So giá với Pipeline gốc trên DataFrame input (vd tập test); không đạt PARITY_TOLERANCE -> ValueError"""
+        expected = np.asarray(pipeline.predict(frame), dtype=np.float64)
+        actual = self.predict_rows(frame.to_dict("records")).astype(np.float64)
+        diff = np.abs(actual - expected)
+        report = {
+            "rows": len(frame),
+            "max_abs_diff": float(diff.max()),
+            "mean_abs_diff": float(diff.mean()),
+            "max_rel_diff": float((diff / np.maximum(np.abs(expected), 1e-9)).max()),
+        }
+        if report["max_abs_diff"] > PARITY_TOLERANCE:
+            raise ValueError(
+                f"Giá ONNX lệch Pipeline tới {report['max_abs_diff']:.4f} triệu "
+                f"(cho phép {PARITY_TOLERANCE}) trên {report['rows']} dòng"
+            )
+        return report
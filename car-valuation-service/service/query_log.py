@@ -0,0 +1,146 @@
+"""
+Log các key truy vấn đã chuẩn hoá của /predict để warm cache khi khởi động.
+
+Mỗi dòng là 1 key (make, model, year, version, color, mileage) dạng JSON. record chỉ thêm vào
+buffer trong bộ nhớ (gọi được từ event loop); thread ghi riêng của từng process append buffer
+xuống file (O_APPEND: nhiều worker ghi chung 1 file không đè nhau) khi đủ FLUSH_LINES dòng hoặc
+sau FLUSH_SECONDS. File vượt max_bytes thì đổi tên thành <file>.1 (bản cũ hơn bị bỏ), nên log chỉ
+giữ khoảng 2 x max_bytes truy vấn gần nhất. Đĩa chậm làm buffer đầy (MAX_BUFFERED_LINES) thì bỏ
+bớt dòng mới thay vì chiếm RAM.
+
+Lúc khởi động, top_keys đếm tần suất trong <file>.1 + <file> và trả về N cấu hình hay gặp nhất
+để predict trước 1 lần (xem warm_cache trong service/main.py).
+"""
+import json
+import os
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# Thread ghi xuống file khi buffer đủ ngần này dòng hoặc sau mỗi FLUSH_SECONDS giây
+FLUSH_LINES = 256
+FLUSH_SECONDS = 5.0
+# Buffer tối đa khi thread ghi không theo kịp (đĩa chậm); vượt thì bỏ dòng mới (chỉ dùng để warm cache)
+MAX_BUFFERED_LINES = 100_000
+
+
+class QueryLog:
+    def __init__(self, path: Path, max_bytes: int = 10 * 1024 * 1024):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.backup_path = self.path.with_name(self.path.name + ".1")
+        self.max_bytes = max(1024, int(max_bytes))
+        self._buffer: List[str] = []
+        self._lock = threading.Lock()
+        # Chỉ 1 lần ghi xuống file tại 1 thời điểm (thread ghi, warm cache, shutdown)
+        self._write_lock = threading.Lock()
+        # Thread ghi của process hiện tại (tạo lại sau fork)
+        self._wakeup = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_pid: Optional[int] = None
+        self._stopping = False
+        self.recorded = 0
+        self.dropped = 0
+        self.rotations = 0
+        self.errors = 0
+
+    def record(self, key: tuple) -> None:
+        """Thêm 1 key vào buffer (không ghi file); thread ghi được đánh thức khi đủ FLUSH_LINES dòng"""
+        line = json.dumps(list(key), ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            if len(self._buffer) >= MAX_BUFFERED_LINES:
+                self.dropped += 1
+                return
+            self._buffer.append(line)
+            self.recorded += 1
+            full = len(self._buffer) >= FLUSH_LINES
+        if self._writer_pid != os.getpid():
+            self._start_writer()
+        if full:
+            self._wakeup.set()
+
+    def _start_writer(self) -> None:
+        with self._lock:
+            if self._writer_pid == os.getpid():
+                return
+            self._wakeup = threading.Event()
+            self._stopping = False
+            self._writer = threading.Thread(target=self._write_loop, name="query-log-writer", daemon=True)
+            self._writer.start()
+            self._writer_pid = os.getpid()
+
+    def _write_loop(self) -> None:
+        while not self._stopping:
+            self._wakeup.wait(FLUSH_SECONDS)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self) -> None:
+        """Dừng thread ghi và ghi nốt buffer (gọi lúc shutdown)"""
+        if self._writer_pid == os.getpid():
+            self._stopping = True
+            self._wakeup.set()
+            self._writer.join(timeout=5)
+            self._writer_pid = None
+        self.flush()
+
+    def flush(self) -> None:
+        """Ghi buffer xuống file ngay trên thread hiện tại (không gọi từ event loop)"""
+        with self._write_lock:
+            self._write_buffer()
+
+    def _write_buffer(self) -> None:
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+        if not lines:
+            return
+        data = "".join(lines).encode("utf-8")
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+            if size >= self.max_bytes:
+                # Worker khác có thể vừa xoay file: mất vài dòng log không ảnh hưởng gì
+                os.replace(self.path, self.backup_path)
+                self.rotations += 1
+        except OSError as e:
+            self.errors += 1
+            print(f"⚠️ Không ghi được query log {self.path}: {e}")
+
+    def top_keys(self, limit: int) -> List[Tuple[tuple, int]]:
+        """(key, số lần) của limit key gặp nhiều nhất trong log, nhiều trước; dòng hỏng bị bỏ qua"""
+        counts = Counter()
+        for path in (self.backup_path, self.path):
+            try:
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    for line in f:
+                        counts[line] += 1
+            except FileNotFoundError:
+                continue
+        result = []
+        for line, count in counts.most_common():
+            if len(result) >= limit:
+                break
+            try:
+                key = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(key, list):
+                result.append((tuple(key), count))
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "enabled": True,
+            "path": str(self.path),
+            "max_bytes": self.max_bytes,
+            "recorded": self.recorded,
+            "buffered": len(self._buffer),
+            "dropped": self.dropped,
+            "rotations": self.rotations,
+            "errors": self.errors,
+        }
@@ -0,0 +1,218 @@
+"""
+Xếp lịch chạy model theo lớp request: interactive (UI định giá từng xe) trước bulk (định giá lại hàng loạt).
+
+Mọi lần chạy model của request (predict, TreeSHAP, RPC dạng cột) đi qua 1 executor chung với số
+worker cố định, mỗi lớp 1 hàng đợi FIFO:
+- Chọn việc kế tiếp theo weighted fair queuing (stride scheduling): mỗi việc của lớp có trọng số w
+  đẩy "thời gian ảo" của lớp thêm 1/w, lớp có thời gian ảo nhỏ nhất được chạy trước. Mặc định
+  interactive=8, bulk=1: khi cả 2 cùng chờ, bulk được ~1/9 lượt nên không bị bỏ đói hoàn toàn.
+  Trọng số 0 = ưu tiên tuyệt đối thấp nhất (chỉ chạy khi các lớp khác không còn việc chờ).
+- Bulk chỉ được chiếm tối đa bulk_max_workers worker (mặc định workers - 1): luôn còn worker rảnh cho
+  request interactive mới tới, không phải chờ 1 chunk bulk lớn chạy xong. Cần workers >= 2: với 1
+  worker không giữ chỗ được (có cảnh báo lúc khởi tạo), interactive chỉ còn được ưu tiên trong hàng
+  đợi và phải chờ việc bulk đang chạy xong.
+- Lớp rảnh lâu không tích luỹ "lượt": khi có việc trở lại, thời gian ảo được kéo lên mốc hiện tại.
+
+Lớp của request lấy từ header X-Request-Class (interactive | bulk) hoặc theo endpoint, đặt vào
+ContextVar bởi RequestClassMiddleware; việc chạy trong copy context của request nên deadline
+(service/admission.py) vẫn được kiểm tra. Gọi được từ event loop (submit) lẫn từ thread của
+endpoint sync (run). Worker tạo lười theo process: an toàn với pre-fork.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Sequence, TypeVar
+
+from service.admission import INFERENCE_PATH_PREFIXES
+from service.metrics import Histogram
+
+T = TypeVar("T")
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+# Thứ tự ưu tiên khi trọng số bằng nhau / bằng 0
+CLASSES = (INTERACTIVE, BULK)
+CLASS_HEADER = b"x-request-class"
+# Endpoint mặc định là interactive; các endpoint inference khác là bulk
+INTERACTIVE_PATHS = ("/predict", "/predict/explain", "/predict/curve")
+
+QUEUE_SECONDS = Histogram(
+    "valuation_scheduler_queue_seconds", "Thời gian chờ trong hàng đợi của executor inference theo lớp request",
+    labelnames=("class",),
+)
+RUN_SECONDS = Histogram(
+    "valuation_scheduler_run_seconds", "Thời gian chạy model trên executor inference theo lớp request",
+    labelnames=("class",),
+)
+
+# Lớp của request hiện tại (None = ngoài request, vd warm cache lúc khởi động: chạy thẳng)
+request_class: ContextVar[Optional[str]] = ContextVar("request_class", default=None)
+
+
+def classify(path: str, headers) -> Optional[str]:
+    """Lớp của request inference (header ưu tiên hơn endpoint); None nếu không phải inference"""
+    if not path.startswith(INFERENCE_PATH_PREFIXES):
+        return None
+    for name, value in headers:
+        if name == CLASS_HEADER:
+            value = value.decode("latin-1").strip().lower()
+            if value in CLASSES:
+                return value
+    return INTERACTIVE if path in INTERACTIVE_PATHS else BULK
+
+
+class _Job:
+    __slots__ = ("fn", "args", "context", "future", "enqueued_at")
+
+    def __init__(self, fn, args, context, future):
+        self.fn = fn
+        self.args = args
+        self.context = context
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class PriorityExecutor:
+    def __init__(self, workers: int = 2, weights: Optional[Dict[str, float]] = None,
+                 bulk_max_workers: Optional[int] = None):
+        self.workers = max(1, int(workers))
+        self.weights = {INTERACTIVE: 8.0, BULK: 1.0}
+        self.weights.update({cls: max(0.0, float(w)) for cls, w in (weights or {}).items() if cls in CLASSES})
+        if bulk_max_workers is None or bulk_max_workers <= 0:
+            bulk_max_workers = self.workers - 1
+        self.bulk_max_workers = max(1, min(self.workers, int(bulk_max_workers)))
+        if self.bulk_max_workers >= self.workers:
+            print(
+                f"⚠️ Executor inference: bulk được dùng cả {self.workers} worker, không còn worker giữ riêng cho "
+                f"interactive (cần INFERENCE_WORKERS >= 2 và SCHEDULER_BULK_MAX_WORKERS < INFERENCE_WORKERS)"
+            )
+        self._queues = {cls: deque() for cls in CLASSES}
+        self._running = {cls: 0 for cls in CLASSES}
+        self._completed = {cls: 0 for cls in CLASSES}
+        self._pass = {cls: 0.0 for cls in CLASSES}
+        self._vtime = 0.0
+        self._cond = threading.Condition()
+        self._threads = []
+        self._pid = None
+        self._stopped = False
+        self._queue_seconds = {cls: QUEUE_SECONDS.labels(cls) for cls in CLASSES}
+        self._run_seconds = {cls: RUN_SECONDS.labels(cls) for cls in CLASSES}
+
+    def _ensure_workers(self) -> None:
+        # Gọi khi đang giữ _cond
+        if self._pid != os.getpid():
+            self._threads = [
+                threading.Thread(target=self._work, name=f"inference-{i}", daemon=True) for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def _enqueue(self, cls: str, fn: Callable, args: Sequence) -> Future:
+        future = Future()
+        job = _Job(fn, args, contextvars.copy_context(), future)
+        with self._cond:
+            self._ensure_workers()
+            queue = self._queues[cls]
+            if not queue and not self._running[cls]:
+                # Lớp vừa có việc trở lại: không được dùng "lượt" tích luỹ lúc rảnh
+                self._pass[cls] = max(self._pass[cls], self._vtime)
+            queue.append(job)
+            self._cond.notify_all()
+        return future
+
+    def run(self, cls: str, fn: Callable[..., T], *args) -> T:
+        """Chạy fn(*args) qua hàng đợi của lớp cls và chờ kết quả (gọi từ thread, không phải event loop)"""
+        return self._enqueue(cls, fn, args).result()
+
+    async def submit(self, cls: str, fn: Callable[..., T], *args) -> T:
+        """Như run nhưng chờ trên event loop; huỷ trong lúc còn xếp hàng thì việc bị bỏ, không chạy"""
+        return await asyncio.wrap_future(self._enqueue(cls, fn, args))
+
+    def _next_job(self) -> Optional[tuple]:
+        ready = [
+            cls for cls in CLASSES
+            if self._queues[cls] and (cls != BULK or self._running[BULK] < self.bulk_max_workers)
+        ]
+        if not ready:
+            return None
+        weighted = [cls for cls in ready if self.weights[cls] > 0]
+        if weighted:
+            cls = min(weighted, key=lambda c: self._pass[c])
+            self._vtime = self._pass[cls]
+            self._pass[cls] += 1.0 / self.weights[cls]
+        else:
+            cls = ready[0]
+        return cls, self._queues[cls].popleft()
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopped and (picked := self._next_job()) is None:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                cls, job = picked
+                self._running[cls] += 1
+            try:
+                # Việc đã bị huỷ (request quá deadline / client bỏ) trong lúc xếp hàng thì bỏ qua
+                if job.future.set_running_or_notify_cancel():
+                    start = time.perf_counter()
+                    self._queue_seconds[cls].observe(start - job.enqueued_at)
+                    try:
+                        result = job.context.run(job.fn, *job.args)
+                    except BaseException as e:
+                        job.future.set_exception(e)
+                    else:
+                        job.future.set_result(result)
+                    self._run_seconds[cls].observe(time.perf_counter() - start)
+            finally:
+                with self._cond:
+                    self._running[cls] -= 1
+                    self._completed[cls] += 1
+                    self._cond.notify_all()
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": True,
+            "workers": self.workers,
+            "bulk_max_workers": self.bulk_max_workers,
+            "weights": dict(self.weights),
+            "classes": {
+                cls: {
+                    "queued": len(self._queues[cls]),
+                    "running": self._running[cls],
+                    "completed": self._completed[cls],
+                    "queue_seconds_mean": self._queue_seconds[cls].snapshot()["mean"],
+                }
+                for cls in CLASSES
+            },
+        }
+
+
+class RequestClassMiddleware:
+    """ASGI middleware thuần: gắn lớp (interactive / bulk) cho request inference vào ContextVar"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        cls = classify(scope["path"], scope["headers"]) if scope["type"] == "http" else None
+        if cls is None:
+            await self.app(scope, receive, send)
+            return
+        token = request_class.set(cls)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_class.reset(token)
@@ -0,0 +1,67 @@
+"""
+Gộp request trùng nhau đang chạy đồng thời (single-flight) cho /predict.
+
+Khi nhiều request cùng key (input đã chuẩn hoá + model version) tới trong lúc lần predict đầu
+tiên chưa xong, chỉ request đầu tiên ("leader") chạy predict; các request sau ("coalesced")
+chờ chung kết quả đó. Khác cache: không giữ gì sau khi predict xong, nên dùng được cả khi tắt
+cache và không phụ thuộc TTL / kích thước cache.
+
+Chạy hoàn toàn trên event loop (không cần lock). Phép tính chạy trong task riêng nên leader
+bị huỷ (client ngắt kết nối) cũng không làm hỏng kết quả của các request đang chờ. Task chạy
+trong context rỗng: không thừa hưởng ContextVar của leader (deadline, lớp request...), mỗi
+request tự áp deadline của mình khi chờ (admission.within_deadline).
+"""
+import asyncio
+import contextvars
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from service.metrics import Counter
+
+T = TypeVar("T")
+
+SINGLEFLIGHT_CALLS = Counter(
+    "valuation_singleflight_calls_total",
+    "Số lần gọi qua single-flight: leader = tự predict, coalesced = dùng chung kết quả đang chạy",
+    ("result",),
+)
+SINGLEFLIGHT_LEADER = SINGLEFLIGHT_CALLS.labels("leader")
+SINGLEFLIGHT_COALESCED = SINGLEFLIGHT_CALLS.labels("coalesced")
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Chạy fn() nếu chưa có lần gọi cùng key đang chạy, ngược lại chờ lần gọi đó"""
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            SINGLEFLIGHT_LEADER.inc()
+            # Context rỗng: deadline / lớp của leader không áp lên các request đi chung
+            task = contextvars.Context().run(asyncio.ensure_future, fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+            SINGLEFLIGHT_COALESCED.inc()
+        # shield: huỷ 1 request đang chờ không huỷ phép tính dùng chung
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        # Mọi request chờ đều đã bị huỷ -> đánh dấu lỗi đã được xử lý để asyncio không log cảnh báo
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        calls = self.leaders + self.coalesced
+        return {
+            "enabled": True,
+            "in_flight": len(self._inflight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesce_rate": round(self.coalesced / calls, 4) if calls else 0.0,
+        }
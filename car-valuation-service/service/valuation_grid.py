@@ -0,0 +1,241 @@
+"""
+Bảng giá tính sẵn (valuation grid) cho các cấu hình xe đã biết.
+
+metadata.json liệt kê mọi tổ hợp make -> model -> year -> version -> color có trong dữ liệu.
+Job offline (build_valuation_grid.py) predict 1 lần cho toàn bộ tổ hợp x các mốc km,
+lưu thành file .npz nhỏ. Lúc phục vụ, xe thuộc tổ hợp đã biết được trả lời bằng tra dict
++ nội suy theo km (vài µs); xe lạ hoặc km ngoài khoảng mốc -> model thật.
+
+- mode "step" (mặc định): mốc km = các ngưỡng split của booster trên cột mileage (quy về
+  số km nguyên). Giữa 2 ngưỡng liên tiếp giá của cây quyết định không đổi nên tra bậc thang
+  cho đúng giá model với mọi số km nguyên.
+- mode "linear": mốc km tuỳ chọn, nội suy tuyến tính; bảng nhỏ hơn nhưng có sai số (xem report).
+
+Bảng gắn với phiên bản model (hash artifact) lúc build: model khác -> bảng bị bỏ qua.
+"""
+import json
+from bisect import bisect_right
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from service.metrics import Counter
+
+GRID_FORMAT_VERSION = 1
+GRID_MODES = ("step", "linear")
+
+# Mốc km: dày ở vùng km thấp (giá thay đổi nhanh), thưa dần về sau
+DEFAULT_MILEAGE_KNOTS = (
+    0, 5_000, 10_000, 15_000, 20_000, 30_000, 40_000, 50_000, 60_000, 70_000, 80_000,
+    90_000, 100_000, 120_000, 140_000, 160_000, 180_000, 200_000, 250_000, 300_000,
+    400_000, 500_000,
+)
+
+# (make, model, year, version, color)
+ConfigKey = Tuple[str, str, int, str, str]
+
+GRID_LOOKUPS = Counter("valuation_grid_lookups_total", "Số lần tra bảng giá tính sẵn", ("result",))
+GRID_HITS = GRID_LOOKUPS.labels("hit")
+GRID_MISSES = GRID_LOOKUPS.labels("miss")
+
+
+def iter_configurations(metadata: dict) -> Iterator[ConfigKey]:
+    """Mọi tổ hợp (make, model, year, version, color) hợp lệ trong metadata.json"""
+    for make, models in metadata.get("version_colors", {}).items():
+        for model, years in models.items():
+            for year, versions in years.items():
+                for version, colors in versions.items():
+                    for color in colors:
+                        yield (make, model, int(year), version, color)
+
+
+def mileage_breakpoints(predictor) -> List[int]:
+    """
+    Số km nguyên nhỏ nhất đi sang nhánh phải của từng split trên cột mileage của booster
+    (XGBoost so sánh float32(feature) < split). Luôn có mốc 0.
+    """
+    column = [item for item in predictor.encoder._numeric if item[0] == 'mileage']
+    if not column:
+        raise ValueError("Encoder không có cột số 'mileage'")
+    _, offset, _, mean, scale = column[0]
+
+    model = json.loads(predictor.booster.save_raw("json"))
+    booster = model["learner"]["gradient_booster"]
+    if "model" not in booster or "trees" not in booster["model"]:
+        raise ValueError("Chỉ hỗ trợ booster dạng cây (gbtree)")
+    splits = set()
+    for tree in booster["model"]["trees"]:
+        for feature, left, condition in zip(tree["split_indices"], tree["left_children"], tree["split_conditions"]):
+            if left != -1 and feature == offset:
+                splits.add(np.float32(condition))
+
+    def goes_right(km: int, split: np.float32) -> bool:
+        # Cùng phép tính với encoder rồi ép float32 như XGBoost
+        return np.float32((float(km) - mean) / scale) >= split
+
+    breakpoints = {0}
+    for split in splits:
+        estimate = float(split) * scale + mean
+        low, high = int(np.floor(estimate)) - 2, int(np.ceil(estimate)) + 2
+        while goes_right(low, split):
+            low -= 1024
+        while not goes_right(high, split):
+            high += 1024
+        # Bất biến: low đi trái, high đi phải
+        while high - low > 1:
+            middle = (low + high) // 2
+            if goes_right(middle, split):
+                high = middle
+            else:
+                low = middle
+        if high > 0:
+            breakpoints.add(high)
+    return sorted(breakpoints)
+
+
+def _grid_rows(configs: Sequence[ConfigKey], mileages: Iterable[float]) -> List[dict]:
+    mileages = list(mileages)
+    return [
+        {'make': make, 'model': model, 'year': year, 'version': version, 'color': color, 'mileage': mileage}
+        for make, model, year, version, color in configs
+        for mileage in mileages
+    ]
+
+
+class ValuationGrid:
+    """Bảng giá (số cấu hình x số mốc km) + index cấu hình -> dòng"""
+
+    def __init__(self, configs: Sequence[ConfigKey], knots: Sequence[float], prices: np.ndarray,
+                 model_versions: Sequence[str], mode: str = "step", report: Optional[dict] = None):
+        if mode not in GRID_MODES:
+            raise ValueError(f"Mode không hợp lệ: {mode} (chọn {', '.join(GRID_MODES)})")
+        self.mode = mode
+        self.configs = [tuple(config) for config in configs]
+        self.knots = np.asarray(knots, dtype=np.float64)
+        self.prices = np.asarray(prices, dtype=np.float32)
+        if self.prices.shape != (len(self.configs), len(self.knots)):
+            raise ValueError(f"Kích thước bảng {self.prices.shape} không khớp "
+                             f"{len(self.configs)} cấu hình x {len(self.knots)} mốc km")
+        if len(self.knots) < 2 or np.any(np.diff(self.knots) <= 0):
+            raise ValueError("Các mốc km phải tăng dần và có ít nhất 2 mốc")
+        if mode == "step" and self.knots[0] != 0:
+            raise ValueError("Mode step cần mốc km đầu tiên là 0")
+        self.model_versions = list(model_versions)
+        self.report = report or {}
+        self._index: Dict[ConfigKey, int] = {config: i for i, config in enumerate(self.configs)}
+        # List Python cho đường tra 1 xe (float Python nhanh hơn truy cập scalar numpy)
+        self._knots = self.knots.tolist()
+        self._rows = self.prices.astype(np.float64).tolist()
+
+    @classmethod
+    def build(cls, predict_fn: Callable[[List[dict]], Sequence[float]], metadata: dict,
+              knots: Sequence[float] = DEFAULT_MILEAGE_KNOTS, model_versions: Sequence[str] = (),
+              mode: str = "linear"):
+        """Predict cả lưới trong 1 lần gọi vector hoá (mode step: knots lấy từ mileage_breakpoints)"""
+        configs = list(dict.fromkeys(iter_configurations(metadata)))
+        if not configs:
+            raise ValueError("metadata.json không có tổ hợp cấu hình nào (thiếu 'version_colors')")
+        knots = sorted(float(k) for k in set(knots))
+        prices = np.asarray(predict_fn(_grid_rows(configs, knots)), dtype=np.float32)
+        return cls(configs, knots, prices.reshape(len(configs), len(knots)), model_versions, mode)
+
+    def supports(self, model_version: str) -> bool:
+        return model_version in self.model_versions
+
+    def lookup(self, row: dict) -> Optional[float]:
+        """Giá theo km nếu cấu hình có trong bảng và km nằm trong vùng bảng trả lời được, ngược lại None"""
+        i = self._index.get((row['make'], row['model'], row['year'], row['version'], row['color']))
+        mileage = row['mileage']
+        knots = self._knots
+        if self.mode == "step":
+            # Mốc là số km nguyên -> chỉ đúng tuyệt đối với km nguyên (API nhận int)
+            covered = type(mileage) is int and mileage >= 0
+        else:
+            covered = mileage is not None and knots[0] <= mileage <= knots[-1]
+        if i is None or not covered:
+            GRID_MISSES.inc()
+            return None
+        GRID_HITS.inc()
+        prices = self._rows[i]
+        j = bisect_right(knots, mileage)
+        if self.mode == "step" or j == len(knots):
+            return prices[j - 1]
+        left, right = knots[j - 1], knots[j]
+        return prices[j - 1] + (prices[j] - prices[j - 1]) * (mileage - left) / (right - left)
+
+    def evaluate(self, predict_fn: Callable[[List[dict]], Sequence[float]], samples_per_config: int = 4,
+                 seed: int = 42) -> dict:
+        """
+        So giá của bảng với model thật + vài km ngẫu nhiên mỗi cấu hình. Mode linear đo tại
+        điểm giữa mọi cặp mốc, mode step đo ngay tại mốc và 1 km trước mốc (chỗ giá nhảy bậc).
+        Trả về sai số tuyệt đối (triệu VND) và tương đối lớn nhất để cân nhắc số mốc km.
+        """
+        rng = np.random.default_rng(seed)
+        if self.mode == "step":
+            points = sorted({int(k) for k in self._knots} | {int(k) - 1 for k in self._knots[1:]})
+            high = self.knots[-1] * 1.2
+        else:
+            points = ((self.knots[:-1] + self.knots[1:]) / 2).tolist()
+            high = self.knots[-1]
+        rows = _grid_rows(self.configs, points)
+        for config in self.configs:
+            random_km = rng.integers(int(self.knots[0]), int(high), samples_per_config, endpoint=True)
+            rows.extend(_grid_rows([config], random_km.tolist()))
+
+        actual = np.asarray(predict_fn(rows), dtype=np.float64)
+        interpolated = np.array([self.lookup(row) for row in rows], dtype=np.float64)
+        abs_error = np.abs(interpolated - actual)
+        rel_error = abs_error / np.maximum(np.abs(actual), 1e-9)
+        worst = int(np.argmax(abs_error))
+        self.report = {
+            "points": len(rows),
+            "max_abs_error": round(float(abs_error.max()), 4),
+            "p99_abs_error": round(float(np.percentile(abs_error, 99)), 4),
+            "mean_abs_error": round(float(abs_error.mean()), 4),
+            "max_rel_error": round(float(rel_error.max()), 6),
+            "worst_case": {**rows[worst], "model_price": float(actual[worst]), "grid_price": float(interpolated[worst])},
+        }
+        return self.report
+
+    def stats(self) -> dict:
+        return {
+            "enabled": True,
+            "mode": self.mode,
+            "configurations": len(self.configs),
+            "mileage_knots": len(self.knots),
+            "mileage_range": [float(self.knots[0]), float(self.knots[-1])],
+            "model_versions": self.model_versions,
+            "max_abs_error": self.report.get("max_abs_error"),
+        }
+
+    def save(self, path: Path) -> None:
+        configs = np.array(self.configs, dtype=object)
+        np.savez_compressed(
+            path,
+            format_version=np.array(GRID_FORMAT_VERSION),
+            makes=configs[:, 0].astype(str),
+            models=configs[:, 1].astype(str),
+            years=configs[:, 2].astype(np.int32),
+            versions=configs[:, 3].astype(str),
+            colors=configs[:, 4].astype(str),
+            knots=self.knots,
+            prices=self.prices,
+            model_versions=np.array(self.model_versions, dtype=str),
+            mode=np.array(self.mode),
+            report=np.array(json.dumps(self.report, ensure_ascii=False)),
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "ValuationGrid":
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["format_version"]) != GRID_FORMAT_VERSION:
+                raise ValueError(f"Không hỗ trợ valuation grid format {int(data['format_version'])}")
+            configs = list(zip(
+                data["makes"].tolist(), data["models"].tolist(), data["years"].tolist(),
+                data["versions"].tolist(), data["colors"].tolist(),
+            ))
+            return cls(
+                configs, data["knots"], data["prices"], data["model_versions"].tolist(),
+                str(data["mode"]), json.loads(str(data["report"])),
+            )
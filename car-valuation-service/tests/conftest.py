@@ -0,0 +1,31 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+# Backend lean: load nhanh nhất, không cần pandas / sklearn; đặt trước khi import service.main
+os.environ.setdefault("INFERENCE_BACKEND", "lean")
+
+
+@pytest.fixture(scope="session")
+def client():
+    """TestClient của app thật, chờ model load xong (/health/ready)"""
+    from fastapi.testclient import TestClient
+
+    from service import main
+
+    with TestClient(main.app) as client:
+        deadline = time.monotonic() + 60
+        while client.get("/health/ready").status_code != 200:
+            assert time.monotonic() < deadline, "Model chưa ready sau 60s"
+            time.sleep(0.1)
+        yield client
+
+
+@pytest.fixture
+def car():
+    return {"brand": "Toyota", "model": "Vios", "year": 2019, "mileage_km": 50000}
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from service.admission import AdmissionController, AdmissionMiddleware, request_deadline
+from service.scheduler import INTERACTIVE
+
+
+def _scope(path, headers=()):
+    return {"type": "http", "path": path, "headers": list(headers)}
+
+
+def test_over_limit_is_rejected_with_503_and_non_inference_paths_pass():
+    async def scenario():
+        gate, deadlines = asyncio.Event(), []
+
+        async def app(scope, receive, send):
+            deadlines.append(request_deadline.get())
+            await gate.wait()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+
+        controller = AdmissionController(max_in_flight=1, retry_after=3)
+        middleware = AdmissionMiddleware(app, controller)
+
+        async def call(path, headers=()):
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+            await middleware(_scope(path, headers), None, send)
+            return sent
+
+        first = asyncio.ensure_future(call("/predict", [(b"x-request-timeout-ms", b"500")]))
+        await asyncio.sleep(0)
+        assert controller.in_flight == 1
+
+        rejected = await call("/rpc/predict")
+        assert rejected[0]["status"] == 503
+        assert (b"retry-after", b"3") in rejected[0]["headers"]
+        # /health không bị tính / chặn
+        health = asyncio.ensure_future(call("/health"))
+        await asyncio.sleep(0)
+        assert controller.in_flight == 1
+
+        gate.set()
+        assert (await first)[0]["status"] == 200
+        assert (await health)[0]["status"] == 200
+        assert controller.in_flight == 0
+        assert (await call("/predict"))[0]["status"] == 200
+        assert controller.stats()["admitted"] == 2
+        # Deadline chỉ gắn cho request inference, lấy từ header của client
+        assert deadlines[0] == pytest.approx(time.monotonic() + 0.5, abs=0.5)
+        assert deadlines[1] is None and deadlines[2] is None
+
+    asyncio.run(scenario())
+
+
+def test_deadline_takes_the_earlier_of_server_default_and_client_header():
+    controller = AdmissionController(default_deadline_ms=10_000)
+    now = time.monotonic()
+    assert controller.deadline_for([]) == pytest.approx(now + 10, abs=0.5)
+    assert controller.deadline_for([(b"x-request-timeout-ms", b"200")]) == pytest.approx(now + 0.2, abs=0.1)
+    assert controller.deadline_for([(b"x-request-timeout-ms", b"60000")]) == pytest.approx(now + 10, abs=0.5)
+    assert controller.deadline_for([(b"x-request-timeout-ms", b"abc")]) == pytest.approx(now + 10, abs=0.5)
+    assert AdmissionController().deadline_for([(b"x-request-timeout-ms", b"abc")]) is None
+
+
+def test_expired_deadline_returns_504(client, car):
+    # Xe chưa có trong cache / bảng giá tính sẵn để request phải tới bước predict
+    body = {**car, "mileage_km": 123_457}
+    response = client.post("/predict", json=body, headers={"X-Request-Timeout-Ms": "0"})
+    assert response.status_code == 504
+    stream = client.post("/predict/stream", content=b'{"brand":"Toyota","model":"Vios","year":2019,"mileage_km":1}\n',
+                         headers={"X-Request-Timeout-Ms": "0"})
+    assert stream.status_code == 504
+    assert client.post("/predict", json=body).status_code == 200
+
+
+def test_expired_deadline_only_fails_its_own_caller(client, car):
+    from service import main
+
+    executor = main.inference_executor
+    if executor is None:
+        pytest.skip("Cần bật scheduler")
+    # Chiếm hết worker inference: cả 2 request phải chờ phép tính (dùng chung nếu bật single-flight)
+    gate, started = threading.Event(), threading.Semaphore(0)
+
+    def block():
+        started.release()
+        gate.wait(10)
+
+    for _ in range(executor.workers):
+        executor._enqueue(INTERACTIVE, block, ())
+    for _ in range(executor.workers):
+        assert started.acquire(timeout=5)
+
+    body = {**car, "mileage_km": 87_654}
+    exceeded = main.admission.stats()["deadline_exceeded"]
+    try:
+        with ThreadPoolExecutor(2) as pool:
+            patient = pool.submit(client.post, "/predict", json=body, headers={"X-Request-Timeout-Ms": "10000"})
+            time.sleep(0.05)
+            hasty = pool.submit(client.post, "/predict", json=body, headers={"X-Request-Timeout-Ms": "50"})
+            assert hasty.result(5).status_code == 504
+            gate.set()
+            assert patient.result(10).status_code == 200
+    finally:
+        gate.set()
+    assert main.admission.stats()["deadline_exceeded"] == exceeded + 1
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+
+import numpy as np
+
+from service.batcher import MicroBatcher
+
+
+class Recorder:
+    """predict_fn giả: giá = 10 x id, ghi lại kích thước từng batch"""
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def __call__(self, rows):
+        self.batches.append(len(rows))
+        if self.fail:
+            raise RuntimeError("model lỗi")
+        return np.array([row["id"] * 10.0 for row in rows], dtype=np.float32)
+
+
+def _run(batcher, scenario):
+    try:
+        return asyncio.run(scenario())
+    finally:
+        batcher.shutdown()
+
+
+def test_each_caller_gets_its_own_result():
+    predict = Recorder()
+    batcher = MicroBatcher(predict, max_wait_ms=50, max_batch_size=4)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.submit({"id": i}) for i in range(10)))
+
+    assert _run(batcher, scenario) == [i * 10.0 for i in range(10)]
+    # Đủ 4 xe thì gửi ngay, phần lẻ gửi khi hết cửa sổ chờ
+    assert predict.batches == [4, 4, 2]
+    assert batcher.stats()["batches"] == 3
+    assert batcher.stats()["waiting"] == 0
+
+
+def test_window_flushes_partial_batch():
+    predict = Recorder()
+    batcher = MicroBatcher(predict, max_wait_ms=1, max_batch_size=64)
+
+    async def scenario():
+        first = await batcher.submit({"id": 1})
+        second = await asyncio.gather(batcher.submit({"id": 2}), batcher.submit({"id": 3}))
+        return first, second
+
+    assert _run(batcher, scenario) == (10.0, [20.0, 30.0])
+    assert predict.batches == [1, 2]
+
+
+def test_error_reaches_every_caller_in_the_batch():
+    predict = Recorder(fail=True)
+    batcher = MicroBatcher(predict, max_wait_ms=1, max_batch_size=8)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.submit({"id": i}) for i in range(3)), return_exceptions=True)
+
+    results = _run(batcher, scenario)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert batcher.stats()["errors"] == 1
+
+
+def test_cancelled_caller_does_not_affect_others():
+    gate = threading.Event()
+    predict = Recorder()
+    batcher = MicroBatcher(lambda rows: gate.wait(5) and predict(rows), max_wait_ms=1, max_batch_size=8)
+
+    async def scenario():
+        tasks = [asyncio.ensure_future(batcher.submit({"id": i})) for i in range(3)]
+        await asyncio.sleep(0.05)
+        tasks[1].cancel()
+        gate.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    first, cancelled, last = _run(batcher, scenario)
+    assert (first, last) == (0.0, 20.0)
+    assert isinstance(cancelled, asyncio.CancelledError)
+
+
+def test_batched_prices_match_direct_predict(client):
+    from service import main
+
+    model = main.active_model
+    rows = [dict(main._car_to_row(main.CarInput(brand="Toyota", model="Vios", year=2010 + i, mileage_km=i * 15_000)))
+            for i in range(12)]
+    batcher = MicroBatcher(model.predict_rows, max_wait_ms=20, max_batch_size=5)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.submit(row) for row in rows))
+
+    batched = _run(batcher, scenario)
+    assert batched == [float(price) for price in model.predict_rows(rows)]
+    assert batcher.stats()["batches"] == 3
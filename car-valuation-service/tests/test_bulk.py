@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from service.bulk import BulkParser, BulkWriter
+
+DEEP_JSON = b"[" * 20000
+
+
+def test_ndjson_parses_object():
+    record = BulkParser("ndjson").parse(b'{"brand": "Toyota", "id": 7}\r', first=True)
+    assert record == {"brand": "Toyota", "id": 7}
+
+
+def test_ndjson_blank_line_is_skipped():
+    assert BulkParser("ndjson").parse(b"   ") is None
+
+
+@pytest.mark.parametrize("line", [b"{not json", b"[1, 2]", b"\xff\xfe", DEEP_JSON])
+def test_ndjson_bad_line_raises_value_error(line):
+    with pytest.raises(ValueError):
+        BulkParser("ndjson").parse(line)
+
+
+def test_csv_header_then_rows():
+    parser = BulkParser("csv")
+    assert parser.parse(b"\xef\xbb\xbfbrand,model,year,mileage_km,color", first=True) is None
+    # Ô trống bị bỏ (trường tuỳ chọn -> None)
+    assert parser.parse(b"Toyota,Vios,2019,50000,") == {
+        "brand": "Toyota", "model": "Vios", "year": "2019", "mileage_km": "50000",
+    }
+
+
+def test_csv_bad_rows_raise_value_error():
+    parser = BulkParser("csv")
+    with pytest.raises(ValueError):
+        parser.parse(b"foo,bar", first=True)
+    parser.parse(b"brand,model", first=True)
+    with pytest.raises(ValueError):
+        parser.parse(b"Toyota,Vios,2019")
+
+
+def test_writer_counts_errors():
+    writer = BulkWriter("ndjson")
+    out = writer.encode([(1, "a", {"price_estimate": 1.0}, None), (2, None, None, "lỗi")])
+    lines = [json.loads(line) for line in out.decode("utf-8").splitlines()]
+    assert lines == [{"line": 1, "id": "a", "price_estimate": 1.0}, {"line": 2, "error": "lỗi"}]
+    assert (writer.rows, writer.errors) == (2, 1)
+
+
+def test_stream_reports_bad_rows_inline(client, car):
+    body = b"\n".join([
+        json.dumps({**car, "id": "ok-1"}).encode(),
+        DEEP_JSON,
+        b"{broken",
+        json.dumps({**car, "year": 1800}).encode(),
+        json.dumps({**car, "id": "ok-2", "mileage_km": 10000}).encode(),
+    ]) + b"\n"
+    response = client.post("/predict/stream", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [item["line"] for item in results] == [1, 2, 3, 4, 5]
+    assert "error" not in results[0] and results[0]["price_estimate"] > 0
+    assert "sâu" in results[1]["error"]
+    assert "error" in results[2] and "error" in results[3]
+    assert results[4]["id"] == "ok-2" and results[4]["price_estimate"] > 0
+    assert response.headers["X-Bulk-Rows"] == "5"
+    assert response.headers["X-Bulk-Errors"] == "3"
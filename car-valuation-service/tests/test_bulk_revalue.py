@@ -0,0 +1,37 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+
+
+def _revalue(tmp_path, csv: str):
+    source, target = tmp_path / "in.csv", tmp_path / "out.csv"
+    source.write_text(csv, encoding="utf-8")
+    result = subprocess.run(
+        [sys.executable, str(BASE_DIR / "bulk_revalue.py"), str(source), str(target),
+         "--workers", "1", "--backend", "lean"],
+        capture_output=True, text=True, timeout=120,
+    )
+    return result, target
+
+
+def test_rows_the_api_would_reject_get_no_price(tmp_path):
+    result, target = _revalue(
+        tmp_path,
+        "brand,model,year,mileage_km\nToyota,Vios,2019,50000\n   ,Vios,2019,50000\nToyota,,2019,1000\nToyota,Vios,,1\n"
+        "Toyota,Vios,3000,-5\nToyota,Vios,1989,1000\nToyota,Vios,2019,-1\n",
+    )
+    assert result.returncode == 0, result.stderr
+    prices = pd.read_csv(target)["price_estimate"]
+    assert prices[0] > 0
+    assert prices[1:].isna().all()
+
+
+def test_missing_required_column_stops_before_writing_output(tmp_path):
+    result, target = _revalue(tmp_path, "brand,year,mileage_km\nToyota,2019,1\n")
+    assert result.returncode == 1
+    assert "thiếu cột model" in result.stderr
+    assert not target.exists()
@@ -0,0 +1,58 @@
+import time
+
+from service.cache import PredictionCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = PredictionCache(2)
+    cache.bind_model("v1")
+    cache.put("a", 1.0, "v1")
+    cache.put("b", 2.0, "v1")
+    assert cache.get("a") == 1.0  # "a" mới dùng -> "b" bị đẩy ra
+    cache.put("c", 3.0, "v1")
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1.0, None, 3.0)
+    assert cache.evictions == 1
+
+
+def test_ttl_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = PredictionCache(10, ttl_seconds=5)
+    cache.bind_model("v1")
+    cache.put("a", 1.0, "v1")
+    now[0] += 4
+    assert cache.get("a") == 1.0
+    now[0] += 2
+    assert cache.get("a") is None
+    assert cache.expirations == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = PredictionCache(0)
+    cache.bind_model("v1")
+    cache.put("a", 1.0, "v1")
+    assert cache.get("a") is None and not cache.enabled
+
+
+def test_new_model_version_invalidates():
+    cache = PredictionCache(10)
+    cache.bind_model("v1")
+    cache.put("a", 1.0, "v1")
+    cache.bind_model("v1")  # cùng version: giữ nguyên
+    assert cache.get("a", "v1") == 1.0
+
+    cache.bind_model("v2")
+    assert cache.get("a") is None
+    assert cache.invalidations == 1
+    # Giá của model cũ hoàn thành sau khi swap bị bỏ
+    cache.put("a", 1.0, "v1")
+    assert cache.get("a") is None
+
+
+def test_get_with_other_version_misses():
+    cache = PredictionCache(10)
+    cache.bind_model("v2")
+    cache.put("a", 2.0, "v2")
+    # Request vẫn đang chạy trên model v1 (trước lúc swap) không được đọc giá của v2
+    assert cache.get("a", "v1") is None
+    assert cache.get("a", "v2") == 2.0
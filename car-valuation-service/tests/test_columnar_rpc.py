@@ -0,0 +1,73 @@
+import struct
+
+import numpy as np
+import pytest
+
+from service import columnar_rpc
+
+CARS = [
+    {"brand": "Toyota", "model": "Vios", "year": 2019, "mileage_km": 50000, "version": "1.5G CVT"},
+    {"brand": "Toyota", "model": "Vios", "year": 2015, "mileage_km": 120000, "color": "Trắng"},
+    {"brand": "Kia", "model": "Morning", "year": 2021, "mileage_km": 0, "version": None},
+]
+
+
+def test_request_round_trip():
+    batch = columnar_rpc.decode_request(columnar_rpc.encode_request(CARS))
+    assert batch.n_rows == 3
+    for field in columnar_rpc.TEXT_FIELDS:
+        values, codes = batch.text[field]
+        assert [values[code] for code in codes] == [car.get(field) or "" for car in CARS]
+        # Mã hoá từ điển: mỗi giá trị khác nhau chỉ xuất hiện 1 lần
+        assert len(values) == len(set(values))
+    assert batch.year.tolist() == [2019, 2015, 2021]
+    assert batch.mileage_km.tolist() == [50000, 120000, 0]
+
+
+def test_empty_request_round_trip():
+    batch = columnar_rpc.decode_request(columnar_rpc.encode_request([]))
+    assert batch.n_rows == 0
+    assert batch.year.size == 0
+
+
+@pytest.mark.parametrize("body, message", [
+    (b"XXXX" + columnar_rpc.encode_request(CARS)[4:], "CAR1"),
+    (columnar_rpc.encode_request(CARS)[:-1], "cắt cụt"),
+    (columnar_rpc.encode_request(CARS) + b"\0", "Thừa 1 byte"),
+    # 1 dòng, cột brand có từ điển 1 giá trị nhưng chỉ số 5
+    (b"CAR1" + struct.pack("<II", 1, 1) + struct.pack("<H", 1) + b"A" + struct.pack("<I", 5), "vượt quá từ điển"),
+])
+def test_malformed_request_raises_value_error(body, message):
+    with pytest.raises(ValueError, match=message):
+        columnar_rpc.decode_request(body)
+
+
+def test_response_round_trip():
+    prices = np.array([371.0, np.nan, 250.5])
+    body = columnar_rpc.encode_response(prices, {1: "brand: không được để trống"}, 35.0, "abc123")
+    decoded, errors, mae, version = columnar_rpc.decode_response(body)
+    assert decoded.dtype == np.float32
+    assert decoded[0] == 371.0 and np.isnan(decoded[1]) and decoded[2] == 250.5
+    assert errors == {1: "brand: không được để trống"}
+    assert mae == 35.0
+    assert version == "abc123"
+
+
+def _rpc(client, body, content_type=columnar_rpc.REQUEST_MEDIA_TYPE):
+    return client.post("/rpc/predict", content=body, headers={"Content-Type": content_type})
+
+
+def test_rpc_prices_match_json_batch(client):
+    response = _rpc(client, columnar_rpc.encode_request(CARS))
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith(columnar_rpc.RESPONSE_MEDIA_TYPE)
+    prices, errors, _, version = columnar_rpc.decode_response(response.content)
+    assert errors == {}
+    expected = client.post("/predict/batch", json=CARS).json()
+    assert prices.tolist() == pytest.approx([p["price_estimate"] for p in expected], abs=0.5)
+    assert version == client.get("/health").json()["model_version"]
+
+
+def test_rpc_rejects_bad_body_and_content_type(client):
+    assert _rpc(client, b"CAR1").status_code == 400
+    assert _rpc(client, columnar_rpc.encode_request(CARS), "application/json").status_code == 415
@@ -0,0 +1,29 @@
+def test_curve_shape(client, car):
+    response = client.post("/predict/curve", params={"points": 7, "max_mileage_km": 300_000}, json=car)
+    assert response.status_code == 200
+    curve = response.json()
+    assert curve["mileage_km"] == [0, 50_000, 100_000, 150_000, 200_000, 250_000, 300_000]
+
+    years = [entry["year"] for entry in curve["curves"]]
+    metadata_years = client.get("/metadata/years/Toyota/Vios").json()
+    assert years == sorted(set(metadata_years) | {car["year"]})
+    assert all(len(entry["prices"]) == len(curve["mileage_km"]) for entry in curve["curves"])
+
+    # Xe gửi lên: base giống /predict và nằm đúng trên đường của năm đó
+    prediction = client.post("/predict", json=car).json()
+    assert curve["base"]["price_estimate"] == prediction["price_estimate"]
+    own = next(entry for entry in curve["curves"] if entry["year"] == car["year"])
+    assert own["prices"][curve["mileage_km"].index(car["mileage_km"])] == prediction["price_estimate"]
+    # Cùng km: xe đời mới hơn không rẻ hơn đời cũ nhất trong dữ liệu
+    assert curve["curves"][-1]["prices"][0] >= curve["curves"][0]["prices"][0]
+
+
+def test_curve_includes_year_missing_from_metadata(client, car):
+    curve = client.post("/predict/curve", params={"points": 2}, json={**car, "year": 1995}).json()
+    assert curve["curves"][0]["year"] == 1995
+    assert curve["mileage_km"][0] == 0
+
+
+def test_curve_validates_query(client, car):
+    assert client.post("/predict/curve", params={"points": 1}, json=car).status_code == 422
+    assert client.post("/predict/curve", params={"max_mileage_km": 10}, json=car).status_code == 422
@@ -0,0 +1,88 @@
+import os
+import threading
+
+from service.disk_cache import DiskCache
+
+KEYS = [("Toyota", "Vios", 2019, "1.5G", "Trắng", km) for km in (10000, 20000, 30000)]
+
+
+def make_cache(tmp_path, **kwargs):
+    cache = DiskCache(tmp_path / "cache.sqlite3", **kwargs)
+    cache.bind_model("v1")
+    return cache
+
+
+def test_put_then_get_in_order(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put_many(KEYS[:2], [100.0, 200.0], "v1")
+    cache.flush()
+    assert cache.get_many([KEYS[1], KEYS[2], KEYS[0]], "v1") == [200.0, None, 100.0]
+    cache.close()
+
+
+def test_connect_opens_reader_before_first_lookup(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.connect()
+    assert cache._reader is not None and cache._reader_pid == os.getpid()
+    reader = cache._reader
+    cache.get_many(KEYS, "v1")
+    assert cache._reader is reader
+    cache.close()
+    assert cache._reader is None
+
+
+def test_other_model_version_never_read_and_dropped_on_bind(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put_many(KEYS, [1.0, 2.0, 3.0], "v1")
+    cache.flush()
+    assert cache.get_many(KEYS, "v2") == [None, None, None]
+
+    # Giá của model đã bị swap ra không được ghi
+    cache.bind_model("v2")
+    cache.put_many(KEYS, [9.0, 9.0, 9.0], "v1")
+    cache.flush()
+    assert cache.get_many(KEYS, "v1") == [None, None, None]
+    cache.close()
+
+    # Restart cùng version giữ nguyên cache, version khác thì xoá
+    reopened = DiskCache(tmp_path / "cache.sqlite3")
+    reopened.bind_model("v2")
+    reopened.put_many(KEYS[:1], [5.0], "v2")
+    reopened.flush()
+    reopened.bind_model("v3")
+    assert reopened.get_many(KEYS[:1], "v2") == [None]
+    reopened.close()
+
+
+def test_evicts_oldest_over_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr("service.disk_cache.EVICT_CHECK_EVERY", 1)
+    cache = make_cache(tmp_path, max_entries=2)
+    for key, price in zip(KEYS, (1.0, 2.0, 3.0)):
+        cache.put_many([key], [price], "v1")
+        cache.flush()
+    assert cache.get_many(KEYS, "v1") == [None, 2.0, 3.0]
+    cache.close()
+
+
+def test_concurrent_readers_share_connection(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put_many(KEYS, [1.0, 2.0, 3.0], "v1")
+    cache.flush()
+    cache.connect()
+    results, errors = [], []
+
+    def read():
+        try:
+            for _ in range(200):
+                results.append(cache.get_many(KEYS, "v1"))
+        except Exception as e:  # pragma: no cover - chỉ để báo lỗi từ thread
+            errors.append(e)
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert all(result == [1.0, 2.0, 3.0] for result in results)
+    cache.close()
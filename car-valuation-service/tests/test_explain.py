@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def model(client):
+    from service import main
+
+    if main.active_model.explainer is None:
+        pytest.skip("Backend hiện tại không có TreeSHAP")
+    return main.active_model
+
+
+def test_contributions_sum_to_model_price(model):
+    rows = [
+        {"make": "Toyota", "model": "Vios", "year": 2019, "version": "1.5G CVT", "color": "Trắng", "mileage": 50_000},
+        {"make": "Kia", "model": "Morning", "year": 2015, "version": "Unknown", "color": "Unknown", "mileage": 120_000},
+        {"make": "Hãng lạ", "model": "Dòng lạ", "year": 2030, "version": "Unknown", "color": "Unknown", "mileage": 0},
+    ]
+    contributions, base_values = model.explainer.explain_rows(rows)
+    assert contributions.shape == (len(rows), len(model.explainer.columns))
+    prices = np.asarray(model.predict_rows(rows), dtype=np.float64)
+    assert base_values + contributions.sum(axis=1) == pytest.approx(prices, abs=1e-2)
+
+
+def test_explain_endpoint_adds_up_to_predict(client, car):
+    explanation = client.post("/predict/explain", json=car).json()
+    prediction = client.post("/predict", json=car).json()
+    assert explanation["price_estimate"] == prediction["price_estimate"]
+    contributions = explanation["contributions"]
+    assert {item["feature"] for item in contributions} == {"brand", "model", "year", "version", "color", "mileage_km"}
+    # Giá trong response được làm tròn tới triệu
+    total = explanation["base_value"] + sum(item["contribution"] for item in contributions)
+    assert total == pytest.approx(prediction["price_estimate"], abs=1.0)
+    magnitudes = [abs(item["contribution"]) for item in contributions]
+    assert magnitudes == sorted(magnitudes, reverse=True)
+
+
+def test_explain_top_k_and_batch(client, car):
+    full = client.post("/predict/explain", json=car).json()
+    top = client.post("/predict/explain", params={"top_k": 2}, json=car).json()
+    assert top["contributions"] == full["contributions"][:2]
+    batch = client.post("/predict/explain/batch", json=[car, {**car, "year": 2015}]).json()
+    assert batch[0] == full
+    assert batch[1]["price_estimate"] != full["price_estimate"]
@@ -0,0 +1,60 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from service.fast_encoder import CompiledEncoder, FastPredictor, sample_rows
+from service.model_loader import ENCODER_SPEC_PATH, MODEL_PATH
+
+
+@pytest.fixture(scope="module")
+def pipeline():
+    joblib = pytest.importorskip("joblib")
+    pytest.importorskip("sklearn")
+    with warnings.catch_warnings():
+        # Pickle booster của bản XGBoost cũ hơn: chỉ là cảnh báo định dạng
+        warnings.simplefilter("ignore", UserWarning)
+        return joblib.load(MODEL_PATH)
+
+
+@pytest.fixture(scope="module")
+def rows(pipeline):
+    rows = sample_rows(CompiledEncoder.from_pipeline(pipeline))
+    # Thiếu cột số (None / NaN) -> median của SimpleImputer
+    rows.append({**rows[1], "year": None, "mileage": float("nan")})
+    return rows
+
+
+def _frame(rows):
+    import pandas as pd
+
+    return pd.DataFrame(list(rows))
+
+
+def test_encoder_matches_column_transformer(pipeline, rows):
+    encoder = CompiledEncoder.from_pipeline(pipeline)
+    expected = pipeline.named_steps["preprocessor"].transform(_frame(rows))
+    expected = expected.toarray() if hasattr(expected, "toarray") else np.asarray(expected)
+    assert np.array_equal(encoder.encode_rows(rows), expected)
+    for i, row in enumerate(rows):
+        assert np.array_equal(encoder.encode_one(row)[0], expected[i])
+    columns = {column: np.array([row.get(column) for row in rows], dtype=object) for column in _frame(rows).columns}
+    for column in ("year", "mileage"):
+        columns[column] = np.array([np.nan if v is None else v for v in columns[column]], dtype=np.float64)
+    assert np.array_equal(encoder.encode_columns(columns), expected)
+
+
+def test_spec_round_trip_keeps_encoding(pipeline, rows):
+    encoder = CompiledEncoder.from_pipeline(pipeline)
+    restored = CompiledEncoder.from_spec(encoder.to_spec())
+    assert np.array_equal(restored.encode_rows(rows), encoder.encode_rows(rows))
+
+
+def test_fast_predictor_matches_pipeline_predict(pipeline, rows):
+    expected = pipeline.predict(_frame(rows))
+    predictor = FastPredictor.from_pipeline(pipeline)
+    assert np.array_equal(predictor.predict_rows(rows), expected)
+    assert [predictor.predict_one(row) for row in rows] == [float(price) for price in expected]
+    # Artifact lean (booster native + encoder spec) export từ cùng model
+    lean = FastPredictor.load(ENCODER_SPEC_PATH)
+    assert np.array_equal(lean.predict_rows(rows), expected)
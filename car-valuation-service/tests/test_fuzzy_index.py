@@ -0,0 +1,66 @@
+import pytest
+
+from service.fuzzy_index import CategoryResolver, codes
+
+CATEGORIES = {
+    "make": ["Toyota", "Kia"],
+    "model": ["Vios", "Camry", "Morning"],
+    "version": ["1.5 AT", "2.4 AT", "1.5MT", "1.5G CVT", "2.4G 4x2AT"],
+    "color": ["Trắng", "Đen"],
+}
+
+
+@pytest.fixture(scope="module")
+def resolver():
+    return CategoryResolver(CATEGORIES, min_score=0.75)
+
+
+def test_codes_are_numbers_and_short_letter_tokens():
+    assert codes("1.5G CVT") == ("1.5", "g")
+    assert codes("2,4 at") == ("2.4", "at")
+    assert codes("AT 2.4") == codes("2.4 AT")
+    assert codes("Camry") == ()
+
+
+@pytest.mark.parametrize("column, value, expected", [
+    ("make", "Toyta", "Toyota"),
+    ("model", "Vioss", "Vios"),
+    ("color", "trang", "Trắng"),
+    ("version", "1.5 g cvt", "1.5G CVT"),
+    ("version", "1.5G CVTT", "1.5G CVT"),
+    ("version", "2.4G 4x2 AT", "2.4G 4x2AT"),
+])
+def test_typos_are_resolved(resolver, column, value, expected):
+    resolved, matches = resolver.resolve({column: value})
+    assert resolved[column] == expected
+    assert matches[column].value == expected
+    assert resolver.resolve_value(column, value) == expected
+
+
+@pytest.mark.parametrize("value", [
+    "2.5 AT",   # trước đây -> "1.5 AT" (score 0.75)
+    "1.4 AT",   # trước đây -> "2.4 AT" (score 0.75)
+    "1.5G MT",  # trước đây -> "1.5MT" (score 0.889): mất bản G
+    "1.5 MT AT",
+    "2.4G 4x4AT",
+])
+def test_different_engine_or_trim_is_not_swapped(resolver, value):
+    resolved, matches = resolver.resolve({"version": value})
+    assert resolved["version"] == value
+    assert matches["version"].value is None
+    assert resolver.resolve_value("version", value) == value
+
+
+def test_score_must_exceed_threshold():
+    # "Camri" -> "Camry" có score đúng 0.8
+    assert CategoryResolver(CATEGORIES, min_score=0.79).resolve({"model": "Camri"})[0]["model"] == "Camry"
+    resolver = CategoryResolver(CATEGORIES, min_score=0.8)
+    assert resolver.resolve({"model": "Camri"})[0]["model"] == "Camri"
+    assert resolver.resolve_value("model", "Camri") == "Camri"
+
+
+def test_exact_values_and_skipped_values_are_untouched(resolver):
+    row = {"make": "Kia", "model": "Morning", "version": "Unknown", "color": "Đen"}
+    resolved, matches = resolver.resolve(row, skip=("Unknown",))
+    assert resolved is row
+    assert matches == {}
@@ -0,0 +1,50 @@
+from service.metadata_index import MetadataIndex, etag_matches
+
+
+def test_etag_returns_304_and_is_stable(client):
+    first = client.get("/metadata/makes")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert "Toyota" in first.json()
+
+    cached = client.get("/metadata/makes", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+    assert client.get("/metadata/makes", headers={"If-None-Match": f'"other", W/{etag}'}).status_code == 304
+    assert client.get("/metadata/makes", headers={"If-None-Match": '"other"'}).status_code == 200
+    # Mỗi response có ETag riêng
+    models = client.get("/metadata/models/Toyota")
+    assert models.headers["etag"] != etag
+    assert client.get("/metadata/models/Toyota", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_metadata_responses_follow_the_tree(client):
+    years = client.get("/metadata/years/Toyota/Vios").json()
+    assert years == sorted(years, reverse=True)
+    tree = client.get("/metadata/tree/Toyota/Vios").json()
+    assert [entry["year"] for entry in tree["years"]] == years
+    assert client.get("/metadata/years/Toyota/Không-có").status_code == 404
+
+
+def test_etag_matches():
+    assert etag_matches('"a"', '"a"')
+    assert etag_matches('W/"a"', '"a"')
+    assert etag_matches('"b", "a"', '"a"')
+    assert etag_matches("*", '"a"')
+    assert not etag_matches(None, '"a"')
+    assert not etag_matches('"b"', '"a"')
+
+
+def test_etag_depends_only_on_content():
+    metadata = {
+        "makes": ["Kia"], "make_models": {"Kia": ["Morning"]}, "model_years": {"Kia": {"Morning": [2020]}},
+        "year_versions": {"Kia": {"Morning": {"2020": ["1.25 AT"]}}},
+        "version_colors": {"Kia": {"Morning": {"2020": {"1.25 AT": ["Đỏ", "Trắng"]}}}},
+    }
+    first, second = MetadataIndex.from_metadata(metadata), MetadataIndex.from_metadata(metadata)
+    assert first.get("makes").etag == second.get("makes").etag
+    assert first.get("colors", "Kia", "Morning", 2020, None).body == '["Trắng","Đỏ"]'.encode("utf-8")
+    metadata["version_colors"]["Kia"]["Morning"]["2020"]["1.25 AT"].append("Xám")
+    assert MetadataIndex.from_metadata(metadata).get("makes").etag == first.get("makes").etag
+    assert MetadataIndex.from_metadata(metadata).get("tree").etag != first.get("tree").etag
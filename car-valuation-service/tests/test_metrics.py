@@ -0,0 +1,35 @@
+import json
+import os
+import subprocess
+import sys
+
+from service import metrics
+
+
+def _family(kind, value, labels=()):
+    return {"kind": kind, "help": "test", "samples": [["test_metric", [list(kv) for kv in labels], value]]}
+
+
+def _write_snapshot(directory, pid, families):
+    (directory / f"{pid}-1.json").write_text(json.dumps(families), encoding="utf-8")
+
+
+def test_multiprocess_merge_sums_counters_and_labels_gauges_by_pid(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "_MULTIPROC_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "_process_file", None)
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    alive = os.getppid()
+    for pid in (alive, dead.pid):
+        _write_snapshot(tmp_path, pid, {
+            "test_requests_total": _family("counter", 3, [("endpoint", "/predict")]),
+            "test_startup_seconds": _family("gauge", 2.5),
+        })
+
+    families = metrics._merged_families()
+    assert families["test_requests_total"]["samples"] == [["test_metric", (("endpoint", "/predict"),), 6]]
+    # Gauge không bị nhân theo số process; process đã chết bị bỏ
+    assert families["test_startup_seconds"]["samples"] == [["test_metric", (("pid", str(alive)),), 2.5]]
+    text = metrics.render_prometheus()
+    assert f'test_metric{{pid="{alive}"}} 2.5' in text
+    assert f'pid="{dead.pid}"' not in text
@@ -0,0 +1,67 @@
+import threading
+import time
+
+from service import query_log as query_log_module
+from service.query_log import QueryLog
+
+KEY = ("Toyota", "Vios", 2019, "1.5G", "Trắng", 50000)
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_record_never_writes_on_caller_thread(tmp_path, monkeypatch):
+    log = QueryLog(tmp_path / "query.log")
+    writers = []
+    original = QueryLog._write_buffer
+
+    def tracked(self):
+        writers.append(threading.current_thread().name)
+        original(self)
+
+    monkeypatch.setattr(QueryLog, "_write_buffer", tracked)
+    for i in range(query_log_module.FLUSH_LINES):
+        log.record(KEY[:-1] + (i,))
+    wait_for(lambda: log.path.exists() and len(log.path.read_text().splitlines()) == query_log_module.FLUSH_LINES)
+    assert writers and set(writers) == {"query-log-writer"}
+    log.close()
+
+
+def test_close_flushes_remaining_lines(tmp_path):
+    log = QueryLog(tmp_path / "query.log")
+    log.record(KEY)
+    log.record(KEY)
+    assert not log.path.exists()
+    log.close()
+    assert log.path.read_text(encoding="utf-8").count("\n") == 2
+    assert log.stats()["buffered"] == 0
+
+
+def test_buffer_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(query_log_module, "MAX_BUFFERED_LINES", 3)
+    monkeypatch.setattr(query_log_module, "FLUSH_LINES", 100)
+    log = QueryLog(tmp_path / "query.log")
+    for _ in range(5):
+        log.record(KEY)
+    assert (log.recorded, log.dropped) == (3, 2)
+    log.close()
+
+
+def test_top_keys_counts_both_files_and_skips_bad_lines(tmp_path):
+    log = QueryLog(tmp_path / "query.log", max_bytes=1024)
+    other = KEY[:-1] + (1,)
+    for key in [KEY] * 30 + [other] * 5:
+        log.record(key)
+    log.flush()  # > 1024 byte -> xoay sang query.log.1
+    assert log.backup_path.exists() and log.rotations == 1
+    log.record(other)
+    log.flush()
+    with open(log.path, "a", encoding="utf-8") as f:
+        f.write("{broken\n")
+    assert log.top_keys(10) == [(KEY, 30), (other, 6)]
+    assert log.top_keys(1) == [(KEY, 30)]
+    log.close()
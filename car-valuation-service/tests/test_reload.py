@@ -0,0 +1,81 @@
+import dataclasses
+import time
+
+import pytest
+
+from service import main
+
+TOKEN = "reload-test-token"
+
+
+@pytest.fixture
+def admin(client, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", TOKEN)
+    old = main.active_model
+    yield old
+    main._activate_model(old)
+
+
+def _reload(client, token=TOKEN):
+    return client.post("/admin/reload", headers={"X-Admin-Token": token} if token else {})
+
+
+def _wait_for_reload(client):
+    # in_progress được bật trước khi /admin/reload trả 202 nên chỉ cần chờ nó tắt
+    deadline = time.monotonic() + 30
+    while True:
+        status = client.get("/health").json()["reload"]
+        if not status["in_progress"]:
+            return status
+        assert time.monotonic() < deadline, "Reload chưa xong sau 30s"
+        time.sleep(0.05)
+
+
+def test_reload_requires_token(client, admin):
+    assert _reload(client, None).status_code == 403
+    assert _reload(client, "sai").status_code == 403
+    assert main.active_model is admin
+
+
+def test_reload_swaps_model_and_cache(client, admin, car, monkeypatch):
+    load_bundle = main.load_bundle
+    monkeypatch.setattr(main, "load_bundle", lambda *args, **kwargs: dataclasses.replace(
+        load_bundle(*args, **kwargs), version=f"{admin.version}-reloaded"))
+    before = client.get("/health").json()["reload"]
+    assert client.post("/predict", json=car).status_code == 200
+
+    response = _reload(client)
+    assert response.status_code == 202
+    assert response.json()["current_version"] == admin.version
+    status = _wait_for_reload(client)
+    assert status["reloads"] == before["reloads"] + 1
+    assert status["last_error"] is None
+
+    assert client.get("/health").json()["model_version"] == f"{admin.version}-reloaded"
+    assert main.prediction_cache.model_version == f"{admin.version}-reloaded"
+    # Model mới phục vụ ngay, cùng artifact nên cùng giá
+    response = client.post("/predict", json=car)
+    assert response.status_code == 200
+    assert response.json()["price_estimate"] == pytest.approx(
+        float(admin.predict_rows([main._car_to_row(main.CarInput(**car))])[0]), abs=0.5)
+
+
+def test_failed_reload_keeps_old_model(client, admin, car, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError("artifact hỏng")
+
+    monkeypatch.setattr(main, "load_bundle", broken)
+    before = client.get("/health").json()["reload"]
+    assert _reload(client).status_code == 202
+    status = _wait_for_reload(client)
+    assert status["last_error"] == "artifact hỏng"
+    assert main.active_model is admin
+    assert client.post("/predict", json=car).status_code == 200
+
+
+def test_concurrent_reload_is_rejected(client, admin):
+    assert main._reload_lock.acquire(blocking=False)
+    try:
+        assert _reload(client).status_code == 409
+    finally:
+        main._reload_lock.release()
@@ -0,0 +1,87 @@
+import threading
+
+from service.scheduler import BULK, INTERACTIVE, PriorityExecutor, classify
+
+
+def _blocker(executor, cls, count=1):
+    """Chiếm count worker bằng việc của lớp cls, chờ tới khi gate được mở"""
+    gate, started = threading.Event(), threading.Semaphore(0)
+
+    def block():
+        started.release()
+        gate.wait(5)
+
+    futures = [executor._enqueue(cls, block, ()) for _ in range(count)]
+    for _ in range(count):
+        assert started.acquire(timeout=5)
+    return gate, futures
+
+
+def test_classify_by_path_and_header():
+    assert classify("/predict", []) == INTERACTIVE
+    assert classify("/predict/stream", []) == BULK
+    assert classify("/rpc/predict", []) == BULK
+    assert classify("/predict", [(b"x-request-class", b" Bulk ")]) == BULK
+    assert classify("/predict/batch", [(b"x-request-class", b"unknown")]) == BULK
+    assert classify("/health", [(b"x-request-class", b"bulk")]) is None
+
+
+def test_interactive_is_picked_before_queued_bulk():
+    executor = PriorityExecutor(1, {INTERACTIVE: 1, BULK: 0})
+    gate, _ = _blocker(executor, INTERACTIVE)
+    order = []
+    futures = [executor._enqueue(BULK, order.append, ("bulk",)) for _ in range(3)]
+    futures += [executor._enqueue(INTERACTIVE, order.append, ("interactive",)) for _ in range(2)]
+    gate.set()
+    for future in futures:
+        future.result(5)
+    assert order == ["interactive", "interactive", "bulk", "bulk", "bulk"]
+    executor.shutdown()
+
+
+def test_weighted_fair_queuing_does_not_starve_bulk():
+    executor = PriorityExecutor(1, {INTERACTIVE: 2, BULK: 1})
+    gate, _ = _blocker(executor, INTERACTIVE)
+    order = []
+    futures = [executor._enqueue(INTERACTIVE, order.append, ("i",)) for _ in range(6)]
+    futures += [executor._enqueue(BULK, order.append, ("b",)) for _ in range(3)]
+    gate.set()
+    for future in futures:
+        future.result(5)
+    # Bulk được ~1/3 lượt khi cả 2 lớp cùng chờ, không phải chờ interactive hết hàng đợi
+    assert order.index("b") < 3
+    assert order.count("b") == 3
+    executor.shutdown()
+
+
+def test_bulk_cap_keeps_a_worker_for_interactive():
+    executor = PriorityExecutor(2, bulk_max_workers=0)
+    assert executor.bulk_max_workers == 1
+    gate, _ = _blocker(executor, BULK)
+    queued_bulk = executor._enqueue(BULK, lambda: "bulk", ())
+    # Worker thứ 2 còn rảnh nhưng bulk đã dùng hết phần của mình
+    assert executor.run(INTERACTIVE, lambda: "interactive") == "interactive"
+    assert not queued_bulk.done()
+    gate.set()
+    assert queued_bulk.result(5) == "bulk"
+    executor.shutdown()
+
+
+def test_single_worker_warns_that_nothing_is_reserved(capsys):
+    executor = PriorityExecutor(1)
+    assert executor.bulk_max_workers == 1
+    assert "không còn worker giữ riêng" in capsys.readouterr().out
+    PriorityExecutor(2)
+    assert capsys.readouterr().out == ""
+
+
+def test_cancelled_job_is_skipped():
+    executor = PriorityExecutor(1)
+    gate, _ = _blocker(executor, INTERACTIVE)
+    ran = []
+    future = executor._enqueue(INTERACTIVE, ran.append, (1,))
+    assert future.cancel()
+    gate.set()
+    assert executor.run(INTERACTIVE, lambda: "next") == "next"
+    assert ran == []
+    executor.shutdown()
@@ -0,0 +1,132 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from service.scheduler import INTERACTIVE
+from service.singleflight import SingleFlight
+
+caller = contextvars.ContextVar("caller", default=None)
+
+
+def _counting(gate: asyncio.Event, calls: list, result):
+    async def fn():
+        calls.append(result)
+        await gate.wait()
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return fn
+
+
+def test_concurrent_calls_with_same_key_run_once():
+    async def scenario():
+        flight, gate, calls = SingleFlight(), asyncio.Event(), []
+        waiters = [asyncio.ensure_future(flight.do("a", _counting(gate, calls, 42))) for _ in range(5)]
+        other = asyncio.ensure_future(flight.do("b", _counting(gate, calls, 7)))
+        await asyncio.sleep(0)
+        gate.set()
+        assert await asyncio.gather(*waiters) == [42] * 5
+        assert await other == 7
+        assert calls == [42, 7]
+        assert flight.stats()["leaders"] == 2
+        assert flight.stats()["coalesced"] == 4
+        assert flight.stats()["in_flight"] == 0
+        # Xong rồi thì không giữ kết quả: lần gọi sau chạy lại
+        assert await flight.do("a", _counting(gate, calls, 43)) == 43
+
+    asyncio.run(scenario())
+
+
+def test_error_is_shared_and_not_cached():
+    async def scenario():
+        flight, gate, calls = SingleFlight(), asyncio.Event(), []
+        waiters = [asyncio.ensure_future(flight.do("a", _counting(gate, calls, ValueError("boom"))))
+                   for _ in range(3)]
+        await asyncio.sleep(0)
+        gate.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        assert len(calls) == 1
+        assert await flight.do("a", _counting(gate, calls, 1)) == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_the_leader_does_not_cancel_the_shared_call():
+    async def scenario():
+        flight, gate, calls = SingleFlight(), asyncio.Event(), []
+        leader = asyncio.ensure_future(flight.do("a", _counting(gate, calls, 42)))
+        follower = asyncio.ensure_future(flight.do("a", _counting(gate, calls, 0)))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        gate.set()
+        assert await follower == 42
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert calls == [42]
+
+    asyncio.run(scenario())
+
+
+def test_shared_call_does_not_inherit_the_leader_context():
+    async def scenario():
+        flight, gate, seen = SingleFlight(), asyncio.Event(), []
+
+        async def fn():
+            await gate.wait()
+            seen.append(caller.get())
+            return 1
+
+        async def call(name):
+            caller.set(name)
+            return await flight.do("a", fn)
+
+        waiters = [asyncio.ensure_future(call(name)) for name in ("leader", "follower")]
+        await asyncio.sleep(0)
+        gate.set()
+        assert await asyncio.gather(*waiters) == [1, 1]
+        assert seen == [None]
+
+    asyncio.run(scenario())
+
+
+def test_short_deadline_of_first_caller_does_not_fail_coalesced_callers(client, car):
+    from service import main
+
+    executor, flight = main.inference_executor, main.single_flight
+    if executor is None or flight is None:
+        pytest.skip("Cần bật scheduler + single-flight")
+    # Chiếm hết worker inference để phép tính dùng chung phải xếp hàng
+    gate, started = threading.Event(), threading.Semaphore(0)
+
+    def block():
+        started.release()
+        gate.wait(10)
+
+    for _ in range(executor.workers):
+        executor._enqueue(INTERACTIVE, block, ())
+    for _ in range(executor.workers):
+        assert started.acquire(timeout=5)
+
+    body = {**car, "mileage_km": 98_765}
+    try:
+        first = client.post("/predict", json=body, headers={"X-Request-Timeout-Ms": "50"})
+        assert first.status_code == 504
+        coalesced = flight.stats()["coalesced"]
+        with ThreadPoolExecutor(1) as pool:
+            second = pool.submit(client.post, "/predict", json=body)
+            deadline = time.monotonic() + 5
+            while flight.stats()["coalesced"] == coalesced:
+                assert time.monotonic() < deadline, "Request thứ 2 không đi chung phép tính đang chạy"
+                time.sleep(0.01)
+            gate.set()
+            response = second.result(10)
+        assert response.status_code == 200
+        assert response.json()["price_estimate"] > 0
+    finally:
+        gate.set()
@@ -0,0 +1,20 @@
+import pytest
+
+from service import columnar_rpc
+
+
+@pytest.mark.parametrize("field, value", [("brand", "   "), ("brand", ""), ("model", " \t")])
+def test_predict_rejects_blank_brand_model(client, car, field, value):
+    response = client.post("/predict", json={**car, field: value})
+    assert response.status_code == 422
+    assert "không được để trống" in response.text
+
+
+def test_rpc_applies_the_same_blank_rule(client, car):
+    body = columnar_rpc.encode_request([car, {**car, "brand": "   "}, {**car, "model": ""}])
+    response = client.post("/rpc/predict", content=body,
+                           headers={"Content-Type": columnar_rpc.REQUEST_MEDIA_TYPE})
+    assert response.status_code == 200
+    prices, errors, _, _ = columnar_rpc.decode_response(response.content)
+    assert prices[0] > 0
+    assert errors == {1: "brand: không được để trống", 2: "model: không được để trống"}
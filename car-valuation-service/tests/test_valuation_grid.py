@@ -0,0 +1,69 @@
+import json
+from itertools import islice
+
+import numpy as np
+import pytest
+
+from service.model_loader import BASE_DIR, VALUATION_GRID_PATH, load_bundle
+from service.valuation_grid import ValuationGrid, iter_configurations, mileage_breakpoints
+
+
+@pytest.fixture(scope="module")
+def bundle():
+    return load_bundle("lean")
+
+
+@pytest.fixture(scope="module")
+def configs():
+    with open(BASE_DIR / "metadata.json", "r", encoding="utf-8") as f:
+        return list(islice(iter_configurations(json.load(f)), 0, 200, 20))
+
+
+def _metadata(configs):
+    tree = {}
+    for make, model, year, version, color in configs:
+        tree.setdefault(make, {}).setdefault(model, {}).setdefault(str(year), {}).setdefault(version, []).append(color)
+    return {"version_colors": tree}
+
+
+def _rows(configs, mileages):
+    return [
+        {"make": make, "model": model, "year": year, "version": version, "color": color, "mileage": km}
+        for make, model, year, version, color in configs
+        for km in mileages
+    ]
+
+
+def _assert_parity(grid, bundle, rows):
+    expected = np.asarray(bundle.predict_rows(rows), dtype=np.float32)
+    looked_up = np.array([grid.lookup(row) for row in rows], dtype=np.float32)
+    assert np.array_equal(looked_up, expected)
+
+
+def test_step_grid_matches_predict_at_every_breakpoint(bundle, configs):
+    knots = mileage_breakpoints(bundle.fast_predictor)
+    grid = ValuationGrid.build(bundle.predict_rows, _metadata(configs), knots, [bundle.version], "step")
+    # Ngay tại mốc và 1 km trước mốc là chỗ giá nhảy bậc; thêm km ngẫu nhiên + vượt mốc cuối
+    mileages = sorted({int(k) for k in knots} | {int(k) - 1 for k in knots[1:]})
+    rng = np.random.default_rng(0)
+    mileages += rng.integers(0, int(knots[-1] * 1.5), 50).tolist()
+    _assert_parity(grid, bundle, _rows(configs, mileages))
+    assert grid.evaluate(bundle.predict_rows)["max_abs_error"] == 0
+
+
+def test_shipped_grid_matches_predict(bundle, configs):
+    grid = ValuationGrid.load(VALUATION_GRID_PATH)
+    if grid.mode != "step" or not grid.supports(bundle.version):
+        pytest.skip("Bảng giá đi kèm không phải mode step cho model hiện tại")
+    known = [config for config in configs if config in grid._index]
+    assert known
+    _assert_parity(grid, bundle, _rows(known, [0, 1, 9_999, 50_000, 123_457, 2_000_000]))
+
+
+def test_lookup_misses_fall_back_to_model(bundle, configs):
+    grid = ValuationGrid.build(bundle.predict_rows, _metadata(configs[:2]), [0, 10_000], [bundle.version], "step")
+    row = _rows(configs[:1], [5_000])[0]
+    assert grid.lookup(row) is not None
+    assert grid.lookup({**row, "color": "Màu không có"}) is None
+    assert grid.lookup({**row, "mileage": 5_000.5}) is None
+    assert grid.lookup({**row, "mileage": -1}) is None
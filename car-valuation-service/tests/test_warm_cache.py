@@ -0,0 +1,43 @@
+import dataclasses
+
+import pytest
+
+from service import main
+from service.query_log import QueryLog
+
+
+@pytest.fixture
+def warm_setup(client, tmp_path, monkeypatch):
+    """Query log có 2 cấu hình + bundle "model mới" (cùng artifact, version khác)"""
+    log = QueryLog(tmp_path / "query.log")
+    keys = [("Toyota", "Vios", 2019, "Unknown", "Unknown", km) for km in (11111, 22222)]
+    for key in keys + keys[:1]:
+        log.record(key)
+    log.flush()
+    monkeypatch.setattr(main, "query_log", log)
+    old = main.active_model
+    new = dataclasses.replace(old, version=f"{old.version}-warm-test")
+    yield old, new, keys
+    main._activate_model(old)
+    log.close()
+
+
+def test_warm_cache_does_not_touch_live_cache(warm_setup):
+    old, new, keys = warm_setup
+    warmed = main.warm_cache(new)
+    assert warmed is not None
+    warmed_keys, prices = warmed
+    assert warmed_keys == keys and len(prices) == 2
+    # Cache vẫn gắn với model đang phục vụ, không có giá nào của model mới
+    assert main.prediction_cache.model_version == old.version
+    assert all(main.prediction_cache.get(key, new.version) is None for key in keys)
+
+
+def test_activate_publishes_warmed_prices(warm_setup):
+    old, new, keys = warm_setup
+    warmed = main.warm_cache(new)
+    main._activate_model(new, warmed)
+    assert main.active_model is new
+    assert [main.prediction_cache.get(key, new.version) for key in keys] == warmed[1]
+    # Request còn giữ model cũ không đọc được giá của model mới
+    assert all(main.prediction_cache.get(key, old.version) is None for key in keys)